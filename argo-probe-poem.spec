@@ -1,5 +1,6 @@
 # sitelib
 %define dir /usr/libexec/argo/probes/poem
+%define cachedir /var/cache/argo-probe-poem
 
 Name:          argo-probe-poem
 Summary:       Multi-tenant aware probes checking ARGO POEM.
@@ -20,6 +21,7 @@ Currently it contains three probes:
  - poem-cert-probe
  - poem-metricapi-probe
  - poem-probecandidate-probe
+and poem-combined-probe, which runs them in a single process.
 
 %prep
 %setup -q
@@ -29,6 +31,7 @@ Currently it contains three probes:
 
 %install
 %{py3_install "--record=INSTALLED_FILES" }
+install -d -m 755 %{buildroot}%{cachedir}
 
 %clean
 rm -rf $RPM_BUILD_ROOT
@@ -37,6 +40,7 @@ rm -rf $RPM_BUILD_ROOT
 %defattr(-,root,root,-)
 %{python3_sitelib}/argo_probe_poem
 %{dir}
+%dir %attr(0755,nagios,nagios) %{cachedir}
 
 
 %changelog
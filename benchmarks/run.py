@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests")
+)
+
+BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "baseline.json"
+)
+
+MANDATORY_METRICS = ["argo.AMSPublisher-Check", "org.nagios.ProcessCrond"]
+
+METRICS = ("wall", "cpu", "max_rss", "tracemalloc_peak")
+
+SLACK = {"wall": 0.1, "cpu": 0.1, "max_rss": 5, "tracemalloc_peak": 5}
+
+
+def scenario(name, probe, tenants, metrics=0, candidates=0, **options):
+    return name, {
+        "probe": probe,
+        "tenants": tenants,
+        "metrics": metrics,
+        "candidates": candidates,
+        "options": options
+    }
+
+
+SCENARIOS = OrderedDict([
+    scenario("cert-10", "cert", 10),
+    scenario("cert-100", "cert", 100),
+    scenario("cert-1000", "cert", 1000),
+    scenario("cert-1000-workers", "cert", 1000, workers=20),
+    scenario("metricapi-10", "metricapi", 10, metrics=1000),
+    scenario("metricapi-100", "metricapi", 100, metrics=1000),
+    scenario("metricapi-1000", "metricapi", 1000, metrics=1000),
+    scenario("metricapi-10-100k", "metricapi", 10, metrics=100000),
+    scenario(
+        "metricapi-10-100k-stream", "metricapi", 10, metrics=100000,
+        stream=True
+    ),
+    scenario(
+        "metricapi-10-100k-asyncio", "metricapi", 10, metrics=100000,
+        engine="asyncio"
+    ),
+    scenario("probecandidates-10", "probecandidates", 10, candidates=100),
+    scenario("probecandidates-100", "probecandidates", 100, candidates=100),
+    scenario(
+        "probecandidates-1000", "probecandidates", 1000, candidates=100
+    ),
+    scenario(
+        "probecandidates-1-100k", "probecandidates", 1, candidates=100000
+    ),
+    scenario(
+        "probecandidates-1-100k-filter", "probecandidates", 1,
+        candidates=100000, filter_candidates=True
+    )
+])
+
+
+def fixture_tenants(spec):
+    from poem_server import synthetic_metrics, synthetic_probe
+
+    statuses = ["deployed"] * 7 + ["submitted", "testing", "processing"]
+    tenants = list()
+    for i in range(spec["tenants"]):
+        tenants.append({
+            "name": f"TENANT{i}",
+            "token": f"t0k3n{i}",
+            "metrics": synthetic_metrics(spec["metrics"]) + MANDATORY_METRICS,
+            "probes": [
+                synthetic_probe(
+                    f"probe-{j}", statuses[j % len(statuses)], days_ago=j % 30
+                ) for j in range(spec["candidates"])
+            ],
+            "padding": 64
+        })
+
+    return tenants
+
+
+def serve_fixture(spec, conn):
+    from poem_server import FixtureTenant, POEMServer
+
+    server = POEMServer([
+        FixtureTenant(**tenant) for tenant in fixture_tenants(spec)
+    ])
+    server.start()
+    try:
+        conn.send({
+            "hostname": server.hostname,
+            "bundle": server.ca.bundle,
+            "capath": server.ca.capath,
+            "cert": server.client_cert,
+            "key": server.client_key
+        })
+        conn.recv()
+
+    finally:
+        server.stop()
+
+
+def build_probe(spec, fixture):
+    from argo_probe_poem import utils
+
+    options = dict(spec["options"])
+    timeout = 60
+    deadline = utils.Deadline(3600)
+
+    if spec["probe"] == "cert":
+        from argo_probe_poem.poem_cert import Certificate
+
+        probe = Certificate(
+            hostname=fixture["hostname"], cert=fixture["cert"],
+            key=fixture["key"], capath=fixture["capath"],
+            skipped_tenants=None, timeout=timeout, deadline=deadline,
+            **options
+        )
+        return probe.verify
+
+    if spec["probe"] == "metricapi":
+        from argo_probe_poem.poem_metricapi import Metrics
+
+        probe = Metrics(
+            hostname=fixture["hostname"], mandatory_metrics=MANDATORY_METRICS,
+            skipped_tenants=None, timeout=timeout, deadline=deadline,
+            **options
+        )
+        return probe.check_mandatory
+
+    from argo_probe_poem.poem_probecandidates import AnalyseProbeCandidates
+
+    probe = AnalyseProbeCandidates(
+        hostname=fixture["hostname"],
+        tokens=[
+            [f"TENANT{i}:t0k3n{i}"] for i in range(spec["tenants"])
+        ],
+        timeout=timeout, warning_processing=1, warning_testing=3,
+        deadline=deadline, **options
+    )
+    return probe.get_status
+
+
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+
+    except OSError:
+        pass
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(spec, fixture, trace, conn):
+    os.environ["REQUESTS_CA_BUNDLE"] = fixture["bundle"]
+    os.environ["NO_PROXY"] = "127.0.0.0/8"
+
+    run = build_probe(spec, fixture)
+
+    if trace:
+        tracemalloc.start()
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        result = run()
+        if isinstance(result, dict):
+            outcome = f"status {result['status']}"
+
+        else:
+            outcome = "ok"
+
+    except Exception as e:
+        outcome = type(e).__name__
+
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+
+    measurement = {
+        "outcome": outcome,
+        "wall": wall,
+        "cpu": cpu,
+        "max_rss": peak_rss()
+    }
+    if trace:
+        measurement["tracemalloc_peak"] = \
+            tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+
+    conn.send(measurement)
+
+
+def measure_in_process(context, spec, fixture, trace=False):
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(
+        target=measure, args=(spec, fixture, trace, sender)
+    )
+    process.start()
+    try:
+        return receiver.recv()
+
+    finally:
+        process.join()
+
+
+def run_scenario(context, spec, repeat, trace):
+    parent, child = context.Pipe()
+    server = context.Process(
+        target=serve_fixture, args=(spec, child)
+    )
+    server.start()
+    try:
+        fixture = parent.recv()
+
+        measurements = list()
+        for _ in range(repeat):
+            measurements.append(measure_in_process(context, spec, fixture))
+
+        if trace:
+            traced = measure_in_process(context, spec, fixture, trace=True)
+
+        parent.send("stop")
+        server.join()
+
+    finally:
+        if server.is_alive():
+            server.terminate()
+
+    best = dict(measurements[0])
+    for measurement in measurements[1:]:
+        for metric in METRICS:
+            if metric in measurement:
+                best[metric] = min(best[metric], measurement[metric])
+
+    if trace:
+        best["tracemalloc_peak"] = traced["tracemalloc_peak"]
+
+    return best
+
+
+def compare(results, baseline, tolerance):
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        if result["outcome"] != baseline[name]["outcome"]:
+            regressions.append(
+                f"{name}: outcome {result['outcome']} != "
+                f"{baseline[name]['outcome']}"
+            )
+
+        for metric in METRICS:
+            if metric not in result or metric not in baseline[name]:
+                continue
+
+            limit = max(
+                baseline[name][metric] * (1 + tolerance),
+                baseline[name][metric] + SLACK[metric]
+            )
+            if result[metric] > limit:
+                regressions.append(
+                    f"{name}: {metric} {result[metric]:.3f} exceeds "
+                    f"{baseline[name][metric]:.3f} by more than "
+                    f"{tolerance:.0%}"
+                )
+
+    return regressions
+
+
+def format_row(name, result):
+    trace = result.get("tracemalloc_peak")
+    return (
+        f"{name:32} {result['wall']:9.3f} {result['cpu']:9.3f} "
+        f"{result['max_rss']:9.1f} "
+        f"{'-' if trace is None else f'{trace:.1f}':>9}  {result['outcome']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        "Benchmark POEM probes against synthetic tenants served locally"
+    )
+    parser.add_argument(
+        "-s", "--scenario", dest="scenarios", type=str, action="append",
+        help="glob pattern of scenarios to run (default: all)"
+    )
+    parser.add_argument(
+        "--max-tenants", dest="max_tenants", type=int,
+        help="skip scenarios with more tenants"
+    )
+    parser.add_argument(
+        "--repeat", dest="repeat", type=int, default=1,
+        help="number of runs of each scenario, the best one is reported "
+             "(default: 1)"
+    )
+    parser.add_argument(
+        "--tracemalloc", dest="tracemalloc", action="store_true",
+        help="also trace peak Python memory allocations in an additional, "
+             "untimed run of each scenario"
+    )
+    parser.add_argument(
+        "--baseline", dest="baseline", type=str, default=BASELINE,
+        help=f"baseline results (default: {BASELINE})"
+    )
+    parser.add_argument(
+        "--tolerance", dest="tolerance", type=float, default=0.3,
+        help="allowed relative increase over the baseline (default: 0.3)"
+    )
+    parser.add_argument(
+        "--save-baseline", dest="save_baseline", action="store_true",
+        help="store the results as the new baseline instead of comparing"
+    )
+    parser.add_argument(
+        "--output", dest="output", type=str,
+        help="JSON file the results are written to"
+    )
+    parser.add_argument(
+        "-l", "--list", dest="list", action="store_true",
+        help="list the scenarios and exit"
+    )
+    args = parser.parse_args()
+
+    scenarios = OrderedDict(
+        (name, spec) for name, spec in SCENARIOS.items()
+        if (not args.scenarios or any(
+            fnmatch.fnmatch(name, pattern) for pattern in args.scenarios
+        )) and (not args.max_tenants or spec["tenants"] <= args.max_tenants)
+    )
+
+    if args.list:
+        for name, spec in scenarios.items():
+            print(name)
+
+        sys.exit(0)
+
+    context = multiprocessing.get_context("spawn")
+
+    print(
+        f"{'scenario':32} {'wall [s]':>9} {'cpu [s]':>9} {'rss [MB]':>9} "
+        f"{'heap [MB]':>9}  outcome"
+    )
+    results = OrderedDict()
+    for name, spec in scenarios.items():
+        results[name] = run_scenario(
+            context, spec, args.repeat, args.tracemalloc
+        )
+        print(format_row(name, results[name]), flush=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        baseline = OrderedDict()
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f, object_pairs_hook=OrderedDict)
+
+        baseline["python"] = platform.python_version()
+        baseline.setdefault("scenarios", OrderedDict()).update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+            f.write("\n")
+
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline["scenarios"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
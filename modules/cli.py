@@ -0,0 +1,366 @@
+import argparse
+from collections import OrderedDict
+
+HOSTCERT = "/etc/grid-security/hostcert.pem"
+HOSTKEY = "/etc/grid-security/hostkey.pem"
+CAPATH = "/etc/grid-security/certificates/"
+
+CACHE_DIR = "/var/cache/argo-probe-poem"
+
+SERVICES = OrderedDict([
+    ("cert", "poem-cert-probe"),
+    ("metricapi", "poem-metricapi-probe"),
+    ("probecandidates", "poem-probecandidate-probe")
+])
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile", dest="profile", type=str, metavar="FILE",
+        help="write time spent in DNS lookup, TCP connect, TLS handshake, "
+             "time to first byte, download, JSON decoding and message "
+             "formatting for each tenant to FILE"
+    )
+    parser.add_argument(
+        "--profile-pstats", dest="profile_pstats", type=str, metavar="FILE",
+        help="write cProfile statistics of the run to FILE, readable with "
+             "pstats"
+    )
+    parser.add_argument(
+        "--profile-tracemalloc", dest="profile_tracemalloc", type=int,
+        default=0, metavar="N",
+        help="trace memory allocations and append the top N allocating "
+             "lines to the --profile file (default: 0)"
+    )
+
+
+def cert_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-H", "--hostname", dest='hostname', required=True, type=str,
+        help='hostname'
+    )
+    parser.add_argument(
+        '--cert', dest='cert', default=HOSTCERT, type=str, help='Certificate'
+    )
+    parser.add_argument(
+        '--key', dest='key', default=HOSTKEY, type=str, help='Certificate key'
+    )
+    parser.add_argument(
+        '--capath', dest='capath', default=CAPATH, type=str, help='CA directory'
+    )
+    parser.add_argument(
+        "--skipped-tenants", dest="skipped_tenants", type=str, nargs="*",
+        help="space-separated list of tenants that are going to be skipped"
+    )
+    parser.add_argument('-t', "--timeout", dest='timeout', type=int, default=60)
+    parser.add_argument(
+        "--workers", dest="workers", type=int, default=1,
+        help="number of tenants checked concurrently (default: 1)"
+    )
+    parser.add_argument(
+        "--cache-dir", dest="cache_dir", type=str, default=CACHE_DIR,
+        help=f"directory for cached data (default: {CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--tenants-cache-ttl", dest="tenants_ttl", type=int, default=300,
+        help="seconds for which cached list of tenants is used, 0 disables "
+             "the cache (default: 300)"
+    )
+    parser.add_argument(
+        "--dns-timeout", dest="dns_timeout", type=float, default=5,
+        help="seconds allowed for resolving tenant's hostname (default: 5)"
+    )
+    parser.add_argument(
+        "--connect-timeout", dest="connect_timeout", type=float, default=10,
+        help="seconds allowed for connecting to tenant's host (default: 10)"
+    )
+    add_profile_arguments(parser)
+
+    return parser
+
+
+def metricapi_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-H', "--hostname", dest='hostname', required=True, type=str,
+        help='SuperPOEM FQDN'
+    )
+    parser.add_argument(
+        '--mandatory-metrics', dest='mandatory_metrics', required=True,
+        type=str, nargs='*', help="space-separated list of mandatory metrics"
+    )
+    parser.add_argument(
+        "--skipped-tenants", dest="skipped_tenants", type=str, nargs="*",
+        help="space-separated list of tenants that are going to be skipped"
+    )
+    parser.add_argument(
+        '-t', "--timeout", dest='timeout', type=int, default=180
+    )
+    parser.add_argument(
+        "--engine", dest="engine", type=str, choices=["serial", "asyncio"],
+        default="serial", help="engine used to fetch tenants' metrics "
+                               "(default: serial)"
+    )
+    parser.add_argument(
+        "--max-per-host", dest="max_per_host", type=int, default=4,
+        help="maximum number of concurrent requests per host address with "
+             "asyncio engine (default: 4)"
+    )
+    parser.add_argument(
+        "--deadline", dest="deadline", type=int,
+        help="seconds within which all the tenants have to be checked; "
+             "tenants not yet checked are reported as unknown (default: "
+             "TIMEOUT)"
+    )
+    parser.add_argument(
+        "--cache-dir", dest="cache_dir", type=str, default=CACHE_DIR,
+        help=f"directory for cached data (default: {CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--tenants-cache-ttl", dest="tenants_ttl", type=int, default=300,
+        help="seconds for which cached list of tenants is used, 0 disables "
+             "the cache (default: 300)"
+    )
+    parser.add_argument(
+        "--stream", dest="stream", action="store_true",
+        help="parse metrics incrementally while downloading them, extracting "
+             "only their names (requires ijson)"
+    )
+    parser.add_argument(
+        "--early-exit", dest="early_exit", action="store_true",
+        help="stop reading tenant's metrics as soon as all the mandatory "
+             "metrics are found"
+    )
+    add_profile_arguments(parser)
+
+    return parser
+
+
+def probecandidates_parser():
+    parser = argparse.ArgumentParser(
+        "ARGO probe that parses POEM api for presence of probe candidates and "
+        "checks their statuses"
+    )
+    parser.add_argument(
+        "-H", "--hostname", dest="hostname", type=str, required=True,
+        help="Name of the host"
+    )
+    parser.add_argument(
+        "-t", "--timeout", dest="timeout", type=float, default=30,
+        required=True, help="Seconds before connection times out (default: 30)"
+    )
+    parser.add_argument(
+        "-k", "--token", dest="token", type=str, nargs="+", action="append",
+        help="tenant token in form: <TENANT_NAME:token>"
+    )
+    parser.add_argument(
+        "--warn-processing", dest="warning_processing", type=float, default=1,
+        help="Days before probe returns warning if probe with status "
+             "'processing' is present (default: 1)"
+    )
+    parser.add_argument(
+        "--warn-testing", dest="warning_testing", type=float, default=3,
+        help="Days before probe returns warning if probe with status 'testing' "
+             "is present (default: 3)"
+    )
+    parser.add_argument(
+        "--workers", dest="workers", type=int, default=1,
+        help="Number of tenants whose probe candidates are fetched "
+             "concurrently; the whole fetch is then bounded by TIMEOUT "
+             "(default: 1)"
+    )
+    parser.add_argument(
+        "--cache-dir", dest="cache_dir", type=str, default=CACHE_DIR,
+        help=f"Directory for cached data (default: {CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--tenants-cache-ttl", dest="tenants_ttl", type=int, default=300,
+        help="Seconds for which cached list of tenants is used, 0 disables "
+             "the cache (default: 300)"
+    )
+    parser.add_argument(
+        "--filter-candidates", dest="filter_candidates", action="store_true",
+        help="Request only probe candidates with statuses 'submitted', "
+             "'testing' and 'processing', and drop the others while "
+             "downloading them if the server does not filter them"
+    )
+    add_profile_arguments(parser)
+
+    return parser
+
+
+def runner_parser():
+    parser = argparse.ArgumentParser(
+        "ARGO probe that runs POEM certificate, mandatory metrics and probe "
+        "candidates checks in a single process"
+    )
+    parser.add_argument(
+        "-H", "--hostname", dest="hostname", required=True, type=str,
+        help="SuperPOEM FQDN"
+    )
+    parser.add_argument(
+        "--checks", dest="checks", type=str, nargs="+",
+        choices=list(SERVICES.keys()), default=list(SERVICES.keys()),
+        help="checks to run (default: all)"
+    )
+    parser.add_argument(
+        "-t", "--timeout", dest="timeout", type=int, default=180,
+        help="seconds within which all the checks have to finish "
+             "(default: 180)"
+    )
+    parser.add_argument(
+        "--skipped-tenants", dest="skipped_tenants", type=str, nargs="*",
+        help="space-separated list of tenants that are going to be skipped"
+    )
+    parser.add_argument(
+        "--workers", dest="workers", type=int, default=1,
+        help="number of tenants checked concurrently by each check "
+             "(default: 1)"
+    )
+    parser.add_argument(
+        "--cache-dir", dest="cache_dir", type=str, default=CACHE_DIR,
+        help=f"directory for cached data (default: {CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--tenants-cache-ttl", dest="tenants_ttl", type=int, default=300,
+        help="seconds for which cached list of tenants is used, 0 disables "
+             "the cache (default: 300)"
+    )
+    parser.add_argument(
+        "--cert", dest="cert", default=HOSTCERT, type=str, help="Certificate"
+    )
+    parser.add_argument(
+        "--key", dest="key", default=HOSTKEY, type=str, help="Certificate key"
+    )
+    parser.add_argument(
+        "--capath", dest="capath", default=CAPATH, type=str,
+        help="CA directory"
+    )
+    parser.add_argument(
+        "--dns-timeout", dest="dns_timeout", type=float, default=5,
+        help="seconds allowed for resolving tenant's hostname (default: 5)"
+    )
+    parser.add_argument(
+        "--connect-timeout", dest="connect_timeout", type=float, default=10,
+        help="seconds allowed for connecting to tenant's host (default: 10)"
+    )
+    parser.add_argument(
+        "--mandatory-metrics", dest="mandatory_metrics", type=str, nargs="*",
+        help="space-separated list of mandatory metrics"
+    )
+    parser.add_argument(
+        "--engine", dest="engine", type=str, choices=["serial", "asyncio"],
+        default="serial", help="engine used to fetch tenants' metrics "
+                               "(default: serial)"
+    )
+    parser.add_argument(
+        "--max-per-host", dest="max_per_host", type=int, default=4,
+        help="maximum number of concurrent requests per host address with "
+             "asyncio engine (default: 4)"
+    )
+    parser.add_argument(
+        "--deadline", dest="deadline", type=int,
+        help="seconds within which all the tenants' metrics have to be "
+             "checked; tenants not yet checked are reported as unknown "
+             "(default: TIMEOUT)"
+    )
+    parser.add_argument(
+        "--stream", dest="stream", action="store_true",
+        help="parse metrics incrementally while downloading them, extracting "
+             "only their names (requires ijson)"
+    )
+    parser.add_argument(
+        "--early-exit", dest="early_exit", action="store_true",
+        help="stop reading tenant's metrics as soon as all the mandatory "
+             "metrics are found"
+    )
+    parser.add_argument(
+        "-k", "--token", dest="token", type=str, nargs="+", action="append",
+        help="tenant token in form: <TENANT_NAME:token>"
+    )
+    parser.add_argument(
+        "--warn-processing", dest="warning_processing", type=float, default=1,
+        help="days before probe returns warning if probe with status "
+             "'processing' is present (default: 1)"
+    )
+    parser.add_argument(
+        "--warn-testing", dest="warning_testing", type=float, default=3,
+        help="days before probe returns warning if probe with status "
+             "'testing' is present (default: 3)"
+    )
+    parser.add_argument(
+        "--filter-candidates", dest="filter_candidates", action="store_true",
+        help="request only probe candidates with statuses 'submitted', "
+             "'testing' and 'processing', and drop the others while "
+             "downloading them if the server does not filter them"
+    )
+    parser.add_argument(
+        "--service", dest="services", type=str, action="append", default=[],
+        metavar="CHECK=SERVICE",
+        help="name of the service the check's result is submitted for "
+             "(default: name of the check's standalone probe)"
+    )
+    parser.add_argument(
+        "--command-file", dest="command_file", type=str,
+        help="Nagios external command file the passive check results are "
+             "written to (default: standard output)"
+    )
+    parser.add_argument(
+        "--results-file", dest="results_file", type=str,
+        help="JSON file the checks' results are also written to"
+    )
+    add_profile_arguments(parser)
+
+    return parser
+
+
+def runner_args(argv=None):
+    parser = runner_parser()
+    args = parser.parse_args(argv)
+
+    if "metricapi" in args.checks and not args.mandatory_metrics:
+        parser.error("metricapi check requires --mandatory-metrics")
+
+    if "probecandidates" in args.checks and not args.token:
+        parser.error("probecandidates check requires --token")
+
+    services = SERVICES.copy()
+    for service in args.services:
+        check, _, name = service.partition("=")
+        if check not in services or not name:
+            parser.error(f"invalid --service: {service}")
+
+        services[check] = name
+
+    args.services = services
+
+    return args
+
+
+def cert():
+    args = cert_parser().parse_args()
+
+    from argo_probe_poem import poem_cert
+    poem_cert.main(args)
+
+
+def metricapi():
+    args = metricapi_parser().parse_args()
+
+    from argo_probe_poem import poem_metricapi
+    poem_metricapi.main(args)
+
+
+def probecandidates():
+    args = probecandidates_parser().parse_args()
+
+    from argo_probe_poem import poem_probecandidates
+    poem_probecandidates.main(args)
+
+
+def runner():
+    args = runner_args()
+
+    from argo_probe_poem import poem_runner
+    poem_runner.main(args)
@@ -0,0 +1,302 @@
+import asyncio
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, wait
+
+from argo_probe_poem import utils
+from argo_probe_poem.probe_response import ProbeResponse
+
+MAX_WORKERS = 32
+
+
+def skip_tenants(skipped_tenants=None):
+    skipped = set(skipped_tenants) if skipped_tenants else set()
+
+    def accept(tenant):
+        return tenant["name"] != utils.SUPERPOEM and \
+            tenant["name"] not in skipped
+
+    return accept
+
+
+def only_tenants(names):
+    names = set(names)
+
+    def accept(tenant):
+        return tenant["name"] in names
+
+    return accept
+
+
+class DaemonThreadPoolExecutor(Executor):
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self._queue = queue.Queue()
+        self._threads = list()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                result = fn(*args, **kwargs)
+
+            except BaseException as e:
+                future.set_exception(e)
+
+            else:
+                future.set_result(result)
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        if len(self._threads) < self.max_workers:
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        return future
+
+    def shutdown(self, wait=True, **kwargs):
+        for _ in self._threads:
+            self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+
+class ThreadedExecutor:
+    def __init__(self, workers):
+        self.workers = workers
+
+    def run(self, check, tenants, deadline=None, on_timeout=None):
+        executor = DaemonThreadPoolExecutor(max_workers=self.workers)
+        futures = [executor.submit(check, tenant) for tenant in tenants]
+        if deadline is not None and on_timeout is not None:
+            done, not_done = wait(futures, timeout=deadline.remaining())
+
+        else:
+            done, not_done = wait(futures)
+
+        executor.shutdown(wait=False)
+
+        results = list()
+        for tenant, future in zip(tenants, futures):
+            if future in not_done:
+                future.cancel()
+                results.append(on_timeout(tenant))
+
+            else:
+                results.append(future.result())
+
+        return results
+
+
+class SerialExecutor:
+    def run(self, check, tenants, deadline=None, on_timeout=None):
+        if deadline is not None and on_timeout is not None:
+            return ThreadedExecutor(1).run(
+                check, tenants, deadline=deadline, on_timeout=on_timeout
+            )
+
+        return [check(tenant) for tenant in tenants]
+
+
+def host_address(tenant):
+    host, port = utils.split_host_port(tenant["domain_url"])
+    try:
+        return socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0][4][0]
+
+    except socket.error:
+        return host
+
+
+class AsyncioExecutor:
+    def __init__(self, max_per_host=4, max_workers=MAX_WORKERS):
+        self.max_per_host = max_per_host
+        self.max_workers = max_workers
+
+    async def _check_async(self, executor, semaphores, check, tenant):
+        loop = asyncio.get_event_loop()
+        host = await loop.run_in_executor(executor, host_address, tenant)
+        if host not in semaphores:
+            semaphores[host] = asyncio.Semaphore(self.max_per_host)
+
+        async with semaphores[host]:
+            return await loop.run_in_executor(executor, check, tenant)
+
+    async def _run_async(self, executor, check, tenants, deadline, on_timeout):
+        semaphores = dict()
+        tasks = [
+            asyncio.ensure_future(
+                self._check_async(executor, semaphores, check, tenant)
+            ) for tenant in tenants
+        ]
+
+        if deadline is not None and on_timeout is not None:
+            done, pending = await asyncio.wait(
+                tasks, timeout=deadline.remaining()
+            )
+
+        else:
+            done, pending = await asyncio.wait(tasks)
+
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            await asyncio.wait(pending)
+
+        results = list()
+        for tenant, task in zip(tenants, tasks):
+            if task in pending:
+                results.append(on_timeout(tenant))
+
+            else:
+                results.append(task.result())
+
+        return results
+
+    def run(self, check, tenants, deadline=None, on_timeout=None):
+        loop = asyncio.new_event_loop()
+        executor = DaemonThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(tenants))
+        )
+        try:
+            return loop.run_until_complete(
+                self._run_async(executor, check, tenants, deadline, on_timeout)
+            )
+
+        finally:
+            executor.shutdown(wait=False)
+            loop.close()
+
+
+class Pipeline:
+    def __init__(
+            self, source, check, filters=None, executor=None, deadline=None,
+            on_timeout=None
+    ):
+        self.source = source
+        self.check = check
+        self.filters = filters if filters else []
+        self.executor = executor if executor else SerialExecutor()
+        self.deadline = deadline
+        self.on_timeout = on_timeout
+        self.stats = OrderedDict()
+        self.elapsed = None
+
+    def tenants(self):
+        return [
+            tenant for tenant in self.source()
+            if all(accept(tenant) for accept in self.filters)
+        ]
+
+    def _check(self, tenant):
+        stats = self.stats[tenant["name"]]
+        start = time.monotonic()
+        with utils.collect_stats(stats):
+            try:
+                return self.check(tenant)
+
+            finally:
+                stats.set("time", time.monotonic() - start)
+
+    def run(self):
+        start = time.monotonic()
+        self.stats = OrderedDict()
+        try:
+            tenants = self.tenants()
+            if not tenants:
+                return []
+
+            self.stats = OrderedDict(
+                (tenant["name"], utils.Stats()) for tenant in tenants
+            )
+            results = self.executor.run(
+                self._check, tenants, deadline=self.deadline,
+                on_timeout=self.on_timeout
+            )
+
+            return list(zip(tenants, results))
+
+        finally:
+            self.elapsed = time.monotonic() - start
+
+    def perfdata(self, stats=(("latency", "s"), ("handshake", "s"))):
+        data = [
+            ("time", self.elapsed or 0., "s", "", "", 0),
+            ("tenants", len(self.stats), "", "", "", 0),
+            ("bytes", sum(
+                tenant.get("bytes", 0) for tenant in self.stats.values()
+            ), "B", "", "", 0)
+        ]
+        for name, tenant in self.stats.items():
+            for stat in stats:
+                value = tenant.get(stat[0])
+                if value is not None:
+                    data.append((f"{name}_{stat[0]}", value) + tuple(stat[1:]))
+
+        return data
+
+
+class Aggregator:
+    SEVERITY = (
+        ProbeResponse.OK, ProbeResponse.WARNING, ProbeResponse.UNKNOWN,
+        ProbeResponse.CRITICAL
+    )
+
+    def __init__(self, ok_msg, separator=" / ", worst_only=False):
+        self.ok_msg = ok_msg
+        self.separator = separator
+        self.worst_only = worst_only
+        self.code = ProbeResponse.OK
+        self.messages = list()
+        self.perfdata = list()
+
+    def add(self, code, msg):
+        self.messages.append((code, msg))
+        if self.SEVERITY.index(code) > self.SEVERITY.index(self.code):
+            self.code = code
+
+    def add_perfdata(self, *args, **kwargs):
+        self.perfdata.append((args, kwargs))
+
+    def result(self):
+        if self.messages:
+            return self.code, self.separator.join(
+                msg for code, msg in self.messages
+                if not self.worst_only or code == self.code
+            )
+
+        return self.code, self.ok_msg
+
+    def response(self):
+        code, msg = self.result()
+        status = ProbeResponse()
+        if code == ProbeResponse.CRITICAL:
+            status.critical(msg)
+
+        elif code == ProbeResponse.UNKNOWN:
+            status.unknown(msg)
+
+        elif code == ProbeResponse.WARNING:
+            status.warning(msg)
+
+        else:
+            status.ok(msg)
+
+        for args, kwargs in self.perfdata:
+            status.add_perfdata(*args, **kwargs)
+
+        return status
@@ -1,17 +1,19 @@
-import argparse
 import datetime
-import re
+import ipaddress
+import os
+import select
 import socket
 import sys
+import threading
+import time
+from collections import OrderedDict
 
 import requests
-from OpenSSL import SSL
-from argo_probe_poem import utils
+from OpenSSL import SSL, crypto
+from cryptography import x509
+from argo_probe_poem import cli, pipeline, profiling, utils
 from argo_probe_poem.probe_response import ProbeResponse
-
-HOSTCERT = "/etc/grid-security/hostcert.pem"
-HOSTKEY = "/etc/grid-security/hostkey.pem"
-CAPATH = "/etc/grid-security/certificates/"
+from argo_probe_poem.tenants import Tenants
 
 
 class CertificateException(Exception):
@@ -35,59 +37,303 @@ class SSLException(Exception):
         return str(self.msg)
 
 
+class SubjectAltNames:
+    def __init__(self, names=None, addresses=None):
+        self.dns_names = list(names or [])
+        self.ip_addresses = list(addresses or [])
+        self.names = set()
+        self.wildcards = dict()
+        self.addresses = set()
+
+        for name in names or []:
+            self._add_name(name)
+
+        for address in addresses or []:
+            try:
+                self.addresses.add(ipaddress.ip_address(address.strip()))
+
+            except ValueError:
+                pass
+
+    @classmethod
+    def from_string(cls, alt_names):
+        names = list()
+        addresses = list()
+        for item in alt_names.split(","):
+            kind, _, value = item.strip().partition(":")
+            if kind == "DNS":
+                names.append(value)
+
+            elif kind == "IP Address":
+                addresses.append(value)
+
+        return cls(names=names, addresses=addresses)
+
+    def _add_name(self, name):
+        name = name.strip().rstrip(".").lower()
+        label, _, suffix = name.partition(".")
+        if "*" not in name:
+            self.names.add(name)
+
+        elif label.count("*") == 1 and "*" not in suffix and "." in suffix \
+                and (label == "*" or not label.startswith("xn--")):
+            head, _, tail = label.partition("*")
+            self.wildcards.setdefault(suffix, set()).add((head, tail))
+
+    def match(self, hostname):
+        hostname = hostname.strip().rstrip(".").lower()
+        if hostname in self.names:
+            return True
+
+        try:
+            return ipaddress.ip_address(hostname) in self.addresses
+
+        except ValueError:
+            pass
+
+        label, _, suffix = hostname.partition(".")
+        if not label:
+            return False
+
+        for head, tail in self.wildcards.get(suffix, ()):
+            if len(label) >= len(head) + len(tail) and \
+                    label.startswith(head) and label.endswith(tail):
+                return True
+
+        return False
+
+
+class CertificateInfo:
+    def __init__(self, not_after, alt_names, verdicts=None):
+        self.not_after = not_after
+        self.alt_names = alt_names
+        if verdicts:
+            self.verdicts = verdicts
+        else:
+            self.verdicts = dict()
+
+    @classmethod
+    def from_certificate(cls, certificate):
+        not_after = datetime.datetime.strptime(
+            certificate.get_notAfter().decode("utf-8"), "%Y%m%d%H%M%SZ"
+        )
+
+        return cls(not_after, cls._parse_alt_names(certificate))
+
+    @staticmethod
+    def _parse_alt_names(certificate):
+        if hasattr(certificate, "get_extension"):
+            subject_alt_name = ""
+            for i in range(certificate.get_extension_count()):
+                extension = certificate.get_extension(i)
+                if extension.get_short_name().decode() == "subjectAltName":
+                    subject_alt_name = str(extension)
+
+            return SubjectAltNames.from_string(subject_alt_name)
+
+        extensions = certificate.to_cryptography().extensions
+        try:
+            extension = extensions.get_extension_for_class(
+                x509.SubjectAlternativeName
+            )
+
+        except x509.ExtensionNotFound:
+            return SubjectAltNames()
+
+        return SubjectAltNames(
+            names=extension.value.get_values_for_type(x509.DNSName),
+            addresses=[
+                str(address) for address in
+                extension.value.get_values_for_type(x509.IPAddress)
+            ]
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            not_after=datetime.datetime(*data["not_after"]),
+            alt_names=SubjectAltNames(
+                names=data["names"], addresses=data["addresses"]
+            ),
+            verdicts=data["verdicts"]
+        )
+
+    def to_dict(self):
+        return {
+            "not_after": list(self.not_after.timetuple())[:6],
+            "names": self.alt_names.dns_names,
+            "addresses": self.alt_names.ip_addresses,
+            "verdicts": dict(self.verdicts)
+        }
+
+    def is_cn_ok(self, fqdn):
+        if fqdn not in self.verdicts:
+            self.verdicts[fqdn] = self.alt_names.match(fqdn)
+
+        return self.verdicts[fqdn]
+
+
+class CertificateCache:
+    MAX_AGE = 30 * 86400
+
+    def __init__(self, path=None, maxsize=256):
+        self.path = path
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._stored = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        self._stored = dict()
+        if not self.path:
+            return
+
+        try:
+            self._stored = dict(utils.read_json(self.path))
+
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def _load(self, fingerprint):
+        with self._lock:
+            if self._stored is None:
+                self._read()
+
+            try:
+                return CertificateInfo.from_dict(
+                    self._stored[fingerprint.decode("ascii")]
+                )
+
+            except (KeyError, ValueError, TypeError, AttributeError):
+                return None
+
+    def get(self, certificate):
+        fingerprint = certificate.digest("sha256")
+        with self._lock:
+            if fingerprint in self._cache:
+                self._cache.move_to_end(fingerprint)
+                return self._cache[fingerprint]
+
+        info = self._load(fingerprint)
+        if info is None:
+            info = CertificateInfo.from_certificate(certificate)
+
+        with self._lock:
+            self._cache[fingerprint] = info
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return info
+
+    def save(self):
+        if not self.path:
+            return
+
+        now = time.time()
+        with self._lock:
+            if self._stored is None:
+                self._read()
+
+            stored = dict(
+                (fingerprint, data) for fingerprint, data in
+                self._stored.items() if
+                now - data.get("timestamp", 0) < self.MAX_AGE
+            )
+            for fingerprint, info in self._cache.items():
+                data = info.to_dict()
+                data["timestamp"] = now
+                stored[fingerprint.decode("ascii")] = data
+
+            self._stored = stored
+
+        try:
+            utils.write_json_atomic(self.path, stored)
+
+        except OSError:
+            pass
+
+
 class Certificate:
-    def __init__(self, hostname, cert, key, capath, skipped_tenants, timeout):
+    def __init__(
+            self, hostname, cert, key, capath, skipped_tenants, timeout,
+            workers=1, client=None, cache_dir=None, tenants_ttl=300,
+            dns_timeout=None, connect_timeout=None, deadline=None,
+            tenants=None
+    ):
         self.hostname = hostname
         self.cert = cert
         self.key = key
         self.capath = capath
         self.timeout = timeout
-        if skipped_tenants:
-            self.skipped_tenants = skipped_tenants
+        self.dns_timeout = dns_timeout if dns_timeout else timeout
+        self.connect_timeout = connect_timeout if connect_timeout else timeout
+        self.deadline = deadline
+        self.workers = workers
+        if client:
+            self.client = client
         else:
-            self.skipped_tenants = []
-
-    def _get_tenants(self):
-        try:
-            response = requests.get(
-                f"https://{self.hostname}{utils.TENANT_API}"
+            self.client = utils.HTTPClient(
+                pool_size=max(workers, 10), timeout=timeout, deadline=deadline
             )
 
-            if not response.ok:
-                msg = (
-                    f"Tenant fetch error: {response.status_code} "
-                    f"{response.reason}"
-                )
+        if tenants:
+            self.tenants = tenants
 
-                try:
-                    msg = f"{msg}: {response.json()['detail']}"
+        else:
+            self.tenants = Tenants(
+                hostname=hostname, client=self.client, cache_dir=cache_dir,
+                ttl=tenants_ttl
+            )
+        if cache_dir:
+            self.certificates = CertificateCache(
+                os.path.join(cache_dir, "certificates.json")
+            )
+        else:
+            self.certificates = CertificateCache()
 
-                except (ValueError, TypeError, KeyError):
-                    pass
+        self._context = None
+        self._context_lock = threading.Lock()
+        self.tenants_pipeline = None
+        if skipped_tenants:
+            self.skipped_tenants = skipped_tenants
+        else:
+            self.skipped_tenants = []
 
-                raise utils.POEMException(msg)
+    def _get_tenants(self):
+        return self.tenants.get(self.skipped_tenants)
 
-            else:
-                tenants = response.json()
+    @staticmethod
+    def _get_peer_certificate(response):
+        connection = getattr(response.raw, "connection", None) or \
+            getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            return None
 
-                return([
-                    item for item in tenants if (
-                        item["name"] not in self.skipped_tenants and
-                        item["name"] != utils.SUPERPOEM
-                    )
-                ])
+        der = sock.getpeercert(binary_form=True)
+        if not der:
+            return None
 
-        except requests.exceptions.RequestException as e:
-            raise utils.POEMException(f"Tenant fetch error: {str(e)}")
+        return crypto.load_certificate(crypto.FILETYPE_ASN1, der)
 
     def verify_client_cert(self, tenant):
         try:
-            requests.get(
+            response = self.client.get(
                 f"https://{tenant['domain_url']}",
                 cert=(self.cert, self.key),
-                verify=True
+                verify=True,
+                stream=True,
+                allow_redirects=False,
+                dns_timeout=self.dns_timeout,
+                connect_timeout=self.connect_timeout
             )
 
+            try:
+                return self._get_peer_certificate(response)
+
+            finally:
+                response.close()
+
         except requests.exceptions.RequestException as e:
             raise CertificateException(
                 f"{tenant['name']}: Client certificate verification failed: "
@@ -97,25 +343,70 @@ class Certificate:
         except Exception as e:
             raise CertificateException(f"{tenant['name']}: {str(e)}")
 
-    def _get_certificate(self, hostname):
+    def _get_context(self):
+        with self._context_lock:
+            if self._context is None:
+                context = SSL.Context(SSL.TLSv1_2_METHOD)
+                context.load_verify_locations(None, self.capath)
+                self._context = context
+
+        return self._context
+
+    def _budget(self, timeout):
+        if self.deadline is None:
+            return timeout
+
+        if self.deadline.expired():
+            raise socket.timeout(
+                f"Deadline of {self.deadline.timeout} seconds exceeded"
+            )
+
+        return self.deadline.budget(timeout)
+
+    def _handshake(self, conn):
+        start = time.monotonic()
+        deadline = start + self._budget(self.timeout)
+        while True:
+            try:
+                conn.do_handshake()
+                utils.add_stat("handshake", time.monotonic() - start)
+                utils.add_phase("tls", time.monotonic() - start)
+                return
+
+            except SSL.WantReadError:
+                readable, writable = [conn], []
+
+            except SSL.WantWriteError:
+                readable, writable = [], [conn]
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or \
+                    not any(select.select(readable, writable, [], remaining)):
+                raise socket.timeout(
+                    f"TLS handshake timed out after {self.timeout} seconds"
+                )
+
+    def _get_certificate(self, address):
+        sock = None
         try:
-            context = SSL.Context(SSL.TLSv1_2_METHOD)
-            context.load_verify_locations(None, self.capath)
-            conn = SSL.Connection(
-                context,
-                socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            hostname, port = utils.split_host_port(address)
+            context = self._get_context()
+            sock = utils.create_connection(
+                hostname, port, dns_timeout=self._budget(self.dns_timeout),
+                connect_timeout=self._budget(self.connect_timeout)
             )
-            conn.connect((hostname, 443))
+            conn = SSL.Connection(context, socket=sock)
             conn.set_tlsext_host_name(hostname.encode("utf-8"))
             conn.set_connect_state()
-            conn.settimeout(self.timeout)
-            conn.setblocking(1)
-            conn.do_handshake()
+            self._handshake(conn)
 
             cert = conn.get_peer_certificate()
 
-            conn.shutdown()
-            conn.close()
+            try:
+                conn.shutdown()
+
+            except SSL.Error:
+                pass
 
             return cert
 
@@ -125,34 +416,25 @@ class Certificate:
             )
 
         except socket.timeout as e:
-            raise SSLException(
-                f"Connection timeout after {self.timeout} seconds"
-            )
+            raise SSLException(f"Connection timeout: {str(e)}")
 
         except socket.error as e:
             raise SSLException(f"Connection error: {str(e)}")
 
-    @staticmethod
-    def _is_cn_ok(alt_names, fqdn):
-        alt_names = [item.strip()[4:] for item in alt_names.split(",")]
-        cn_ok = False
-        for cn in alt_names:
-            pattern = re.compile(cn.replace('*', '[A-Za-z0-9_-]+?'))
-            if bool(re.match(pattern, fqdn)):
-                cn_ok = True
-                break
-
-        return cn_ok
-
-    def verify_server_cert(self, tenant):
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def verify_server_cert(self, tenant, certificate=None):
         try:
             fqdn = tenant["domain_url"]
-            certificate = self._get_certificate(fqdn)
+            if certificate is None:
+                certificate = self._get_certificate(fqdn)
 
-            not_after = datetime.datetime.strptime(
-                certificate.get_notAfter().decode("utf-8"), "%Y%m%d%H%M%SZ"
-            )
+            info = self.certificates.get(certificate)
+            not_after = info.not_after
             today = datetime.datetime.now()
+            utils.set_stat("expiry_days", (not_after - today).days)
 
             if (not_after - today).days < 15:
                 raise WarningCertificateException(
@@ -160,13 +442,7 @@ class Certificate:
                     f"{(not_after - today).days} days"
                 )
 
-            subject_alt_name = ""
-            for i in range(certificate.get_extension_count()):
-                extension = certificate.get_extension(i)
-                if extension.get_short_name().decode() == "subjectAltName":
-                    subject_alt_name = str(extension)
-
-            if not self._is_cn_ok(subject_alt_name, fqdn):
+            if not info.is_cn_ok(utils.split_host_port(fqdn)[0]):
                 raise CertificateException(
                     f"{tenant['name']}: Server certificate CN does not match "
                     f"{fqdn}"
@@ -178,52 +454,77 @@ class Certificate:
         except WarningCertificateException:
             raise
 
-    def verify(self):
-        tenants = self._get_tenants()
+    def _verify_tenant(self, tenant):
+        try:
+            certificate = self.verify_client_cert(tenant)
+            self.verify_server_cert(tenant, certificate)
 
-        critical = list()
-        warning = list()
-        for tenant in tenants:
-            try:
-                self.verify_client_cert(tenant)
-                self.verify_server_cert(tenant)
+        except CertificateException as e:
+            return e
 
-            except WarningCertificateException as e:
-                warning.append(str(e))
-                continue
+    def _on_timeout(self, tenant):
+        return CertificateException(
+            f"{tenant['name']}: Certificate check did not finish within "
+            f"{self.deadline.timeout} seconds"
+        )
 
-            except CertificateException as e:
-                critical.append(str(e))
-                continue
+    def _pipeline(self):
+        if self.workers > 1:
+            executor = pipeline.ThreadedExecutor(self.workers)
 
-        if len(critical) > 0:
-            raise CertificateException(" / ".join(critical))
+        else:
+            executor = pipeline.SerialExecutor()
 
-        if len(warning) > 0:
-            raise WarningCertificateException(" / ".join(warning))
+        return pipeline.Pipeline(
+            source=self._get_tenants, check=self._verify_tenant,
+            executor=executor, deadline=self.deadline,
+            on_timeout=self._on_timeout
+        )
 
+    def _aggregate(self):
+        tenants_pipeline = self.tenants_pipeline = self._pipeline()
+        results = tenants_pipeline.run()
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "-H", "--hostname", dest='hostname', required=True, type=str,
-        help='hostname'
-    )
-    parser.add_argument(
-        '--cert', dest='cert', default=HOSTCERT, type=str, help='Certificate'
-    )
-    parser.add_argument(
-        '--key', dest='key', default=HOSTKEY, type=str, help='Certificate key'
-    )
-    parser.add_argument(
-        '--capath', dest='capath', default=CAPATH, type=str, help='CA directory'
-    )
-    parser.add_argument(
-        "--skipped-tenants", dest="skipped_tenants", type=str, nargs="*",
-        help="space-separated list of tenants that are going to be skipped"
-    )
-    parser.add_argument('-t', "--timeout", dest='timeout', type=int, default=60)
-    args = parser.parse_args()
+        self.certificates.save()
+
+        with utils.phase("format"):
+            aggregator = pipeline.Aggregator(
+                "All certificates are valid", worst_only=True
+            )
+            for tenant, result in results:
+                if isinstance(result, WarningCertificateException):
+                    aggregator.add(ProbeResponse.WARNING, str(result))
+
+                elif isinstance(result, CertificateException):
+                    aggregator.add(ProbeResponse.CRITICAL, str(result))
+
+            for item in tenants_pipeline.perfdata(stats=(
+                    ("latency", "s"), ("handshake", "s"),
+                    ("expiry_days", "", "15:")
+            )):
+                aggregator.add_perfdata(*item)
+
+        return aggregator
+
+    def check(self):
+        return self._aggregate().response()
+
+    def verify(self):
+        code, msg = self._aggregate().result()
+
+        if code == ProbeResponse.CRITICAL:
+            raise CertificateException(msg)
+
+        if code == ProbeResponse.WARNING:
+            raise WarningCertificateException(msg)
+
+
+def main(args=None):
+    if args is None:
+        args = cli.cert_parser().parse_args()
+
+    profiler = profiling.Profiler.from_args(args)
+    profiler.start()
 
     cert = Certificate(
         hostname=args.hostname,
@@ -231,24 +532,26 @@ def main():
         key=args.key,
         capath=args.capath,
         skipped_tenants=args.skipped_tenants,
-        timeout=args.timeout
+        timeout=args.timeout,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        tenants_ttl=args.tenants_ttl,
+        dns_timeout=args.dns_timeout,
+        connect_timeout=args.connect_timeout,
+        deadline=utils.Deadline(args.timeout)
     )
     status = ProbeResponse()
 
     try:
-        cert.verify()
-        status.ok("All certificates are valid")
-
-    except WarningCertificateException as e:
-        status.warning(str(e))
-
-    except CertificateException as e:
-        status.critical(str(e))
+        with profiler.collect("cert", cert):
+            status = cert.check()
 
     except Exception as e:
         status.unknown(str(e))
 
-    print(status.msg())
+    profiler.stop()
+
+    print(status.output())
     sys.exit(status.code())
 
 
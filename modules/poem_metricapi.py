@@ -1,9 +1,11 @@
-import argparse
+import hashlib
+import os
 import sys
 
 import requests
-from argo_probe_poem import utils
+from argo_probe_poem import cli, pipeline, profiling, utils
 from argo_probe_poem.probe_response import ProbeResponse
+from argo_probe_poem.tenants import Tenants
 
 
 class MetricsException(Exception):
@@ -14,123 +16,276 @@ class MetricsException(Exception):
         return str(self.msg)
 
 
+class TimeoutMetricsException(MetricsException):
+    def __init__(self, msg):
+        self.msg = msg
+
+
 class Metrics:
-    def __init__(self, hostname, mandatory_metrics, skipped_tenants, timeout):
+    def __init__(
+            self, hostname, mandatory_metrics, skipped_tenants, timeout,
+            engine="serial", max_per_host=4, deadline=None, client=None,
+            cache_dir=None, tenants_ttl=300, stream=False, early_exit=False,
+            tenants=None
+    ):
         self.hostname = hostname
         self.mandatory_metrics = set(mandatory_metrics)
         self.timeout = timeout
+        self.engine = engine
+        self.cache_dir = cache_dir
+        self.stream = stream
+        self.early_exit = early_exit
+        self.max_per_host = max_per_host
+        if client:
+            self.client = client
+        else:
+            self.client = utils.HTTPClient(timeout=timeout, deadline=deadline)
+
+        if tenants:
+            self.tenants = tenants
+
+        else:
+            self.tenants = Tenants(
+                hostname=hostname, client=self.client, cache_dir=cache_dir,
+                ttl=tenants_ttl
+            )
+        self.deadline = deadline
+        self.tenants_pipeline = None
+
         if skipped_tenants:
             self.skipped_tenants = skipped_tenants
         else:
             self.skipped_tenants = []
 
+    @property
+    def _streaming(self):
+        return self.stream and utils.ijson is not None
+
     def _get_tenants(self):
+        return self.tenants.get(self.skipped_tenants)
+
+    def _request_metrics(self, tenant, headers=None, stream=False):
+        kwargs = dict()
+        if headers:
+            kwargs["headers"] = headers
+
+        if stream:
+            kwargs["stream"] = True
+
+        response = self.client.get(
+            f"https://{tenant['domain_url']}{utils.METRICS_API}", **kwargs
+        )
+
+        if not response.ok:
+            msg = (
+                f"Metrics fetch error: {response.status_code} "
+                f"{response.reason}"
+            )
+
+            try:
+                msg = f"{msg}: {response.json()['detail']}"
+
+            except (ValueError, TypeError, KeyError):
+                pass
+
+            raise utils.POEMException(msg)
+
+        return response
+
+    def _get_metrics(self, tenant):
+        try:
+            return list(utils.iter_items(
+                self._request_metrics(tenant), client=self.client
+            ))
+
+        except requests.exceptions.RequestException as e:
+            raise utils.POEMException(f"Metrics fetch error: {str(e)}")
+
+    def _metrics_cache_file(self, tenant):
+        return os.path.join(
+            self.cache_dir, f"metrics-{tenant['domain_url']}.json"
+        )
+
+    @staticmethod
+    def _digest(names):
+        return hashlib.sha256(
+            "\n".join(sorted(names)).encode("utf-8")
+        ).hexdigest()
+
+    def _read_metrics_cache(self, tenant):
         try:
-            response = requests.get(
-                f"https://{self.hostname}{utils.TENANT_API}"
+            cached = utils.read_json(self._metrics_cache_file(tenant))
+
+            if self._digest(cached["names"]) == cached["digest"]:
+                return cached
+
+        except (OSError, ValueError, TypeError, KeyError):
+            pass
+
+    def _write_metrics_cache(self, tenant, response, names, complete):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+
+        try:
+            utils.write_json_atomic(
+                self._metrics_cache_file(tenant), {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "digest": self._digest(names),
+                    "names": sorted(names),
+                    "complete": complete
+                }
             )
 
-            if not response.ok:
-                msg = (
-                    f"Tenant fetch error: {response.status_code} "
-                    f"{response.reason}"
-                )
+        except OSError:
+            pass
 
-                try:
-                    msg = f"{msg}: {response.json()['detail']}"
+    def _iter_metric_names(self, response):
+        return utils.iter_items(
+            response, client=self.client, field="name", stream=self._streaming
+        )
 
-                except (ValueError, TypeError, KeyError):
-                    pass
+    def _collect_metric_names(self, names):
+        collected = set()
+        remaining = set(self.mandatory_metrics)
+        for name in names:
+            collected.add(name)
 
-                raise utils.POEMException(msg)
+            if self.early_exit:
+                remaining.discard(name)
+                if not remaining:
+                    return collected, False
 
-            else:
-                tenants = response.json()
+        return collected, True
 
-                return([
-                    item for item in tenants if (
-                        item["name"] not in self.skipped_tenants and
-                        item["name"] != utils.SUPERPOEM
-                    )
-                ])
+    def _is_cache_usable(self, cached):
+        return cached.get("complete", True) or \
+            self.mandatory_metrics.issubset(cached["names"])
 
-        except requests.exceptions.RequestException as e:
-            raise utils.POEMException(f"Tenant fetch error: {str(e)}")
+    def _get_metric_names(self, tenant):
+        if not self.cache_dir and not self._streaming and not self.early_exit:
+            return set([item["name"] for item in self._get_metrics(tenant)])
+
+        cached = None
+        headers = dict()
+        if self.cache_dir:
+            cached = self._read_metrics_cache(tenant)
+
+        if cached and self._is_cache_usable(cached):
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
 
-    def _get_metrics(self, tenant):
         try:
-            response = requests.get(
-                f"https://{tenant['domain_url']}{utils.METRICS_API}",
-                timeout=self.timeout
+            response = self._request_metrics(
+                tenant, headers=headers, stream=self._streaming
             )
 
-            if not response.ok:
-                msg = (
-                    f"Metrics fetch error: {response.status_code} "
-                    f"{response.reason}"
+            try:
+                if response.status_code == 304 and cached:
+                    return set(cached["names"])
+
+                names, complete = self._collect_metric_names(
+                    self._iter_metric_names(response)
                 )
 
-                try:
-                    msg = f"{msg}: {response.json()['detail']}"
+            finally:
+                response.close()
+
+        except requests.exceptions.RequestException as e:
+            raise utils.POEMException(f"Metrics fetch error: {str(e)}")
+
+        if self.cache_dir:
+            self._write_metrics_cache(tenant, response, names, complete)
+
+        return names
+
+    def _check_tenant(self, tenant):
+        metrics = self._get_metric_names(tenant)
 
-                except (ValueError, TypeError, KeyError):
-                    pass
+        if not self.mandatory_metrics.issubset(metrics):
+            missing = self.mandatory_metrics.difference(metrics)
 
-                raise utils.POEMException(msg)
+            if len(missing) > 1:
+                word = "Metrics"
+                verb = "are"
 
             else:
-                metrics = response.json()
+                word = "Metric"
+                verb = "is"
 
-                return metrics
+            return (
+                f"{tenant['name']}: {word} {', '.join(missing)} {verb} "
+                f"missing"
+            )
 
-        except requests.exceptions.RequestException as e:
-            raise utils.POEMException(f"Metrics fetch error: {str(e)}")
+    def _pipeline(self):
+        if self.engine == "asyncio":
+            executor = pipeline.AsyncioExecutor(self.max_per_host)
 
-    def check_mandatory(self):
-        tenants = self._get_tenants()
+        else:
+            executor = pipeline.SerialExecutor()
+
+        if self.deadline:
+            deadline = self.deadline
 
-        msgs = list()
-        for tenant in tenants:
-            metrics = set([item["name"] for item in self._get_metrics(tenant)])
+        else:
+            deadline = utils.Deadline(self.timeout)
 
-            if not self.mandatory_metrics.issubset(metrics):
-                missing = self.mandatory_metrics.difference(metrics)
+        def on_timeout(tenant):
+            return TimeoutMetricsException(
+                f"{tenant['name']}: Metrics fetch did not finish within "
+                f"{deadline.timeout} seconds"
+            )
 
-                if len(missing) > 1:
-                    word = "Metrics"
-                    verb = "are"
+        return pipeline.Pipeline(
+            source=self._get_tenants, check=self._check_tenant,
+            executor=executor, deadline=deadline, on_timeout=on_timeout
+        )
 
-                else:
-                    word = "Metric"
-                    verb = "is"
+    def _aggregate(self):
+        tenants_pipeline = self.tenants_pipeline = self._pipeline()
+        results = tenants_pipeline.run()
 
-                msgs.append(
-                    f"{tenant['name']}: {word} {', '.join(missing)} {verb} "
-                    f"missing"
-                )
+        with utils.phase("format"):
+            aggregator = pipeline.Aggregator(
+                "All mandatory metrics are present"
+            )
+            for tenant, result in results:
+                if isinstance(result, TimeoutMetricsException):
+                    aggregator.add(ProbeResponse.UNKNOWN, str(result))
 
-        if len(msgs) > 0:
-            raise MetricsException(" / ".join(msgs))
+                elif result:
+                    aggregator.add(ProbeResponse.CRITICAL, str(result))
 
+            for item in tenants_pipeline.perfdata():
+                aggregator.add_perfdata(*item)
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        '-H', "--hostname", dest='hostname', required=True, type=str,
-        help='SuperPOEM FQDN'
-    )
-    parser.add_argument(
-        '--mandatory-metrics', dest='mandatory_metrics', required=True,
-        type=str, nargs='*', help="space-separated list of mandatory metrics"
-    )
-    parser.add_argument(
-        "--skipped-tenants", dest="skipped_tenants", type=str, nargs="*",
-        help="space-separated list of tenants that are going to be skipped"
-    )
-    parser.add_argument(
-        '-t', "--timeout", dest='timeout', type=int, default=180
-    )
-    args = parser.parse_args()
+        return aggregator
+
+    def check(self):
+        return self._aggregate().response()
+
+    def check_mandatory(self):
+        code, msg = self._aggregate().result()
+
+        if code == ProbeResponse.UNKNOWN:
+            raise TimeoutMetricsException(msg)
+
+        if code == ProbeResponse.CRITICAL:
+            raise MetricsException(msg)
+
+
+def main(args=None):
+    if args is None:
+        args = cli.metricapi_parser().parse_args()
+
+    profiler = profiling.Profiler.from_args(args)
+    profiler.start()
 
     status = ProbeResponse()
 
@@ -138,20 +293,28 @@ def main():
         hostname=args.hostname,
         mandatory_metrics=args.mandatory_metrics,
         skipped_tenants=args.skipped_tenants,
-        timeout=args.timeout
+        timeout=args.timeout,
+        engine=args.engine,
+        max_per_host=args.max_per_host,
+        deadline=utils.Deadline(
+            args.deadline if args.deadline else args.timeout
+        ),
+        cache_dir=args.cache_dir,
+        tenants_ttl=args.tenants_ttl,
+        stream=args.stream,
+        early_exit=args.early_exit
     )
 
     try:
-        metrics.check_mandatory()
-        status.ok("All mandatory metrics are present")
-
-    except MetricsException as e:
-        status.critical(str(e))
+        with profiler.collect("metricapi", metrics):
+            status = metrics.check()
 
     except Exception as e:
         status.unknown(str(e))
 
-    print(status.msg())
+    profiler.stop()
+
+    print(status.output())
     sys.exit(status.code())
 
 
@@ -1,15 +1,50 @@
-import argparse
 import datetime
+import os
+import re
 import sys
+import time
 
 import requests
-from argo_probe_poem import utils
+from argo_probe_poem import cli, pipeline, profiling, utils
+from argo_probe_poem.probe_response import ProbeResponse
+from argo_probe_poem.tenants import TenantFetchException, Tenants
+
+
+RELEVANT_STATUSES = ("submitted", "testing", "processing")
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+TIMESTAMP_PATTERN = re.compile(
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2}\Z"
+)
 
 
 def get_now():
     return datetime.datetime.now()
 
 
+def parse_timestamps(values):
+    match = TIMESTAMP_PATTERN.match
+    timestamps = list()
+    for value in values:
+        if match(value):
+            timestamps.append(datetime.datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19])
+            ))
+
+        else:
+            timestamps.append(
+                datetime.datetime.strptime(value, TIMESTAMP_FORMAT)
+            )
+
+    return timestamps
+
+
+def days_since(now, timestamps):
+    return [(now - timestamp).days for timestamp in timestamps]
+
+
 class RequestException(Exception):
     def __init__(self, msg):
         self.msg = msg
@@ -18,15 +53,106 @@ class RequestException(Exception):
         return str(self.msg)
 
 
+class CandidateState:
+    def __init__(self, path=None):
+        self.path = path
+        self._tenants = self._read()
+        self._updated = set()
+
+    def _read(self):
+        if not self.path:
+            return dict()
+
+        try:
+            stored = utils.read_json(self.path)
+            if isinstance(stored, dict):
+                return stored
+
+        except (OSError, ValueError):
+            pass
+
+        return dict()
+
+    def update(self, tenant, candidates, now):
+        previous = self._tenants.get(tenant)
+        if not isinstance(previous, dict):
+            previous = dict()
+
+        seen = now.strftime(TIMESTAMP_FORMAT)
+        current = dict()
+        for candidate in candidates:
+            entry = previous.get(candidate["name"])
+            if isinstance(entry, list) and len(entry) == 2 and \
+                    entry[0] == candidate["status"]:
+                current[candidate["name"]] = entry
+
+            else:
+                current[candidate["name"]] = [candidate["status"], seen]
+
+        self._tenants[tenant] = current
+        self._updated.add(tenant)
+
+    def since(self, tenant, name):
+        try:
+            return parse_timestamps([self._tenants[tenant][name][1]])[0]
+
+        except (TypeError, KeyError, IndexError, ValueError):
+            return None
+
+    def save(self):
+        if not self.path:
+            return
+
+        try:
+            utils.write_json_atomic(self.path, dict(
+                (tenant, candidates)
+                for tenant, candidates in self._tenants.items()
+                if tenant in self._updated
+            ))
+
+        except OSError:
+            pass
+
+
 class AnalyseProbeCandidates:
     def __init__(
-            self, hostname, tokens, timeout, warning_processing, warning_testing
+            self, hostname, tokens, timeout, warning_processing, warning_testing,
+            workers=1, client=None, cache_dir=None, tenants_ttl=300,
+            deadline=None, filter_candidates=False, tenants=None
     ):
         self.hostname = hostname
         self.timeout = timeout
+        self.deadline = deadline
+        self.workers = workers
+        self.filter_candidates = filter_candidates
+        if client:
+            self.client = client
+        else:
+            self.client = utils.HTTPClient(
+                pool_size=max(workers, 10), timeout=timeout, deadline=deadline
+            )
+
+        if tenants:
+            self.tenants = tenants
+
+        else:
+            self.tenants = Tenants(
+                hostname=hostname, client=self.client, cache_dir=cache_dir,
+                ttl=tenants_ttl
+            )
+        if cache_dir:
+            self.state = CandidateState(
+                os.path.join(cache_dir, f"candidates-{hostname}.json")
+            )
+
+        else:
+            self.state = CandidateState()
+
         self.tokens = self._extract_tokens(tokens)
         self.warning_processing = warning_processing
         self.warning_testing = warning_testing
+        self.perfdata = list()
+        self.tenants_pipeline = None
 
     @staticmethod
     def _extract_tokens(tokens):
@@ -39,22 +165,11 @@ class AnalyseProbeCandidates:
 
     def _fetch_tenants(self):
         try:
-            response = requests.get(
-                f"https://{self.hostname}{utils.TENANT_API}",
-                timeout=self.timeout
-            )
+            return self.tenants.get()
 
-            response.raise_for_status()
-
-            return response.json()
-
-        except (
-            requests.exceptions.HTTPError,
-            requests.exceptions.ConnectionError,
-            requests.exceptions.RequestException
-        ) as e:
+        except TenantFetchException as e:
             raise RequestException(
-                f"{self.hostname}: Error fetching tenants: {str(e)}"
+                f"{self.hostname}: Error fetching tenants: {e.reason}"
             )
 
         except Exception as e:
@@ -62,17 +177,32 @@ class AnalyseProbeCandidates:
                 f"{self.hostname}: Error fetching tenants: {str(e)}"
             )
 
+    def _fetch_relevant_probe_candidates(self, tenant):
+        return [
+            candidate for candidate in self.client.iter_items(
+                f"https://{tenant['domain_url']}/api/v2/probes/",
+                headers={"x-api-key": self.tokens[tenant["name"]]},
+                params={"status": list(RELEVANT_STATUSES)},
+                stream=utils.ijson is not None
+            ) if candidate["status"] in RELEVANT_STATUSES
+        ]
+
     def _fetch_probe_candidates(self, tenant):
         try:
-            response = requests.get(
+            if self.filter_candidates:
+                return self._fetch_relevant_probe_candidates(tenant)
+
+            response = self.client.get(
                 f"https://{tenant['domain_url']}/api/v2/probes/",
-                headers={"x-api-key": self.tokens[tenant["name"]]},
-                timeout=self.timeout
+                headers={"x-api-key": self.tokens[tenant["name"]]}
             )
 
             response.raise_for_status()
 
-            return response.json()
+            return list(utils.iter_items(
+                response, client=self.client,
+                headers={"x-api-key": self.tokens[tenant["name"]]}
+            ))
 
         except (
                 requests.exceptions.HTTPError,
@@ -83,36 +213,55 @@ class AnalyseProbeCandidates:
                 f"{tenant['name']}: Error fetching probe candidates: {str(e)}"
             )
 
+    def _fetch_tenant_data(self, tenant):
+        try:
+            return {"data": self._fetch_probe_candidates(tenant)}
+
+        except RequestException as e:
+            return {
+                "exception": str(e),
+                "status": 2
+            }
+
+        except Exception as e:
+            return {
+                "exception": f"{tenant['name']}: Error fetching probe "
+                             f"candidates: {str(e)}",
+                "status": 3
+            }
+
     def _fetch_data(self):
-        tenants = self._fetch_tenants()
+        if self.deadline:
+            deadline = self.deadline
+
+        else:
+            deadline = utils.Deadline(self.timeout)
+
+        if self.workers > 1:
+            executor = pipeline.ThreadedExecutor(self.workers)
+
+        else:
+            executor = pipeline.SerialExecutor()
+
+        def on_timeout(tenant):
+            return {
+                "exception": f"{tenant['name']}: Error fetching probe "
+                             f"candidates: Timed out after "
+                             f"{deadline.timeout} seconds",
+                "status": 2
+            }
+
+        tenants_pipeline = self.tenants_pipeline = pipeline.Pipeline(
+            source=self._fetch_tenants, check=self._fetch_tenant_data,
+            filters=[pipeline.only_tenants(self.tokens.keys())],
+            executor=executor, deadline=deadline, on_timeout=on_timeout
+        )
+        results = tenants_pipeline.run()
+        self.perfdata = tenants_pipeline.perfdata()
 
         data = dict()
-        for tenant in tenants:
-            if tenant["name"] != utils.SUPERPOEM and \
-                    tenant["name"] in self.tokens.keys():
-                try:
-                    data.update({
-                        tenant["name"]: {
-                            "data": self._fetch_probe_candidates(tenant)
-                        }
-                    })
-
-                except RequestException as e:
-                    data.update({
-                        tenant["name"]: {
-                            "exception": str(e),
-                            "status": 2
-                        }
-                    })
-
-                except Exception as e:
-                    data.update({
-                        tenant["name"]: {
-                            "exception": f"{tenant['name']}: Error fetching "
-                                         f"probe candidates: {str(e)}",
-                            "status": 3
-                        }
-                    })
+        for tenant, result in results:
+            data.update({tenant["name"]: result})
 
         return data
 
@@ -135,6 +284,7 @@ class AnalyseProbeCandidates:
             }
 
         else:
+            start = time.monotonic()
             msg = "No action required"
             warning_msg = []
             critical_msg = []
@@ -149,13 +299,15 @@ class AnalyseProbeCandidates:
                     prefix = ""
 
                 if "data" in candidates:
-                    for candidate in candidates["data"]:
-                        time_difference = now - datetime.datetime.strptime(
-                            candidate["last_update"], "%Y-%m-%d %H:%M:%S"
-                        )
-
-                        time_difference = time_difference.days
-
+                    relevant = [
+                        candidate for candidate in candidates["data"]
+                        if candidate["status"] in RELEVANT_STATUSES
+                    ]
+                    self.state.update(tenant, relevant, now)
+                    ages = days_since(now, parse_timestamps(
+                        [candidate["last_update"] for candidate in relevant]
+                    ))
+                    for candidate, time_difference in zip(relevant, ages):
                         if time_difference == 1:
                             plural = ""
 
@@ -210,6 +362,8 @@ class AnalyseProbeCandidates:
                     if multi_tenant:
                         tenants_handle.add(tenant)
 
+            self.state.save()
+
             if multi_tenant:
                 if tenants_handle:
                     ext = ""
@@ -250,50 +404,42 @@ class AnalyseProbeCandidates:
             else:
                 msg_prefix = "UNKNOWN"
 
+            utils.add_phase("format", time.monotonic() - start)
+
             return {
                 "status": status,
                 "message": f"{msg_prefix} - {msg}"
             }
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        "ARGO probe that parses POEM api for presence of probe candidates and "
-        "checks their statuses"
-    )
-    parser.add_argument(
-        "-H", "--hostname", dest="hostname", type=str, required=True,
-        help="Name of the host"
-    )
-    parser.add_argument(
-        "-t", "--timeout", dest="timeout", type=float, default=30,
-        required=True, help="Seconds before connection times out (default: 30)"
-    )
-    parser.add_argument(
-        "-k", "--token", dest="token", type=str, nargs="+", action="append",
-        help="tenant token in form: <TENANT_NAME:token>"
-    )
-    parser.add_argument(
-        "--warn-processing", dest="warning_processing", type=float, default=1,
-        help="Days before probe returns warning if probe with status "
-             "'processing' is present (default: 1)"
-    )
-    parser.add_argument(
-        "--warn-testing", dest="warning_testing", type=float, default=3,
-        help="Days before probe returns warning if probe with status 'testing' "
-             "is present (default: 3)"
-    )
-    args = parser.parse_args()
+def main(args=None):
+    if args is None:
+        args = cli.probecandidates_parser().parse_args()
+
+    profiler = profiling.Profiler.from_args(args)
+    profiler.start()
 
     analysis = AnalyseProbeCandidates(
         hostname=args.hostname,
         timeout=args.timeout,
         tokens=args.token,
         warning_processing=args.warning_processing,
-        warning_testing=args.warning_testing
+        warning_testing=args.warning_testing,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        tenants_ttl=args.tenants_ttl,
+        deadline=utils.Deadline(args.timeout),
+        filter_candidates=args.filter_candidates
     )
 
-    output = analysis.get_status()
+    with profiler.collect("probecandidates", analysis):
+        output = analysis.get_status()
+
+    profiler.stop()
+
+    status = ProbeResponse(output["message"])
+    for item in analysis.perfdata:
+        status.add_perfdata(*item)
 
-    print(output["message"])
+    print(status.output())
     sys.exit(output["status"])
@@ -0,0 +1,214 @@
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from argo_probe_poem import cli, pipeline, profiling, utils
+from argo_probe_poem.probe_response import ProbeResponse
+from argo_probe_poem.tenants import SharedTenants
+
+
+class Runner:
+    def __init__(
+            self, hostname, timeout, workers=1, cache_dir=None,
+            tenants_ttl=300, profiler=None
+    ):
+        self.hostname = hostname
+        self.timeout = timeout
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.deadline = utils.Deadline(timeout)
+        self.client = utils.HTTPClient(
+            pool_size=max(workers, 10), timeout=timeout,
+            deadline=self.deadline
+        )
+        self.tenants = SharedTenants(
+            hostname=hostname, client=self.client, cache_dir=cache_dir,
+            ttl=tenants_ttl
+        )
+        self.checks = OrderedDict()
+        self.probes = OrderedDict()
+        if profiler:
+            self.profiler = profiler
+
+        else:
+            self.profiler = profiling.Profiler()
+
+    def _shared(self, **kwargs):
+        shared = {
+            "hostname": self.hostname,
+            "timeout": self.timeout,
+            "client": self.client,
+            "cache_dir": self.cache_dir,
+            "deadline": self.deadline,
+            "tenants": self.tenants
+        }
+        shared.update(kwargs)
+
+        return shared
+
+    def add_cert(self, cert, key, capath, skipped_tenants=None, **kwargs):
+        from argo_probe_poem.poem_cert import Certificate
+
+        check = Certificate(
+            cert=cert, key=key, capath=capath,
+            skipped_tenants=skipped_tenants, workers=self.workers,
+            **self._shared(**kwargs)
+        )
+        self.checks["cert"] = check.check
+        self.probes["cert"] = check
+
+    def add_metricapi(self, mandatory_metrics, skipped_tenants=None, **kwargs):
+        from argo_probe_poem.poem_metricapi import Metrics
+
+        check = Metrics(
+            mandatory_metrics=mandatory_metrics,
+            skipped_tenants=skipped_tenants, **self._shared(**kwargs)
+        )
+        self.checks["metricapi"] = check.check
+        self.probes["metricapi"] = check
+
+    def add_probecandidates(
+            self, tokens, warning_processing, warning_testing, **kwargs
+    ):
+        from argo_probe_poem.poem_probecandidates import \
+            AnalyseProbeCandidates
+
+        check = AnalyseProbeCandidates(
+            tokens=tokens, warning_processing=warning_processing,
+            warning_testing=warning_testing, workers=self.workers,
+            **self._shared(**kwargs)
+        )
+
+        def get_status():
+            status = check.get_status()
+            response = ProbeResponse(status["message"])
+            for item in check.perfdata:
+                response.add_perfdata(*item)
+
+            return status["status"], response.output()
+
+        self.checks["probecandidates"] = get_status
+        self.probes["probecandidates"] = check
+
+    def _run_check(self, name):
+        try:
+            with self.profiler.collect(name, self.probes[name]):
+                result = self.checks[name]()
+
+        except Exception as e:
+            status = ProbeResponse()
+            status.unknown(str(e))
+            result = status
+
+        if isinstance(result, ProbeResponse):
+            return result.code(), result.output()
+
+        return result
+
+    def run(self):
+        if not self.checks:
+            return OrderedDict()
+
+        with ThreadPoolExecutor(max_workers=len(self.checks)) as executor:
+            results = list(executor.map(self._run_check, self.checks.keys()))
+
+        return OrderedDict(zip(self.checks.keys(), results))
+
+
+def worst_code(codes):
+    return max(
+        codes, key=pipeline.Aggregator.SEVERITY.index,
+        default=ProbeResponse.OK
+    )
+
+
+def passive_check_result(host, service, code, msg, timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+
+    output = msg.replace("\n", "\\n")
+
+    return f"[{int(timestamp)}] PROCESS_SERVICE_CHECK_RESULT;{host};" \
+           f"{service};{code};{output}"
+
+
+def main(args=None):
+    if args is None:
+        args = cli.runner_args()
+
+    services = args.services
+    profiler = profiling.Profiler.from_args(args)
+    profiler.start()
+
+    runner = Runner(
+        hostname=args.hostname,
+        timeout=args.timeout,
+        workers=args.workers,
+        cache_dir=args.cache_dir,
+        tenants_ttl=args.tenants_ttl,
+        profiler=profiler
+    )
+
+    if "cert" in args.checks:
+        runner.add_cert(
+            cert=args.cert,
+            key=args.key,
+            capath=args.capath,
+            skipped_tenants=args.skipped_tenants,
+            dns_timeout=args.dns_timeout,
+            connect_timeout=args.connect_timeout
+        )
+
+    if "metricapi" in args.checks:
+        runner.add_metricapi(
+            mandatory_metrics=args.mandatory_metrics,
+            skipped_tenants=args.skipped_tenants,
+            engine=args.engine,
+            max_per_host=args.max_per_host,
+            deadline=utils.Deadline(min(args.deadline, args.timeout))
+            if args.deadline else runner.deadline,
+            stream=args.stream,
+            early_exit=args.early_exit
+        )
+
+    if "probecandidates" in args.checks:
+        runner.add_probecandidates(
+            tokens=args.token,
+            warning_processing=args.warning_processing,
+            warning_testing=args.warning_testing,
+            filter_candidates=args.filter_candidates
+        )
+
+    results = runner.run()
+    profiler.stop()
+
+    timestamp = time.time()
+    lines = [
+        passive_check_result(
+            args.hostname, services[check], code, msg, timestamp
+        ) for check, (code, msg) in results.items()
+    ]
+
+    if args.command_file:
+        with open(args.command_file, "a") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+
+    else:
+        print("\n".join(lines))
+
+    if args.results_file:
+        utils.write_json_atomic(args.results_file, {
+            check: {
+                "service": services[check],
+                "status": code,
+                "message": msg,
+                "timestamp": int(timestamp)
+            } for check, (code, msg) in results.items()
+        })
+
+    sys.exit(worst_code([code for code, msg in results.values()]))
+
+
+if __name__ == "__main__":
+    main()
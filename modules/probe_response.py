@@ -7,6 +7,7 @@ class ProbeResponse:
     def __init__(self, msg=""):
         self._code = self.OK
         self._msg = msg
+        self._perfdata = list()
 
     def warning(self, msg):
         self._msg = f"WARNING - {msg}"
@@ -29,3 +30,47 @@ class ProbeResponse:
 
     def msg(self):
         return self._msg
+
+    def add_perfdata(
+            self, label, value, uom="", warn="", crit="", minimum="",
+            maximum=""
+    ):
+        self._perfdata.append(
+            (label, value, uom, warn, crit, minimum, maximum)
+        )
+
+    @staticmethod
+    def _format_label(label):
+        label = str(label).replace("=", "_").replace("'", "''")
+        if " " in label or "''" in label:
+            return f"'{label}'"
+
+        return label
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float):
+            return f"{value:.3f}"
+
+        return str(value)
+
+    def perfdata(self):
+        items = list()
+        for label, value, uom, *thresholds in self._perfdata:
+            item = f"{self._format_label(label)}={self._format_value(value)}" \
+                   f"{uom};" + ";".join(
+                       self._format_value(threshold)
+                       for threshold in thresholds
+                   )
+            items.append(item.rstrip(";"))
+
+        return " ".join(items)
+
+    def output(self):
+        perfdata = self.perfdata()
+        if not perfdata:
+            return self._msg
+
+        first, separator, rest = self._msg.partition("\n")
+
+        return f"{first} | {perfdata}{separator}{rest}"
@@ -0,0 +1,180 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from argo_probe_poem import utils
+
+PROBE_ROW = "(probe)"
+
+TENANTS_ROW = "(tenants)"
+
+
+class Profiler:
+    def __init__(self, path=None, pstats_path=None, tracemalloc_top=0):
+        self.path = path
+        self.pstats_path = pstats_path
+        self.tracemalloc_top = tracemalloc_top
+        self.checks = OrderedDict()
+        self.started = None
+        self.elapsed = None
+        self._profiles = list()
+        self._snapshot = None
+        self._peak = None
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(
+            path=getattr(args, "profile", None),
+            pstats_path=getattr(args, "profile_pstats", None),
+            tracemalloc_top=getattr(args, "profile_tracemalloc", 0) or 0
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.pstats_path)
+
+    @property
+    def _tracing(self):
+        return bool(self.path and self.tracemalloc_top)
+
+    def _profile_thread(self, *args):
+        import cProfile
+
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if not self.enabled:
+            return
+
+        utils.enable_phases()
+        self.started = time.monotonic()
+
+        if self._tracing:
+            import tracemalloc
+
+            tracemalloc.start()
+
+        if self.pstats_path:
+            import cProfile
+
+            profile = cProfile.Profile()
+            self._profiles.append(profile)
+            if sys.version_info < (3, 12):
+                threading.setprofile(self._profile_thread)
+
+            profile.enable()
+
+    def stop(self):
+        if not self.enabled:
+            return
+
+        self.elapsed = time.monotonic() - self.started
+
+        if self._tracing:
+            import tracemalloc
+
+            self._snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(
+                    False, "<frozen importlib._bootstrap_external>"
+                ),
+                tracemalloc.Filter(False, tracemalloc.__file__)
+            ])
+            self._peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        if self.pstats_path:
+            import pstats
+
+            threading.setprofile(None)
+            self._profiles[0].disable()
+            pstats.Stats(*self._profiles).dump_stats(self.pstats_path)
+
+        utils.enable_phases(False)
+
+        if self.path:
+            with open(self.path, "w") as f:
+                f.write(self.report())
+
+    def add(self, name, stats, tenants_pipeline=None):
+        tenants = OrderedDict()
+        if tenants_pipeline is not None:
+            tenants = tenants_pipeline.stats
+
+        self.checks[name] = (stats, tenants)
+
+    @contextmanager
+    def collect(self, name, probe):
+        stats = utils.Stats()
+        start = time.monotonic()
+        try:
+            with utils.collect_stats(stats):
+                yield stats
+
+        finally:
+            stats.set("time", time.monotonic() - start)
+            self.add(name, stats, probe.tenants_pipeline)
+
+    @staticmethod
+    def _format_row(name, phases, total):
+        columns = [
+            "-" if phases.get(phase) is None else f"{phases[phase]:.4f}"
+            for phase in utils.PHASES
+        ]
+        columns.append("-" if total is None else f"{total:.4f}")
+
+        return f"{name:32} " + " ".join(f"{column:>9}" for column in columns)
+
+    def _check_report(self, name, stats, tenants):
+        lines = [
+            f"check: {name}",
+            f"{'tenant':32} " + " ".join(
+                f"{phase:>9}" for phase in utils.PHASES + ("total",)
+            ),
+            self._format_row(PROBE_ROW, stats.phases, stats.get("time"))
+        ]
+
+        summed = OrderedDict()
+        for tenant, tenant_stats in tenants.items():
+            lines.append(self._format_row(
+                tenant, tenant_stats.phases, tenant_stats.get("time")
+            ))
+            for phase, seconds in tenant_stats.phases.items():
+                summed[phase] = summed.get(phase, 0) + seconds
+
+        if tenants:
+            lines.append(self._format_row(TENANTS_ROW, summed, sum(
+                tenant_stats.get("time", 0)
+                for tenant_stats in tenants.values()
+            )))
+
+        return lines
+
+    def _tracemalloc_report(self):
+        lines = [
+            f"tracemalloc: peak {self._peak / 1024:.1f} KiB, top "
+            f"{self.tracemalloc_top} allocations"
+        ]
+        for statistic in self._snapshot.statistics("lineno")[
+                :self.tracemalloc_top
+        ]:
+            lines.append(str(statistic))
+
+        return lines
+
+    def report(self):
+        lines = [f"elapsed: {self.elapsed or 0:.4f} s", ""]
+        for name, (stats, tenants) in sorted(self.checks.items()):
+            lines.extend(self._check_report(name, stats, tenants))
+            lines.append("")
+
+        if self._snapshot is not None:
+            lines.extend(self._tracemalloc_report())
+            lines.append("")
+
+        return "\n".join(lines)
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import requests
+from argo_probe_poem import pipeline, utils
+
+
+class TenantFetchException(utils.POEMException):
+    def __init__(self, reason):
+        self.reason = reason
+        self.msg = f"Tenant fetch error: {reason}"
+
+
+class Tenants:
+    def __init__(
+            self, hostname, client, cache_dir=None, ttl=300, max_stale=86400
+    ):
+        self.hostname = hostname
+        self.client = client
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_stale = max_stale
+
+    @property
+    def cache_file(self):
+        return os.path.join(self.cache_dir, f"tenants-{self.hostname}.json")
+
+    def _fetch(self):
+        try:
+            response = self.client.get(
+                f"https://{self.hostname}{utils.TENANT_API}"
+            )
+
+            if not response.ok:
+                reason = f"{response.status_code} {response.reason}"
+
+                try:
+                    reason = f"{reason}: {response.json()['detail']}"
+
+                except (ValueError, TypeError, KeyError):
+                    pass
+
+                raise TenantFetchException(reason)
+
+            else:
+                return list(utils.iter_items(response, client=self.client))
+
+        except requests.exceptions.RequestException as e:
+            raise TenantFetchException(str(e))
+
+    def _read_cache(self):
+        try:
+            cached = utils.read_json(self.cache_file)
+            return time.time() - cached["timestamp"], cached["tenants"]
+
+        except (OSError, ValueError, TypeError, KeyError):
+            return None, None
+
+    def _write_cache(self, tenants):
+        try:
+            utils.write_json_atomic(
+                self.cache_file, {"timestamp": time.time(), "tenants": tenants}
+            )
+
+        except OSError:
+            pass
+
+    def fetch(self):
+        if not self.cache_dir or self.ttl <= 0:
+            return self._fetch()
+
+        age, cached_tenants = self._read_cache()
+        if cached_tenants is not None and 0 <= age < self.ttl:
+            return cached_tenants
+
+        try:
+            tenants = self._fetch()
+
+        except TenantFetchException:
+            if cached_tenants is not None and 0 <= age < self.max_stale:
+                return cached_tenants
+
+            raise
+
+        self._write_cache(tenants)
+
+        return tenants
+
+    def get(self, skipped_tenants=None):
+        accept = pipeline.skip_tenants(skipped_tenants)
+
+        return [item for item in self.fetch() if accept(item)]
+
+
+class SharedTenants(Tenants):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._tenants = None
+
+    def fetch(self):
+        with self._lock:
+            if self._tenants is None:
+                self._tenants = super().fetch()
+
+            return self._tenants
@@ -1,9 +1,47 @@
+import errno
+import json
+import os
+import select
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3 import connectionpool
+from requests.packages.urllib3.exceptions import ConnectTimeoutError
+from requests.packages.urllib3.util.connection import allowed_gai_family
+from requests.packages.urllib3.util.ssl_ import create_urllib3_context, \
+    resolve_cert_reqs
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+
+try:
+    import ijson
+
+except ImportError:
+    ijson = None
+
 MIP_API = '/api/v2/metrics'
 TENANT_API = '/api/v2/internal/public_tenants'
 METRICS_API = '/api/v2/internal/public_metric'
 
 SUPERPOEM = 'SuperPOEM Tenant'
 
+RETRY_STATUSES = (502, 503, 504)
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+CONNECTION_ATTEMPT_DELAY = 0.25
+
+PHASES = ("dns", "connect", "tls", "ttfb", "download", "decode", "format")
+
+CONNECTION_PHASES = ("dns", "connect", "tls")
+
 
 class POEMException(Exception):
     def __init__(self, msg):
@@ -11,3 +49,724 @@ class POEMException(Exception):
 
     def __str__(self):
         return f"POEM: {str(self.msg)}"
+
+
+class Deadline:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires = time.monotonic() + timeout
+
+    def remaining(self):
+        return max(self.expires - time.monotonic(), 0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, timeout=None):
+        remaining = self.remaining()
+        if timeout is None:
+            return remaining
+
+        return min(timeout, remaining)
+
+
+class Stats:
+    def __init__(self):
+        self.values = OrderedDict()
+        self.phases = OrderedDict()
+
+    def add(self, name, value):
+        self.values[name] = self.values.get(name, 0) + value
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def get(self, name, default=None):
+        return self.values.get(name, default)
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+
+_local = threading.local()
+
+_phases = {"enabled": False}
+
+
+def enable_phases(enabled=True):
+    _phases["enabled"] = enabled
+
+
+def phases_enabled():
+    return _phases["enabled"]
+
+
+def current_stats():
+    return getattr(_local, "stats", None)
+
+
+@contextmanager
+def collect_stats(stats):
+    previous = current_stats()
+    _local.stats = stats
+    try:
+        yield stats
+
+    finally:
+        _local.stats = previous
+
+
+def add_stat(name, value):
+    stats = current_stats()
+    if stats is not None:
+        stats.add(name, value)
+
+
+def set_stat(name, value):
+    stats = current_stats()
+    if stats is not None:
+        stats.set(name, value)
+
+
+def add_phase(name, seconds):
+    if _phases["enabled"]:
+        stats = current_stats()
+        if stats is not None:
+            stats.add_phase(name, seconds)
+
+
+@contextmanager
+def phase(name):
+    if not _phases["enabled"]:
+        yield
+        return
+
+    start = time.monotonic()
+    try:
+        yield
+
+    finally:
+        add_phase(name, time.monotonic() - start)
+
+
+def connection_budgets():
+    return getattr(_local, "budgets", None) or (None, None)
+
+
+@contextmanager
+def limit_connection(dns_timeout=None, connect_timeout=None):
+    previous = getattr(_local, "budgets", None)
+    _local.budgets = (dns_timeout, connect_timeout)
+    try:
+        yield
+
+    finally:
+        _local.budgets = previous
+
+
+def _connection_time():
+    stats = current_stats()
+    if stats is None:
+        return 0
+
+    return sum(stats.phases.get(name, 0) for name in CONNECTION_PHASES)
+
+
+class SessionSSLContext(ssl.SSLContext):
+    @classmethod
+    def create(cls):
+        context = create_urllib3_context()
+        context.__class__ = cls
+        context._sessions = dict()
+        context._loaded = set()
+        context._lock = threading.Lock()
+
+        return context
+
+    def _load_once(self, key, load, *args):
+        with self._lock:
+            if key not in self._loaded:
+                load(*args)
+                self._loaded.add(key)
+
+    def load_verify_locations(self, cafile=None, capath=None, cadata=None):
+        self._load_once(
+            ("verify", cafile, capath, cadata), super().load_verify_locations,
+            cafile, capath, cadata
+        )
+
+    def load_cert_chain(self, certfile, keyfile=None, password=None):
+        self._load_once(
+            ("cert", certfile, keyfile, password), super().load_cert_chain,
+            certfile, keyfile, password
+        )
+
+    def session(self, hostname):
+        with self._lock:
+            return self._sessions.get(hostname)
+
+    def save_session(self, sock):
+        session = getattr(sock, "session", None)
+        if session is not None and sock.server_hostname:
+            with self._lock:
+                self._sessions[sock.server_hostname] = session
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if kwargs.get("session") is None and kwargs.get("server_hostname"):
+            kwargs["session"] = self.session(kwargs["server_hostname"])
+
+        sock = super().wrap_socket(sock, *args, **kwargs)
+        self.save_session(sock)
+
+        return sock
+
+
+_ssl_contexts = dict()
+
+_ssl_contexts_lock = threading.Lock()
+
+
+def session_ssl_context(ca_certs=None, ca_cert_dir=None, cert_file=None,
+                        key_file=None):
+    if not ca_certs and not ca_cert_dir:
+        ca_certs = DEFAULT_CA_BUNDLE_PATH
+
+    key = (ca_certs, ca_cert_dir, cert_file, key_file)
+    with _ssl_contexts_lock:
+        if key not in _ssl_contexts:
+            context = SessionSSLContext.create()
+            context.load_verify_locations(ca_certs, ca_cert_dir)
+            _ssl_contexts[key] = context
+
+        return _ssl_contexts[key]
+
+
+class _ConnectionMixin:
+    _connect_time = 0
+
+    def _resolve(self, dns_timeout):
+        host = getattr(self, "_dns_host", None)
+        if host is None:
+            return []
+
+        with phase("dns"):
+            try:
+                return resolve(
+                    host, self.port, dns_timeout, family=allowed_gai_family()
+                )
+
+            except socket.timeout:
+                raise ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. "
+                          f"(dns timeout={dns_timeout})"
+                )
+
+            except socket.error:
+                return []
+
+    def _new_limited_conn(self, dns_timeout, connect_timeout):
+        addresses = self._resolve(dns_timeout)
+        if not addresses:
+            with phase("connect"):
+                return super()._new_conn()
+
+        expires = None
+        if connect_timeout is not None:
+            expires = time.monotonic() + connect_timeout
+
+        host, timeout = self._dns_host, self.timeout
+        error = None
+        try:
+            for address in addresses:
+                if expires is not None:
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        break
+
+                    if isinstance(timeout, (int, float)):
+                        remaining = min(timeout, remaining)
+
+                    self.timeout = remaining
+
+                self._dns_host = address[4][0]
+                try:
+                    with phase("connect"):
+                        return super()._new_conn()
+
+                except ConnectTimeoutError as e:
+                    error = e
+
+        finally:
+            self._dns_host, self.timeout = host, timeout
+
+        if error is None:
+            error = ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. "
+                      f"(connect timeout={connect_timeout})"
+            )
+
+        raise error
+
+    def _new_conn(self):
+        start = time.monotonic()
+        try:
+            dns_timeout, connect_timeout = connection_budgets()
+            if _phases["enabled"] or dns_timeout is not None or \
+                    connect_timeout is not None:
+                return self._new_limited_conn(dns_timeout, connect_timeout)
+
+            return super()._new_conn()
+
+        finally:
+            self._connect_time = time.monotonic() - start
+
+
+class HTTPConnection(
+        _ConnectionMixin, connectionpool.HTTPConnectionPool.ConnectionCls
+):
+    pass
+
+
+class HTTPSConnection(
+        _ConnectionMixin, connectionpool.HTTPSConnectionPool.ConnectionCls
+):
+    def connect(self):
+        if resolve_cert_reqs(self.cert_reqs) == ssl.CERT_REQUIRED:
+            self.ssl_context = session_ssl_context(
+                self.ca_certs, self.ca_cert_dir, self.cert_file,
+                self.key_file
+            )
+
+        start = time.monotonic()
+        self._connect_time = 0
+        super().connect()
+        handshake = time.monotonic() - start - self._connect_time
+        add_stat("handshake", handshake)
+        add_phase("tls", handshake)
+
+    def close(self):
+        if isinstance(self.ssl_context, SessionSSLContext) and \
+                self.sock is not None:
+            self.ssl_context.save_session(self.sock)
+
+        super().close()
+
+
+class HTTPConnectionPool(connectionpool.HTTPConnectionPool):
+    ConnectionCls = HTTPConnection
+
+
+class HTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+    ConnectionCls = HTTPSConnection
+
+
+class POEMHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": HTTPConnectionPool,
+            "https": HTTPSConnectionPool
+        }
+
+
+class HTTPClient:
+    def __init__(self, pool_size=10, retries=2, backoff_factor=0.5,
+                 timeout=None, deadline=None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.session = requests.Session()
+
+        adapter = POEMHTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _request(self, url, **kwargs):
+        connection_time = _connection_time() if _phases["enabled"] else 0
+        start = time.monotonic()
+        response = self.session.get(url, **kwargs)
+        latency = time.monotonic() - start
+        add_stat("latency", latency)
+
+        if _phases["enabled"]:
+            ttfb = response.elapsed.total_seconds()
+            add_phase(
+                "ttfb", max(ttfb - _connection_time() + connection_time, 0)
+            )
+            if not kwargs.get("stream"):
+                add_phase("download", max(latency - ttfb, 0))
+
+        return response
+
+    def _should_retry(self, attempt):
+        if attempt >= self.retries:
+            return False
+
+        if self.deadline is None:
+            return True
+
+        return self.backoff_factor * 2 ** attempt < self.deadline.remaining()
+
+    def get(self, url, dns_timeout=None, connect_timeout=None, **kwargs):
+        if self.timeout is not None:
+            kwargs.setdefault("timeout", self.timeout)
+
+        timeout = kwargs.get("timeout")
+        budgets = (dns_timeout, connect_timeout)
+        attempt = 0
+        while True:
+            if self.deadline is not None:
+                if self.deadline.expired():
+                    raise requests.exceptions.Timeout(
+                        f"Deadline of {self.deadline.timeout} seconds exceeded"
+                    )
+
+                kwargs["timeout"] = self.deadline.budget(timeout)
+                if dns_timeout is not None or connect_timeout is not None:
+                    budgets = (
+                        self.deadline.budget(dns_timeout),
+                        self.deadline.budget(connect_timeout)
+                    )
+
+            try:
+                with limit_connection(*budgets):
+                    response = self._request(url, **kwargs)
+
+            except requests.exceptions.SSLError:
+                raise
+
+            except requests.exceptions.ConnectionError:
+                if not self._should_retry(attempt):
+                    raise
+
+            else:
+                if response.status_code not in RETRY_STATUSES or \
+                        not self._should_retry(attempt):
+                    return response
+
+                response.close()
+
+            time.sleep(self.backoff_factor * 2 ** attempt)
+            attempt += 1
+
+    def iter_items(self, url, field=None, params=None, **kwargs):
+        if params:
+            response = self.get(url, params=params, **kwargs)
+
+        else:
+            response = self.get(url, **kwargs)
+
+        _raise_for_status(response)
+
+        return iter_items(response, client=self, field=field, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+class ResponseStream:
+    def __init__(self, response):
+        self._chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+
+    def read(self, size=-1):
+        if size == 0:
+            return b""
+
+        if not _phases["enabled"]:
+            return next(self._chunks, b"")
+
+        start = time.monotonic()
+        chunk = next(self._chunks, b"")
+        add_phase("download", time.monotonic() - start)
+
+        return chunk
+
+
+def downloaded_bytes(response):
+    try:
+        count = response.raw.tell()
+
+    except AttributeError:
+        return 0
+
+    return count if isinstance(count, int) else 0
+
+
+def _raise_for_status(response):
+    try:
+        response.raise_for_status()
+
+    except Exception:
+        response.close()
+        raise
+
+
+def _iter_events(events, page, field=None):
+    target = None
+    for prefix, event, value in events:
+        if target is None:
+            if event == "start_array":
+                target = "item"
+
+            else:
+                target = "results.item"
+
+            if field:
+                target = f"{target}.{field}"
+
+            continue
+
+        if prefix == "next" and event in ("string", "null"):
+            page["next"] = value
+
+        elif prefix == target and event in ("start_map", "start_array"):
+            builder = ijson.ObjectBuilder()
+            end_event = event.replace("start", "end")
+            while (prefix, event) != (target, end_event):
+                builder.event(event, value)
+                prefix, event, value = next(events)
+
+            builder.event(event, value)
+
+            yield builder.value
+
+        elif prefix == target and event not in ("map_key", "end_map",
+                                                "end_array"):
+            yield value
+
+
+def _iter_decoded(items):
+    stats = current_stats()
+    if stats is None:
+        yield from items
+        return
+
+    end = object()
+    while True:
+        start = time.monotonic()
+        downloaded = stats.phases.get("download", 0)
+        item = next(items, end)
+        stats.add_phase(
+            "decode", time.monotonic() - start -
+            stats.phases.get("download", 0) + downloaded
+        )
+        if item is end:
+            return
+
+        yield item
+
+
+def _iter_page(response, page, field=None, stream=False):
+    if stream:
+        items = _iter_events(
+            ijson.parse(
+                ResponseStream(response), buf_size=STREAM_CHUNK_SIZE,
+                use_float=True
+            ), page, field
+        )
+        if _phases["enabled"]:
+            items = _iter_decoded(items)
+
+        yield from items
+
+    else:
+        with phase("decode"):
+            data = response.json()
+
+        if isinstance(data, dict):
+            page["next"] = data.get("next")
+            data = data.get("results", [])
+
+        for item in data:
+            yield item[field] if field else item
+
+
+def iter_items(response, client=None, field=None, **kwargs):
+    stream = kwargs.get("stream", False) and ijson is not None
+    while True:
+        page = dict()
+        try:
+            yield from _iter_page(response, page, field=field, stream=stream)
+
+        finally:
+            response.close()
+            add_stat("bytes", downloaded_bytes(response))
+
+        if not page.get("next") or client is None:
+            return
+
+        response = client.get(urljoin(response.url, page["next"]), **kwargs)
+        _raise_for_status(response)
+
+
+def read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json_atomic(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+
+        except OSError:
+            pass
+
+        raise
+
+
+def split_host_port(address, default_port=443):
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit() or \
+            (":" in host and not host.endswith("]")):
+        host, port = address, default_port
+
+    return host.lstrip("[").rstrip("]"), int(port)
+
+
+def resolve(host, port, timeout=None, family=0):
+    if timeout is None:
+        return socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+
+    result = {}
+
+    def lookup():
+        try:
+            result["addresses"] = socket.getaddrinfo(
+                host, port, family, socket.SOCK_STREAM
+            )
+
+        except socket.error as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=lookup, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    if thread.is_alive():
+        raise socket.timeout(
+            f"DNS lookup of {host} timed out after {timeout} seconds"
+        )
+
+    if "error" in result:
+        raise result["error"]
+
+    return result["addresses"]
+
+
+def interleave_addresses(addresses):
+    families = []
+    by_family = {}
+    for address in addresses:
+        if address[0] not in by_family:
+            families.append(address[0])
+            by_family[address[0]] = []
+
+        by_family[address[0]].append(address)
+
+    if socket.AF_INET6 in families:
+        families.remove(socket.AF_INET6)
+        families.insert(0, socket.AF_INET6)
+
+    interleaved = []
+    while any(by_family.values()):
+        for family in families:
+            if by_family[family]:
+                interleaved.append(by_family[family].pop(0))
+
+    return interleaved
+
+
+def create_connection(host, port, dns_timeout=None, connect_timeout=None,
+                      delay=CONNECTION_ATTEMPT_DELAY):
+    start = time.monotonic()
+    addresses = interleave_addresses(resolve(host, port, dns_timeout))
+    add_phase("dns", time.monotonic() - start)
+    start = time.monotonic()
+    if not addresses:
+        raise socket.error(f"No addresses found for {host}")
+
+    deadline = None
+    if connect_timeout is not None:
+        deadline = time.monotonic() + connect_timeout
+
+    pending = {}
+    error = None
+    connected = None
+    next_attempt = time.monotonic()
+    try:
+        while connected is None:
+            now = time.monotonic()
+            if addresses and (now >= next_attempt or not pending):
+                family, type_, proto, _, address = addresses.pop(0)
+                try:
+                    sock = socket.socket(family, type_, proto)
+
+                except OSError as e:
+                    error = e
+                    continue
+
+                sock.setblocking(False)
+                code = sock.connect_ex(address)
+                if code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    pending[sock] = address
+                    next_attempt = now + delay
+
+                else:
+                    error = socket.error(code, os.strerror(code))
+                    sock.close()
+
+                continue
+
+            if not pending:
+                raise error
+
+            wait = None
+            if deadline is not None:
+                if now >= deadline:
+                    raise socket.timeout(
+                        f"Connection to {host} timed out after "
+                        f"{connect_timeout} seconds"
+                    )
+
+                wait = deadline - now
+
+            if addresses:
+                wait = max(next_attempt - now, 0) if wait is None else \
+                    max(min(wait, next_attempt - now), 0)
+
+            _, writable, _ = select.select([], list(pending), [], wait)
+            for sock in writable:
+                del pending[sock]
+                code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if code == 0:
+                    connected = sock
+                    break
+
+                error = socket.error(code, os.strerror(code))
+                sock.close()
+                next_attempt = time.monotonic()
+
+    finally:
+        for sock in pending:
+            sock.close()
+
+    add_phase("connect", time.monotonic() - start)
+
+    return connected
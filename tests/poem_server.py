@@ -0,0 +1,454 @@
+import datetime
+import hashlib
+import ipaddress
+import json
+import os
+import random
+import selectors
+import shutil
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+from OpenSSL import crypto
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from argo_probe_poem import utils
+
+PROBES_API = "/api/v2/probes/"
+
+
+def synthetic_metrics(count, prefix="argo.Synthetic-Check"):
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def synthetic_probe(name, status, days_ago=0):
+    timestamp = (
+        datetime.datetime.now() - datetime.timedelta(days=days_ago)
+    ).strftime("%Y-%m-%d %H:%M:%S")
+
+    return {
+        "name": name,
+        "status": status,
+        "created": timestamp,
+        "last_update": timestamp
+    }
+
+
+class CertificateAuthority:
+    def __init__(self, directory):
+        self.directory = directory
+        self.capath = os.path.join(directory, "certificates")
+        self.bundle = os.path.join(directory, "ca.pem")
+        os.makedirs(self.capath, exist_ok=True)
+
+        self._key = self._generate_key()
+        name = x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, "POEM fixture CA")
+        ])
+        now = datetime.datetime.utcnow()
+        self.certificate = x509.CertificateBuilder().subject_name(
+            name
+        ).issuer_name(
+            name
+        ).public_key(
+            self._key.public_key()
+        ).serial_number(
+            x509.random_serial_number()
+        ).not_valid_before(
+            now - datetime.timedelta(days=1)
+        ).not_valid_after(
+            now + datetime.timedelta(days=3650)
+        ).add_extension(
+            x509.BasicConstraints(ca=True, path_length=None), critical=True
+        ).sign(self._key, hashes.SHA256(), default_backend())
+
+        pem = self.certificate.public_bytes(serialization.Encoding.PEM)
+        with open(self.bundle, "wb") as f:
+            f.write(pem)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            subject_hash = crypto.load_certificate(
+                crypto.FILETYPE_PEM, pem
+            ).get_subject().hash()
+
+        shutil.copy(
+            self.bundle, os.path.join(self.capath, f"{subject_hash:08x}.0")
+        )
+
+    @staticmethod
+    def _generate_key():
+        return ec.generate_private_key(ec.SECP256R1(), default_backend())
+
+    def issue(self, common_name, alt_names=None, not_after=365):
+        key = self._generate_key()
+        sans = list()
+        for name in alt_names if alt_names is not None else [common_name]:
+            try:
+                sans.append(x509.IPAddress(ipaddress.ip_address(name)))
+
+            except ValueError:
+                sans.append(x509.DNSName(name))
+
+        now = datetime.datetime.utcnow()
+        builder = x509.CertificateBuilder().subject_name(
+            x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+        ).issuer_name(
+            self.certificate.subject
+        ).public_key(
+            key.public_key()
+        ).serial_number(
+            x509.random_serial_number()
+        ).not_valid_before(
+            min(now, now + datetime.timedelta(days=not_after)) -
+            datetime.timedelta(days=1)
+        ).not_valid_after(
+            now + datetime.timedelta(days=not_after)
+        )
+        if sans:
+            builder = builder.add_extension(
+                x509.SubjectAlternativeName(sans), critical=False
+            )
+
+        certificate = builder.sign(
+            self._key, hashes.SHA256(), default_backend()
+        )
+
+        prefix = os.path.join(
+            self.directory, hashlib.sha1(
+                f"{common_name}-{time.monotonic()}".encode("utf-8")
+            ).hexdigest()
+        )
+        with open(f"{prefix}.pem", "wb") as f:
+            f.write(certificate.public_bytes(serialization.Encoding.PEM))
+
+        with open(f"{prefix}.key", "wb") as f:
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption()
+            ))
+
+        return f"{prefix}.pem", f"{prefix}.key"
+
+
+class FixtureTenant:
+    def __init__(
+            self, name, metrics=None, probes=None, token=None, latency=0,
+            error_rate=0, error_status=500, hang=False, drip=0,
+            redirect=None, page_size=None,
+            filter_status=True, etag=True, not_after=365, alt_names=None,
+            padding=0, seed=None
+    ):
+        self.name = name
+        self.metrics = list(metrics) if metrics is not None else []
+        self.probes = list(probes) if probes is not None else []
+        self.token = token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang = hang
+        self.drip = drip
+        self.redirect = redirect
+        self.page_size = page_size
+        self.filter_status = filter_status
+        self.etag = etag
+        self.not_after = not_after
+        self.alt_names = alt_names
+        self.padding = padding
+        self.random = random.Random(seed if seed is not None else name)
+        self.address = None
+        self.requests = list()
+        self.bodies = dict()
+        self._lock = threading.Lock()
+
+    @property
+    def domain_url(self):
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def record(self, path):
+        with self._lock:
+            self.requests.append(path)
+
+    def fails(self):
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, fixture, tenant, context):
+        self.fixture = fixture
+        self.tenant = tenant
+        self.context = context
+        HTTPServer.__init__(self, address, _Handler)
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self.context.wrap_socket(
+            sock, server_side=True, do_handshake_on_connect=False
+        ), address
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connection.settimeout(self.server.fixture.handshake_timeout)
+        try:
+            self.connection.do_handshake()
+            self.connection.settimeout(None)
+
+        except (ssl.SSLError, OSError):
+            self.close_connection = True
+            self.rfile = self.wfile = None
+
+    def handle(self):
+        if self.rfile is not None:
+            BaseHTTPRequestHandler.handle(self)
+
+    def finish(self):
+        if self.rfile is not None:
+            BaseHTTPRequestHandler.finish(self)
+
+    def _send_json(self, status, data, headers=None):
+        body = data if isinstance(data, bytes) else \
+            json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self._write(body)
+
+    def _write(self, body):
+        fixture = self.server.fixture
+        tenant = self.server.tenant
+        if not tenant.drip:
+            self.wfile.write(body)
+            return
+
+        for i in range(len(body)):
+            self.wfile.write(body[i:i + 1])
+            self.wfile.flush()
+            if fixture.stopped.wait(tenant.drip):
+                self.close_connection = True
+                return
+
+    def _send_page(self, items, query, headers=None):
+        tenant = self.server.tenant
+        body = tenant.bodies.get(self.path)
+        if body is None:
+            if tenant.page_size is None:
+                data = items()
+
+            else:
+                items = items()
+                page = int(query.get("page", ["1"])[0])
+                start = (page - 1) * tenant.page_size
+                end = start + tenant.page_size
+                data = {
+                    "results": items[start:end],
+                    "next": f"{urlparse(self.path).path}?page={page + 1}"
+                    if end < len(items) else None
+                }
+
+            body = tenant.bodies[self.path] = json.dumps(data).encode("utf-8")
+
+        self._send_json(200, body, headers)
+
+    def _send_metrics(self, query):
+        tenant = self.server.tenant
+        headers = dict()
+        if tenant.etag:
+            etag = '"{}"'.format(hashlib.sha256(
+                "\n".join(tenant.metrics).encode("utf-8")
+            ).hexdigest())
+            headers["ETag"] = etag
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        def items():
+            if tenant.padding:
+                description = "x" * tenant.padding
+                return [
+                    {"name": name, "description": description}
+                    for name in tenant.metrics
+                ]
+
+            return [{"name": name} for name in tenant.metrics]
+
+        self._send_page(items, query, headers)
+
+    def _send_probes(self, query):
+        tenant = self.server.tenant
+        if self.headers.get("x-api-key") != tenant.token:
+            self._send_json(401, {"detail": "Invalid token"})
+            return
+
+        def items():
+            if tenant.filter_status and "status" in query:
+                return [
+                    probe for probe in tenant.probes
+                    if probe["status"] in query["status"]
+                ]
+
+            return tenant.probes
+
+        self._send_page(items, query)
+
+    def do_GET(self):
+        fixture = self.server.fixture
+        tenant = self.server.tenant
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        tenant.record(self.path)
+
+        if tenant.hang:
+            fixture.stopped.wait()
+            self.close_connection = True
+            return
+
+        if tenant.latency:
+            time.sleep(tenant.latency)
+
+        if tenant.fails():
+            self._send_json(tenant.error_status, {"detail": "Injected error"})
+
+        elif url.path == utils.TENANT_API and tenant.name == utils.SUPERPOEM:
+            self._send_page(fixture.public_tenants, query)
+
+        elif url.path == utils.METRICS_API:
+            self._send_metrics(query)
+
+        elif url.path == PROBES_API:
+            self._send_probes(query)
+
+        elif url.path == "/" and tenant.redirect:
+            self.send_response(302)
+            self.send_header(
+                "Location",
+                f"https://{fixture.tenant(tenant.redirect).domain_url}/"
+            )
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        elif url.path == "/":
+            self._send_json(200, {})
+
+        else:
+            self._send_json(404, {"detail": "Not found"})
+
+
+class POEMServer:
+    def __init__(self, tenants, superpoem=None, handshake_timeout=5):
+        self.tenants = list(tenants)
+        self.superpoem = superpoem if superpoem else \
+            FixtureTenant(utils.SUPERPOEM)
+        self.handshake_timeout = handshake_timeout
+        self.stopped = threading.Event()
+        self.directory = None
+        self.ca = None
+        self.client_cert = None
+        self.client_key = None
+        self._servers = list()
+        self._thread = None
+
+    @property
+    def hostname(self):
+        return self.superpoem.domain_url
+
+    def tenant(self, name):
+        for tenant in self.tenants:
+            if tenant.name == name:
+                return tenant
+
+    def public_tenants(self):
+        return [
+            {"name": tenant.name, "domain_url": tenant.domain_url}
+            for tenant in self.tenants + [self.superpoem]
+        ]
+
+    def _context(self, tenant, host):
+        alt_names = tenant.alt_names if tenant.alt_names is not None \
+            else [host]
+        cert, key = self.ca.issue(
+            host, alt_names=alt_names, not_after=tenant.not_after
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        context.load_verify_locations(cafile=self.ca.bundle)
+        context.verify_mode = ssl.CERT_OPTIONAL
+
+        return context
+
+    def start(self):
+        self.directory = tempfile.mkdtemp()
+        self.ca = CertificateAuthority(self.directory)
+        self.client_cert, self.client_key = self.ca.issue(
+            "poem-probe", alt_names=[]
+        )
+
+        for i, tenant in enumerate([self.superpoem] + self.tenants):
+            host = f"127.0.{i // 254}.{i % 254 + 1}"
+            server = _Server(
+                (host, 0), self, tenant, self._context(tenant, host)
+            )
+            tenant.address = server.server_address
+            self._servers.append(server)
+
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def _serve(self):
+        with selectors.DefaultSelector() as selector:
+            for server in self._servers:
+                selector.register(server, selectors.EVENT_READ)
+
+            while not self.stopped.is_set():
+                for key, _ in selector.select(0.05):
+                    key.fileobj._handle_request_noblock()
+
+    def stop(self):
+        self.stopped.set()
+        self._thread.join()
+        for server in self._servers:
+            server.server_close()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import argo_probe_poem
+from argo_probe_poem import cli
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+SCRIPTS = [
+    "poem-cert-probe", "poem-metricapi-probe", "poem-probecandidate-probe",
+    "poem-combined-probe"
+]
+
+HEAVY_MODULES = ("OpenSSL", "cryptography", "requests", "urllib3", "ijson")
+
+IMPORT_BUDGET = float(os.environ.get("POEM_IMPORT_BUDGET", 0.5))
+
+
+def import_times(script, *args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.path.dirname(
+        os.path.abspath(argo_probe_poem.__path__[0])
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", os.path.join(SRC, script)] +
+        list(args), stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        universal_newlines=True
+    )
+
+    modules = list()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+
+        modules.append((
+            name[1:].rstrip(), len(name) - len(name.lstrip()) == 1,
+            int(cumulative) / 1e6
+        ))
+
+    return process.returncode, modules
+
+
+@unittest.skipIf(
+    sys.version_info < (3, 7), "-X importtime requires Python 3.7"
+)
+class ImportTimeTests(unittest.TestCase):
+    def assertLightStartup(self, script, *args):
+        code, modules = import_times(script, *args)
+        self.assertEqual(code, 0 if "--help" in args else 2)
+        names = [name.strip() for name, _, _ in modules]
+        self.assertIn("argo_probe_poem.cli", names)
+        for name in names:
+            self.assertNotIn(
+                name.split(".")[0], HEAVY_MODULES,
+                f"{script} {' '.join(args)} imports {name}"
+            )
+
+        startup = sum(
+            cumulative for name, top_level, cumulative in modules
+            if top_level and name != "site"
+        )
+        self.assertLess(
+            startup, IMPORT_BUDGET,
+            f"{script} {' '.join(args)} spent {startup:.3f} s importing "
+            f"modules"
+        )
+
+    def test_help(self):
+        for script in SCRIPTS:
+            with self.subTest(script=script):
+                self.assertLightStartup(script, "--help")
+
+    def test_argument_error(self):
+        for script in SCRIPTS:
+            with self.subTest(script=script):
+                self.assertLightStartup(
+                    script, "-H", "poem.devel.argo.grnet.gr", "--bogus"
+                )
+
+
+class RunnerArgsTests(unittest.TestCase):
+    def test_services(self):
+        args = cli.runner_args([
+            "-H", "poem.devel.argo.grnet.gr", "--checks", "cert",
+            "--service", "cert=POEM-Cert"
+        ])
+        self.assertEqual(args.checks, ["cert"])
+        self.assertEqual(args.services, {
+            "cert": "POEM-Cert",
+            "metricapi": "poem-metricapi-probe",
+            "probecandidates": "poem-probecandidate-probe"
+        })
+
+    def test_invalid_service(self):
+        with mock.patch("sys.stderr"):
+            with self.assertRaises(SystemExit) as context:
+                cli.runner_args([
+                    "-H", "poem.devel.argo.grnet.gr", "--checks", "cert",
+                    "--service", "cert"
+                ])
+        self.assertEqual(context.exception.code, 2)
+
+    def test_missing_token(self):
+        with mock.patch("sys.stderr"):
+            with self.assertRaises(SystemExit) as context:
+                cli.runner_args([
+                    "-H", "poem.devel.argo.grnet.gr", "--checks",
+                    "probecandidates"
+                ])
+        self.assertEqual(context.exception.code, 2)
@@ -0,0 +1,294 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import argo_probe_poem
+from argo_probe_poem import utils
+from argo_probe_poem.pipeline import Aggregator, AsyncioExecutor, Pipeline, \
+    SerialExecutor, ThreadedExecutor, only_tenants, skip_tenants
+from argo_probe_poem.probe_response import ProbeResponse
+
+mock_tenants = [
+    {
+        "name": "TENANT1",
+        "domain_url": "tenant1.poem.devel.argo.grnet.gr"
+    },
+    {
+        "name": "TENANT2",
+        "domain_url": "tenant2.poem.devel.argo.grnet.gr"
+    },
+    {
+        "name": "TENANT3",
+        "domain_url": "tenant3.poem.devel.argo.grnet.gr"
+    },
+    {
+        "name": "SuperPOEM Tenant",
+        "domain_url": "poem.devel.argo.grnet.gr"
+    }
+]
+
+
+def check_tenant(tenant):
+    if tenant["name"] == "TENANT1":
+        time.sleep(0.3)
+
+    return tenant["name"].lower()
+
+
+def on_timeout(tenant):
+    return f"{tenant['name']} timed out"
+
+
+class FilterTests(unittest.TestCase):
+    def test_skip_tenants(self):
+        self.assertEqual(
+            [t for t in mock_tenants if skip_tenants()(t)], mock_tenants[:3]
+        )
+        self.assertEqual(
+            [t for t in mock_tenants if skip_tenants(["TENANT2"])(t)],
+            [mock_tenants[0], mock_tenants[2]]
+        )
+
+    def test_only_tenants(self):
+        self.assertEqual(
+            [t for t in mock_tenants if only_tenants(["TENANT3"])(t)],
+            [mock_tenants[2]]
+        )
+
+
+class ExecutorTests(unittest.TestCase):
+    def test_executors(self):
+        for executor in [
+            SerialExecutor(), ThreadedExecutor(4), AsyncioExecutor(2)
+        ]:
+            self.assertEqual(
+                executor.run(check_tenant, mock_tenants[:3]),
+                ["tenant1", "tenant2", "tenant3"]
+            )
+            self.assertEqual(
+                executor.run(
+                    check_tenant, mock_tenants[:3],
+                    deadline=utils.Deadline(5), on_timeout=on_timeout
+                ), ["tenant1", "tenant2", "tenant3"]
+            )
+
+    def test_serial_executor_deadline(self):
+        start = time.monotonic()
+        self.assertEqual(
+            SerialExecutor().run(
+                check_tenant, mock_tenants[:3], deadline=utils.Deadline(0.1),
+                on_timeout=on_timeout
+            ), ["TENANT1 timed out", "TENANT2 timed out", "TENANT3 timed out"]
+        )
+        self.assertLess(time.monotonic() - start, 0.3)
+
+    def test_concurrent_executors_deadline(self):
+        for executor in [ThreadedExecutor(4), AsyncioExecutor(2)]:
+            start = time.monotonic()
+            self.assertEqual(
+                executor.run(
+                    check_tenant, mock_tenants[:3],
+                    deadline=utils.Deadline(0.1), on_timeout=on_timeout
+                ), ["TENANT1 timed out", "tenant2", "tenant3"]
+            )
+            self.assertLess(time.monotonic() - start, 0.3)
+
+    def test_asyncio_executor_max_per_host(self):
+        running = {"now": 0, "max": 0}
+
+        def check(tenant):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            time.sleep(0.05)
+            running["now"] -= 1
+            return tenant["name"]
+
+        tenants = [
+            {
+                "name": f"TENANT{i}",
+                "domain_url": f"tenant{i}.poem.devel.argo.grnet.gr"
+            } for i in range(4)
+        ]
+        with patch("socket.getaddrinfo") as mock_getaddrinfo:
+            mock_getaddrinfo.return_value = [
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "",
+                 ("192.0.2.1", 443))
+            ]
+            self.assertEqual(
+                AsyncioExecutor(1).run(check, tenants),
+                ["TENANT0", "TENANT1", "TENANT2", "TENANT3"]
+            )
+        self.assertEqual(running["max"], 1)
+        mock_getaddrinfo.assert_any_call(
+            "tenant3.poem.devel.argo.grnet.gr", 443, type=socket.SOCK_STREAM
+        )
+
+    def test_asyncio_executor_max_workers(self):
+        threads = set()
+
+        def check(tenant):
+            threads.add(threading.current_thread())
+            time.sleep(0.01)
+            return tenant["name"]
+
+        tenants = [
+            {"name": f"TENANT{i}", "domain_url": f"127.0.0.{i + 1}:443"}
+            for i in range(20)
+        ]
+        self.assertEqual(
+            AsyncioExecutor(4, max_workers=3).run(check, tenants),
+            [f"TENANT{i}" for i in range(20)]
+        )
+        self.assertLessEqual(len(threads), 3)
+
+    def test_concurrent_executors_process_exit(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.dirname(
+            os.path.abspath(argo_probe_poem.__path__[0])
+        )
+        for executor in ["ThreadedExecutor(4)", "AsyncioExecutor(2)"]:
+            with self.subTest(executor=executor):
+                start = time.monotonic()
+                process = subprocess.run([
+                    sys.executable, "-c",
+                    "import time\n"
+                    "from argo_probe_poem import pipeline, utils\n"
+                    f"print(pipeline.{executor}.run(\n"
+                    "    lambda tenant: time.sleep(10),\n"
+                    "    [{'name': 'TENANT1', 'domain_url': 'poem'}],\n"
+                    "    deadline=utils.Deadline(0.2),\n"
+                    "    on_timeout=lambda tenant: 'timed out'\n"
+                    "))\n"
+                ], stdout=subprocess.PIPE, env=env, universal_newlines=True)
+                self.assertLess(time.monotonic() - start, 5)
+                self.assertEqual(process.returncode, 0)
+                self.assertEqual(process.stdout, "['timed out']\n")
+
+
+class PipelineTests(unittest.TestCase):
+    def test_run(self):
+        pipeline = Pipeline(
+            source=lambda: mock_tenants,
+            check=lambda tenant: tenant["domain_url"],
+            filters=[skip_tenants(["TENANT1"])]
+        )
+        self.assertEqual(pipeline.run(), [
+            (mock_tenants[1], "tenant2.poem.devel.argo.grnet.gr"),
+            (mock_tenants[2], "tenant3.poem.devel.argo.grnet.gr")
+        ])
+
+    def test_run_without_tenants(self):
+        pipeline = Pipeline(
+            source=lambda: mock_tenants,
+            check=check_tenant,
+            filters=[skip_tenants(), only_tenants(["SuperPOEM Tenant"])],
+            executor=AsyncioExecutor()
+        )
+        self.assertEqual(pipeline.run(), [])
+
+    def test_run_with_deadline(self):
+        pipeline = Pipeline(
+            source=lambda: mock_tenants[:3],
+            check=check_tenant,
+            executor=ThreadedExecutor(3),
+            deadline=utils.Deadline(0.1),
+            on_timeout=on_timeout
+        )
+        self.assertEqual(pipeline.run(), [
+            (mock_tenants[0], "TENANT1 timed out"),
+            (mock_tenants[1], "tenant2"),
+            (mock_tenants[2], "tenant3")
+        ])
+
+
+    def test_perfdata(self):
+        def check(tenant):
+            utils.add_stat("latency", 0.5)
+            utils.add_stat("bytes", 100)
+            if tenant["name"] == "TENANT2":
+                utils.set_stat("expiry_days", 10)
+
+        pipeline = Pipeline(
+            source=lambda: mock_tenants,
+            check=check,
+            filters=[skip_tenants(["TENANT3"])],
+            executor=ThreadedExecutor(2)
+        )
+        pipeline.run()
+        self.assertGreaterEqual(pipeline.elapsed, 0)
+        self.assertEqual(list(pipeline.stats.keys()), ["TENANT1", "TENANT2"])
+        perfdata = pipeline.perfdata(
+            stats=(("latency", "s"), ("expiry_days", "", "15:"))
+        )
+        self.assertEqual(perfdata[0][0], "time")
+        self.assertEqual(perfdata[1:], [
+            ("tenants", 2, "", "", "", 0),
+            ("bytes", 200, "B", "", "", 0),
+            ("TENANT1_latency", 0.5, "s"),
+            ("TENANT2_latency", 0.5, "s"),
+            ("TENANT2_expiry_days", 10, "", "15:")
+        ])
+
+    def test_perfdata_without_tenants(self):
+        pipeline = Pipeline(source=lambda: [], check=check_tenant)
+        pipeline.run()
+        self.assertEqual(pipeline.perfdata()[1:], [
+            ("tenants", 0, "", "", "", 0),
+            ("bytes", 0, "B", "", "", 0)
+        ])
+
+
+class AggregatorTests(unittest.TestCase):
+    def test_ok(self):
+        aggregator = Aggregator("All good")
+        self.assertEqual(aggregator.result(), (ProbeResponse.OK, "All good"))
+        response = aggregator.response()
+        self.assertEqual(response.code(), ProbeResponse.OK)
+        self.assertEqual(response.msg(), "OK - All good")
+
+    def test_worst_status(self):
+        aggregator = Aggregator("All good")
+        aggregator.add(ProbeResponse.WARNING, "TENANT1: warning")
+        self.assertEqual(
+            aggregator.response().msg(), "WARNING - TENANT1: warning"
+        )
+        aggregator.add(ProbeResponse.UNKNOWN, "TENANT2: unknown")
+        self.assertEqual(aggregator.response().code(), ProbeResponse.UNKNOWN)
+        aggregator.add(ProbeResponse.CRITICAL, "TENANT3: critical")
+        aggregator.add(ProbeResponse.WARNING, "TENANT4: warning")
+        response = aggregator.response()
+        self.assertEqual(response.code(), ProbeResponse.CRITICAL)
+        self.assertEqual(
+            response.msg(),
+            "CRITICAL - TENANT1: warning / TENANT2: unknown / "
+            "TENANT3: critical / TENANT4: warning"
+        )
+
+    def test_worst_only(self):
+        aggregator = Aggregator("All good", worst_only=True)
+        aggregator.add(ProbeResponse.WARNING, "TENANT1: warning")
+        aggregator.add(ProbeResponse.WARNING, "TENANT2: warning")
+        self.assertEqual(aggregator.result(), (
+            ProbeResponse.WARNING, "TENANT1: warning / TENANT2: warning"
+        ))
+        aggregator.add(ProbeResponse.CRITICAL, "TENANT3: critical")
+        aggregator.add(ProbeResponse.WARNING, "TENANT4: warning")
+        aggregator.add(ProbeResponse.CRITICAL, "TENANT5: critical")
+        self.assertEqual(aggregator.result(), (
+            ProbeResponse.CRITICAL, "TENANT3: critical / TENANT5: critical"
+        ))
+
+    def test_perfdata(self):
+        aggregator = Aggregator("All good")
+        aggregator.add(ProbeResponse.WARNING, "TENANT1: warning")
+        aggregator.add_perfdata("tenants", 1, minimum=0)
+        response = aggregator.response()
+        self.assertEqual(response.msg(), "WARNING - TENANT1: warning")
+        self.assertEqual(
+            response.output(), "WARNING - TENANT1: warning | tenants=1;;;0"
+        )
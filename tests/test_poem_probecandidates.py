@@ -1,9 +1,14 @@
 import datetime
+import json
+import os
+import tempfile
+import time
 import unittest
 from unittest import mock
 
 import requests
-from argo_probe_poem.poem_probecandidates import AnalyseProbeCandidates
+from argo_probe_poem.poem_probecandidates import AnalyseProbeCandidates, \
+    CandidateState, RequestException, days_since, parse_timestamps
 
 mock_tenants = [
     {
@@ -117,10 +122,25 @@ class MockResponse:
     def __init__(self, data, status_code):
         self.data = data
         self.status_code = status_code
+        self.ok = status_code == 200
+        self.reason = "OK"
+        if status_code == 400:
+            self.reason = "BAD REQUEST"
+
+        if status_code == 500:
+            self.reason = "SERVER ERROR"
 
     def json(self):
         return self.data
 
+    def iter_content(self, chunk_size=1):
+        content = json.dumps(self.data).encode("utf-8")
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
     def raise_for_status(self):
         if self.status_code != 200:
             raise requests.exceptions.RequestException(
@@ -274,9 +294,21 @@ def mock_response16(*args, **kwargs):
         return MockResponse(data=mock_candidates1, status_code=200)
 
 
+def mock_response17(*args, **kwargs):
+    if args[0].endswith("tenants"):
+        return MockResponse(data=mock_tenants, status_code=200)
+
+    if args[0].startswith("https://tenant1") and args[0].endswith("probes/"):
+        time.sleep(2)
+        return MockResponse(data=mock_candidates2, status_code=200)
+
+    else:
+        return MockResponse(data=mock_candidates4, status_code=200)
+
+
 class AnalyseProbeCandidatesTests(unittest.TestCase):
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_submitted(self, mock_get, mock_now):
         mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
         mock_get.side_effect = mock_response1
@@ -307,7 +339,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_testing_no_warn(self, mock_get, mock_now):
         mock_now.return_value = datetime.datetime(2023, 6, 4, 12, 0, 13)
         mock_get.side_effect = mock_response2
@@ -338,7 +370,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_testing_warn(self, mock_get, mock_now):
         mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
         mock_get.side_effect = mock_response2
@@ -370,7 +402,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_processing_no_warn(
             self, mock_get, mock_now
     ):
@@ -403,7 +435,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_processing_with_warn(
             self, mock_get, mock_now
     ):
@@ -437,7 +469,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_no_candidates(self, mock_get, mock_now):
         mock_now.return_value = datetime.datetime(2023, 6, 4, 12, 0, 13)
         mock_get.side_effect = mock_response4
@@ -468,7 +500,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_multiple_statuses(
             self, mock_get, mock_now
     ):
@@ -502,7 +534,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_error_fetching_tenants(
             self, mock_get, mock_now
     ):
@@ -519,7 +551,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
             analysis.get_status(), {
                 "status": 2,
                 "message": "CRITICAL - mock.hostname.com: "
-                           "Error fetching tenants: There has been an error"
+                           "Error fetching tenants: 500 SERVER ERROR"
             }
         )
         mock_get.assert_called_once_with(
@@ -528,7 +560,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         )
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_error_fetching_probe_candidates(
             self, mock_get, mock_now
     ):
@@ -563,7 +595,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_genric_exception_fetching_tenants(
             self, mock_get, mock_now
     ):
@@ -589,7 +621,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         )
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_single_tenant_generic_excpt_fetching_probe_candidates(
             self, mock_get, mock_now
     ):
@@ -624,7 +656,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_submitted(self, mock_get, mock_now):
         mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
         mock_get.side_effect = mock_response5
@@ -661,7 +693,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_submitted_processing_no_warn(
             self, mock_get, mock_now
     ):
@@ -700,7 +732,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_submitted_processing_with_warn_msg(
             self, mock_get, mock_now
     ):
@@ -742,7 +774,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_submitted_testing_no_warn(
             self, mock_get, mock_now
     ):
@@ -781,7 +813,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_submitted_testing_with_warn_msg(
             self, mock_get, mock_now
     ):
@@ -823,7 +855,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_multiple_statuses(
             self, mock_get, mock_now
     ):
@@ -864,7 +896,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_error_fetching_tenants(
             self, mock_get, mock_now
     ):
@@ -881,7 +913,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
             analysis.get_status(), {
                 "status": 2,
                 "message": "CRITICAL - mock.hostname.com: Error fetching "
-                           "tenants: There has been an error"
+                           "tenants: 400 BAD REQUEST"
             }
         )
         mock_get.assert_called_once_with(
@@ -890,7 +922,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         )
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_error_fetching_probe_candidates(
             self, mock_get, mock_now
     ):
@@ -932,7 +964,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         ], any_order=True)
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_generic_exception_fetching_tenants(
             self, mock_get, mock_now
     ):
@@ -958,7 +990,7 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
         )
 
     @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
-    @mock.patch("requests.get")
+    @mock.patch("requests.Session.get")
     def test_get_status_multiple_tenant_generic_exc_fetching_probe_candidates(
             self, mock_get, mock_now
     ):
@@ -996,3 +1028,305 @@ class AnalyseProbeCandidatesTests(unittest.TestCase):
                 timeout=30
             )
         ], any_order=True)
+
+    @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
+    @mock.patch("requests.Session.get")
+    def test_get_status_multiple_tenant_with_workers(self, mock_get, mock_now):
+        mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
+        mock_get.side_effect = mock_response6
+        analysis = AnalyseProbeCandidates(
+            hostname="mock.hostname.com",
+            tokens=[["TENANT1:m0ck_t0k3n"], ["TENANT2:M0CkT0KEN"]],
+            timeout=30,
+            warning_processing=1,
+            warning_testing=2,
+            workers=4
+        )
+        self.assertEqual(
+            analysis.get_status(), {
+                "status": 2,
+                "message": "CRITICAL - Actions required for tenants: TENANT1, "
+                           "TENANT2\n"
+                           "TENANT2: New submitted probe: 'test-probe1'\n"
+                           "TENANT1: Probe 'test-probe5' has status "
+                           "'processing' for 2 days"
+            }
+        )
+        self.assertEqual(mock_get.call_count, 3)
+        mock_get.assert_has_calls([
+            mock.call(
+                "https://mock.hostname.com/api/v2/internal/public_tenants",
+                timeout=30
+            ),
+            mock.call(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/probes/",
+                headers={"x-api-key": "m0ck_t0k3n"},
+                timeout=30
+            ),
+            mock.call(
+                "https://tenant2.poem.devel.argo.grnet.gr/api/v2/probes/",
+                headers={"x-api-key": "M0CkT0KEN"},
+                timeout=30
+            )
+        ], any_order=True)
+
+    @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
+    @mock.patch("requests.Session.get")
+    def test_get_status_multiple_tenant_with_workers_timeout(
+            self, mock_get, mock_now
+    ):
+        mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
+        mock_get.side_effect = mock_response17
+        analysis = AnalyseProbeCandidates(
+            hostname="mock.hostname.com",
+            tokens=[["TENANT1:m0ck_t0k3n"], ["TENANT2:M0CkT0KEN"]],
+            timeout=0.5,
+            warning_processing=1,
+            warning_testing=2,
+            workers=4
+        )
+        self.assertEqual(
+            analysis.get_status(), {
+                "status": 2,
+                "message": "CRITICAL - Actions required for tenants: TENANT1, "
+                           "TENANT2\n"
+                           "TENANT1: Error fetching probe candidates: "
+                           "Timed out after 0.5 seconds\n"
+                           "TENANT2: Probe 'test-probe5' has status "
+                           "'processing' for 2 days"
+            }
+        )
+
+
+class FilterCandidatesTests(unittest.TestCase):
+    def setUp(self):
+        self.analysis = AnalyseProbeCandidates(
+            hostname="mock.hostname.com",
+            tokens=[["TENANT1:m0ck_t0k3n"], ["TENANT2:M0CkT0KEN"]],
+            timeout=30,
+            warning_processing=1,
+            warning_testing=2,
+            filter_candidates=True
+        )
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_relevant_probe_candidates(self, mock_get):
+        mock_get.return_value = MockResponse(
+            data=mock_candidates3 + mock_candidates6, status_code=200
+        )
+        self.assertEqual(
+            self.analysis._fetch_probe_candidates(mock_tenants[0]),
+            [mock_candidates3[0]] + mock_candidates6
+        )
+        mock_get.assert_called_once_with(
+            "https://tenant1.poem.devel.argo.grnet.gr/api/v2/probes/",
+            headers={"x-api-key": "m0ck_t0k3n"},
+            params={"status": ["submitted", "testing", "processing"]},
+            stream=True,
+            timeout=30
+        )
+
+    @mock.patch("argo_probe_poem.utils.ijson", None)
+    @mock.patch("requests.Session.get")
+    def test_fetch_relevant_probe_candidates_without_ijson(self, mock_get):
+        mock_get.return_value = MockResponse(
+            data=mock_candidates4, status_code=200
+        )
+        self.assertEqual(
+            self.analysis._fetch_probe_candidates(mock_tenants[1]),
+            [mock_candidates4[0]]
+        )
+        mock_get.assert_called_once_with(
+            "https://tenant2.poem.devel.argo.grnet.gr/api/v2/probes/",
+            headers={"x-api-key": "M0CkT0KEN"},
+            params={"status": ["submitted", "testing", "processing"]},
+            stream=False,
+            timeout=30
+        )
+
+    @mock.patch("requests.Session.get")
+    def test_fetch_relevant_probe_candidates_with_error(self, mock_get):
+        mock_get.return_value = MockResponse(data=None, status_code=400)
+        with self.assertRaises(RequestException) as context:
+            self.analysis._fetch_probe_candidates(mock_tenants[0])
+        self.assertEqual(
+            str(context.exception),
+            "TENANT1: Error fetching probe candidates: There has been an error"
+        )
+
+    @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
+    @mock.patch("requests.Session.get")
+    def test_get_status(self, mock_get, mock_now):
+        mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
+        mock_get.side_effect = mock_response7
+        self.assertEqual(
+            self.analysis.get_status(), {
+                "status": 2,
+                "message": "CRITICAL - Actions required for tenants: "
+                           "TENANT1, TENANT2\n"
+                           "TENANT2: New submitted probe: 'test-probe1'\n"
+                           "TENANT1: Probe 'test-probe3' has status "
+                           "'testing' for 2 days"
+            }
+        )
+
+
+class TimestampTests(unittest.TestCase):
+    def test_parse_timestamps(self):
+        values = [
+            "2023-06-05 11:06:34", "2024-02-29 00:00:00", "2023-6-5 1:2:3",
+            "2023-12-31 23:59:59"
+        ]
+        self.assertEqual(parse_timestamps(values), [
+            datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+            for value in values
+        ])
+        self.assertEqual(parse_timestamps([]), [])
+
+    def test_parse_invalid_timestamps(self):
+        for value in [
+            "2023-02-29 11:06:34", "2023-13-05 11:06:34", "2023-06-05",
+            "2023-06-05T11:06:34", "2023-06-05 11:06:34.123456"
+        ]:
+            with self.assertRaises(ValueError):
+                parse_timestamps([value])
+
+    def test_days_since(self):
+        now = datetime.datetime(2023, 6, 5, 12, 0, 13)
+        self.assertEqual(
+            days_since(now, parse_timestamps([
+                "2023-06-05 11:06:34", "2023-06-04 12:00:13",
+                "2023-06-04 12:00:14", "2023-06-01 09:35:46",
+                "2023-06-06 08:00:00"
+            ])), [0, 1, 0, 4, -1]
+        )
+
+
+class CandidateStateTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "candidates.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_update_without_path(self):
+        state = CandidateState()
+        state.update(
+            "TENANT1", mock_candidates3, datetime.datetime(2023, 6, 5, 12)
+        )
+        self.assertEqual(
+            state.since("TENANT1", "test-probe3"),
+            datetime.datetime(2023, 6, 5, 12)
+        )
+        self.assertIsNone(state.since("TENANT1", "test-probe5"))
+        self.assertIsNone(state.since("TENANT2", "test-probe3"))
+        state.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_status_history(self):
+        state = CandidateState(self.path)
+        state.update(
+            "TENANT1", mock_candidates3, datetime.datetime(2023, 6, 5, 12)
+        )
+        state.save()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {
+                "TENANT1": {
+                    "test-probe3": ["testing", "2023-06-05 12:00:00"],
+                    "test-probe4": ["rejected", "2023-06-05 12:00:00"]
+                }
+            })
+
+        state = CandidateState(self.path)
+        state.update("TENANT1", [
+            dict(mock_candidates3[0], last_update="2023-06-06 08:00:00"),
+            dict(mock_candidates3[1], status="deployed"),
+            dict(mock_candidates4[0])
+        ], datetime.datetime(2023, 6, 7, 9, 30))
+        self.assertEqual(
+            state.since("TENANT1", "test-probe3"),
+            datetime.datetime(2023, 6, 5, 12)
+        )
+        self.assertEqual(
+            state.since("TENANT1", "test-probe4"),
+            datetime.datetime(2023, 6, 7, 9, 30)
+        )
+        state.save()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {
+                "TENANT1": {
+                    "test-probe3": ["testing", "2023-06-05 12:00:00"],
+                    "test-probe4": ["deployed", "2023-06-07 09:30:00"],
+                    "test-probe5": ["processing", "2023-06-07 09:30:00"]
+                }
+            })
+
+    def test_prune(self):
+        now = datetime.datetime(2023, 6, 5, 12)
+        state = CandidateState(self.path)
+        state.update("TENANT1", mock_candidates3, now)
+        state.update("TENANT2", mock_candidates4, now)
+        state.save()
+
+        state = CandidateState(self.path)
+        state.update("TENANT2", mock_candidates4[:1], now)
+        state.save()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f), {
+                "TENANT2": {
+                    "test-probe5": ["processing", "2023-06-05 12:00:00"]
+                }
+            })
+
+    def test_corrupted_state(self):
+        now = datetime.datetime(2023, 6, 5, 12)
+        for stored in [
+            "[", '{"TENANT1": []}', '{"TENANT1": {"test-probe5": 1}}',
+            '{"TENANT1": {"test-probe5": ["processing", "yesterday"]}}'
+        ]:
+            with self.subTest(stored=stored):
+                with open(self.path, "w") as f:
+                    f.write(stored)
+                state = CandidateState(self.path)
+                state.update("TENANT1", mock_candidates4, now)
+                self.assertIn(
+                    state.since("TENANT1", "test-probe5"), [now, None]
+                )
+                self.assertEqual(
+                    state.since("TENANT1", "test-probe6"), now
+                )
+
+    @mock.patch("argo_probe_poem.poem_probecandidates.get_now")
+    @mock.patch("requests.Session.get")
+    def test_get_status_with_state(self, mock_get, mock_now):
+        mock_now.return_value = datetime.datetime(2023, 6, 5, 12, 0, 13)
+        mock_get.side_effect = mock_response6
+        for i in range(2):
+            analysis = AnalyseProbeCandidates(
+                hostname="mock.hostname.com",
+                tokens=[["TENANT1:m0ck_t0k3n"], ["TENANT2:M0CkT0KEN"]],
+                timeout=30,
+                warning_processing=1,
+                warning_testing=2,
+                cache_dir=self.tmpdir.name,
+                tenants_ttl=0
+            )
+            self.assertEqual(
+                analysis.get_status(), {
+                    "status": 2,
+                    "message": "CRITICAL - Actions required for tenants: "
+                               "TENANT1, TENANT2\n"
+                               "TENANT2: New submitted probe: 'test-probe1'\n"
+                               "TENANT1: Probe 'test-probe5' has status "
+                               "'processing' for 2 days"
+                }
+            )
+        with open(os.path.join(
+                self.tmpdir.name, "candidates-mock.hostname.com.json"
+        )) as f:
+            stored = json.load(f)
+        self.assertEqual(sorted(stored.keys()), ["TENANT1", "TENANT2"])
+        self.assertEqual(stored["TENANT1"], {
+            "test-probe5": ["processing", "2023-06-05 12:00:13"]
+        })
@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import sys
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from argo_probe_poem import utils
+from argo_probe_poem.poem_cert import CertificateException
+from argo_probe_poem.poem_runner import Runner, main, passive_check_result, \
+    worst_code
+
+mock_tenants = [
+    {
+        "name": "TENANT1",
+        "domain_url": "tenant1.poem.devel.argo.grnet.gr"
+    },
+    {
+        "name": "TENANT2",
+        "domain_url": "tenant2.poem.devel.argo.grnet.gr"
+    },
+    {
+        "name": "SuperPOEM Tenant",
+        "domain_url": "poem.devel.argo.grnet.gr"
+    }
+]
+
+
+def without_perfdata(msg):
+    return re.sub(r" \| [^\n]*", "", msg)
+
+
+def verify_tenant(tenant):
+    if tenant["name"] == "TENANT2":
+        return CertificateException(
+            "TENANT2: Server certificate CN does not match "
+            "tenant2.poem.devel.argo.grnet.gr"
+        )
+
+
+def check_tenant(tenant):
+    return None
+
+
+def fetch_tenant_data(tenant):
+    return {"data": [{
+        "name": "test-probe1",
+        "status": "submitted",
+        "created": "2023-06-05 11:06:34",
+        "last_update": "2023-06-05 11:06:34"
+    }]}
+
+
+class RunnerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.runner = Runner(
+            hostname="poem.devel.argo.grnet.gr", timeout=30,
+            cache_dir=self.tmpdir.name, tenants_ttl=0
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def add_checks(self, runner):
+        runner.add_cert(
+            cert="/etc/grid-security/hostcert.pem",
+            key="/etc/grid-security/hostkey.pem",
+            capath="/etc/grid-security/certificates/"
+        )
+        runner.add_metricapi(
+            mandatory_metrics=["argo.AMSPublisher-Check"],
+            skipped_tenants=["TENANT1"]
+        )
+        runner.add_probecandidates(
+            tokens=[["TENANT1:m0ck_t0k3n"]],
+            warning_processing=1,
+            warning_testing=3
+        )
+
+    @mock.patch(
+        "argo_probe_poem.poem_probecandidates.AnalyseProbeCandidates."
+        "_fetch_tenant_data"
+    )
+    @mock.patch("argo_probe_poem.poem_metricapi.Metrics._check_tenant")
+    @mock.patch("argo_probe_poem.poem_cert.Certificate._verify_tenant")
+    @mock.patch("argo_probe_poem.tenants.Tenants._fetch")
+    def test_run(
+            self, mock_fetch, mock_verify, mock_check, mock_fetch_data
+    ):
+        mock_fetch.return_value = mock_tenants
+        mock_verify.side_effect = verify_tenant
+        mock_check.side_effect = check_tenant
+        mock_fetch_data.side_effect = fetch_tenant_data
+        self.add_checks(self.runner)
+        results = self.runner.run()
+        self.assertEqual(
+            list(results.keys()), ["cert", "metricapi", "probecandidates"]
+        )
+        for check, (code, msg) in results.items():
+            self.assertIn(" | time=", msg)
+            results[check] = code, without_perfdata(msg)
+        self.assertEqual(results["cert"], (
+            2, "CRITICAL - TENANT2: Server certificate CN does not match "
+               "tenant2.poem.devel.argo.grnet.gr"
+        ))
+        self.assertEqual(
+            results["metricapi"], (0, "OK - All mandatory metrics are present")
+        )
+        self.assertEqual(
+            results["probecandidates"],
+            (2, "CRITICAL - New submitted probe: 'test-probe1'")
+        )
+        mock_fetch.assert_called_once()
+        self.assertEqual(mock_verify.call_count, 2)
+        mock_check.assert_called_once_with(mock_tenants[1])
+        mock_fetch_data.assert_called_once_with(mock_tenants[0])
+
+    @mock.patch("argo_probe_poem.tenants.Tenants._fetch")
+    def test_run_with_exception(self, mock_fetch):
+        mock_fetch.side_effect = Exception("Something went wrong")
+        self.runner.add_metricapi(mandatory_metrics=["argo.AMS-Check"])
+        self.assertEqual(
+            self.runner.run(),
+            {"metricapi": (3, "UNKNOWN - Something went wrong")}
+        )
+
+    def test_run_without_checks(self):
+        self.assertEqual(self.runner.run(), {})
+
+    def test_check_options(self):
+        deadline = utils.Deadline(5)
+        self.runner.add_metricapi(
+            mandatory_metrics=["argo.AMS-Check"], deadline=deadline,
+            stream=True
+        )
+        self.runner.add_probecandidates(
+            tokens=[["TENANT1:m0ck_t0k3n"]], warning_processing=1,
+            warning_testing=3, filter_candidates=True
+        )
+        metrics = self.runner.probes["metricapi"]
+        self.assertIs(metrics.deadline, deadline)
+        self.assertTrue(metrics.stream)
+        self.assertIs(metrics.client, self.runner.client)
+        self.assertTrue(
+            self.runner.probes["probecandidates"].filter_candidates
+        )
+        self.assertIs(
+            self.runner.probes["probecandidates"].deadline,
+            self.runner.deadline
+        )
+
+
+class OutputTests(unittest.TestCase):
+    def test_passive_check_result(self):
+        self.assertEqual(
+            passive_check_result(
+                "poem.devel.argo.grnet.gr", "poem-probecandidate-probe", 2,
+                "CRITICAL - Actions required for tenants: TENANT1, TENANT2\n"
+                "TENANT1: New submitted probe: 'test-probe1'",
+                1686000000.5
+            ),
+            "[1686000000] PROCESS_SERVICE_CHECK_RESULT;"
+            "poem.devel.argo.grnet.gr;poem-probecandidate-probe;2;"
+            "CRITICAL - Actions required for tenants: TENANT1, TENANT2\\n"
+            "TENANT1: New submitted probe: 'test-probe1'"
+        )
+
+    def test_worst_code(self):
+        self.assertEqual(worst_code([]), 0)
+        self.assertEqual(worst_code([0, 1, 0]), 1)
+        self.assertEqual(worst_code([1, 3, 0]), 3)
+        self.assertEqual(worst_code([3, 2, 1]), 2)
+
+
+class MainTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.results_file = os.path.join(self.tmpdir.name, "results.json")
+        self.command_file = os.path.join(self.tmpdir.name, "nagios.cmd")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    @mock.patch("argo_probe_poem.poem_runner.time.time")
+    @mock.patch("argo_probe_poem.poem_metricapi.Metrics._check_tenant")
+    @mock.patch("argo_probe_poem.poem_cert.Certificate._verify_tenant")
+    @mock.patch("argo_probe_poem.tenants.Tenants._fetch")
+    def test_main(self, mock_fetch, mock_verify, mock_check, mock_time):
+        mock_fetch.return_value = mock_tenants
+        mock_verify.side_effect = verify_tenant
+        mock_check.return_value = None
+        mock_time.return_value = 1686000000
+        with mock.patch.object(sys, "argv", [
+            "poem-combined-probe", "-H", "poem.devel.argo.grnet.gr",
+            "--checks", "cert", "metricapi", "--mandatory-metrics",
+            "argo.AMS-Check", "--cache-dir", self.tmpdir.name,
+            "--service", "metricapi=POEM-Metrics",
+            "--command-file", self.command_file,
+            "--results-file", self.results_file
+        ]):
+            with self.assertRaises(SystemExit) as context:
+                main()
+        self.assertEqual(context.exception.code, 2)
+        with open(self.command_file) as f:
+            self.assertEqual(
+                without_perfdata(f.read()),
+                "[1686000000] PROCESS_SERVICE_CHECK_RESULT;"
+                "poem.devel.argo.grnet.gr;poem-cert-probe;2;CRITICAL - "
+                "TENANT2: Server certificate CN does not match "
+                "tenant2.poem.devel.argo.grnet.gr\n"
+                "[1686000000] PROCESS_SERVICE_CHECK_RESULT;"
+                "poem.devel.argo.grnet.gr;POEM-Metrics;0;OK - All mandatory "
+                "metrics are present\n"
+            )
+        with open(self.results_file) as f:
+            results = json.load(f)
+        for result in results.values():
+            self.assertIn("tenants=2;;;0", result["message"])
+            result["message"] = without_perfdata(result["message"])
+        self.assertEqual(results, {
+                "cert": {
+                    "service": "poem-cert-probe",
+                    "status": 2,
+                    "message": "CRITICAL - TENANT2: Server certificate CN "
+                               "does not match "
+                               "tenant2.poem.devel.argo.grnet.gr",
+                    "timestamp": 1686000000
+                },
+                "metricapi": {
+                    "service": "POEM-Metrics",
+                    "status": 0,
+                    "message": "OK - All mandatory metrics are present",
+                    "timestamp": 1686000000
+                }
+            })
+
+    def test_main_without_mandatory_metrics(self):
+        with mock.patch.object(sys, "argv", [
+            "poem-combined-probe", "-H", "poem.devel.argo.grnet.gr",
+            "--checks", "metricapi"
+        ]):
+            with mock.patch("sys.stderr"):
+                with self.assertRaises(SystemExit) as context:
+                    main()
+        self.assertEqual(context.exception.code, 2)
+
+    @mock.patch("argo_probe_poem.poem_runner.Runner.run")
+    @mock.patch("argo_probe_poem.poem_runner.Runner.add_probecandidates")
+    @mock.patch("argo_probe_poem.poem_runner.Runner.add_metricapi")
+    @mock.patch("argo_probe_poem.poem_runner.Runner.add_cert")
+    def test_main_check_options(
+            self, mock_cert, mock_metricapi, mock_probecandidates, mock_run
+    ):
+        mock_run.return_value = OrderedDict()
+        with mock.patch.object(sys, "argv", [
+            "poem-combined-probe", "-H", "poem.devel.argo.grnet.gr",
+            "-t", "60", "--mandatory-metrics", "argo.AMS-Check",
+            "--token", "TENANT1:m0ck_t0k3n", "--cache-dir", self.tmpdir.name,
+            "--dns-timeout", "2", "--connect-timeout", "3",
+            "--engine", "asyncio", "--max-per-host", "2", "--deadline", "30",
+            "--stream", "--early-exit", "--filter-candidates"
+        ]):
+            with mock.patch("builtins.print"):
+                with self.assertRaises(SystemExit) as context:
+                    main()
+        self.assertEqual(context.exception.code, 0)
+        mock_cert.assert_called_once_with(
+            cert="/etc/grid-security/hostcert.pem",
+            key="/etc/grid-security/hostkey.pem",
+            capath="/etc/grid-security/certificates/", skipped_tenants=None,
+            dns_timeout=2, connect_timeout=3
+        )
+        kwargs = mock_metricapi.call_args[1]
+        deadline = kwargs.pop("deadline")
+        self.assertEqual(deadline.timeout, 30)
+        self.assertEqual(kwargs, {
+            "mandatory_metrics": ["argo.AMS-Check"], "skipped_tenants": None,
+            "engine": "asyncio", "max_per_host": 2, "stream": True,
+            "early_exit": True
+        })
+        mock_probecandidates.assert_called_once_with(
+            tokens=[["TENANT1:m0ck_t0k3n"]], warning_processing=1,
+            warning_testing=3, filter_candidates=True
+        )
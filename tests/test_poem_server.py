@@ -0,0 +1,359 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from argo_probe_poem import cli, poem_cert, utils
+from argo_probe_poem.poem_cert import Certificate
+from argo_probe_poem.poem_metricapi import Metrics
+from argo_probe_poem.poem_probecandidates import AnalyseProbeCandidates
+from argo_probe_poem.probe_response import ProbeResponse
+
+from poem_server import FixtureTenant, POEMServer, synthetic_metrics, \
+    synthetic_probe
+
+MANDATORY_METRICS = ["argo.AMSPublisher-Check", "org.nagios.ProcessCrond"]
+
+
+class FixtureTestCase(unittest.TestCase):
+    tenants = []
+
+    def setUp(self):
+        self.server = POEMServer(self.tenants()).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.dict(os.environ, {
+            "REQUESTS_CA_BUNDLE": self.server.ca.bundle,
+            "NO_PROXY": "127.0.0.0/8"
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def tenant(self, name):
+        return self.server.tenant(name)
+
+
+class CertificateFixtureTests(FixtureTestCase):
+    def tenants(self):
+        return [
+            FixtureTenant("TENANT1"),
+            FixtureTenant("TENANT2", not_after=10),
+            FixtureTenant("TENANT3", alt_names=["tenant3.example.com"]),
+            FixtureTenant("TENANT4", hang=True)
+        ]
+
+    def certificate(self, skipped_tenants=None, **kwargs):
+        return Certificate(
+            hostname=self.server.hostname, cert=self.server.client_cert,
+            key=self.server.client_key, capath=self.server.ca.capath,
+            skipped_tenants=skipped_tenants, timeout=1, **kwargs
+        )
+
+    def test_valid(self):
+        status = self.certificate(
+            skipped_tenants=["TENANT2", "TENANT3", "TENANT4"]
+        ).check()
+        self.assertEqual(status.code(), ProbeResponse.OK)
+        self.assertEqual(
+            status.msg(), "OK - All certificates are valid"
+        )
+
+    def test_perfdata(self):
+        cert = self.certificate(skipped_tenants=["TENANT3", "TENANT4"])
+        output = cert.check().output()
+        self.assertTrue(output.startswith(
+            "WARNING - TENANT2: Server certificate will expire in 9 days | "
+            "time="
+        ))
+        self.assertIn(" tenants=2;;;0 ", output)
+        self.assertIn(" TENANT1_latency=", output)
+        self.assertIn(" TENANT1_handshake=", output)
+        self.assertIn(" TENANT2_handshake=", output)
+        self.assertIn(" TENANT1_expiry_days=364;15: ", output)
+        self.assertIn(" TENANT2_expiry_days=9;15:", output)
+
+    def test_invalid(self):
+        start = time.monotonic()
+        status = self.certificate(
+            workers=4, deadline=utils.Deadline(2)
+        ).check()
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual(status.code(), ProbeResponse.CRITICAL)
+        msg = status.msg()
+        self.assertNotIn("TENANT1", msg)
+        self.assertNotIn("TENANT2", msg)
+        self.assertIn("TENANT3: Client certificate verification failed", msg)
+        self.assertIn("TENANT4:", msg)
+
+    def test_certificate_failure_not_retried(self):
+        start = time.monotonic()
+        status = self.certificate(
+            skipped_tenants=["TENANT1", "TENANT2", "TENANT4"]
+        ).check()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(status.code(), ProbeResponse.CRITICAL)
+        self.assertIn(
+            "TENANT3: Client certificate verification failed: "
+            "HTTPSConnectionPool(host=", status.msg()
+        )
+
+    def test_profile(self):
+        path = os.path.join(self.tmpdir.name, "profile.txt")
+        args = cli.cert_parser().parse_args([
+            "-H", self.server.hostname, "--cert", self.server.client_cert,
+            "--key", self.server.client_key, "--capath",
+            self.server.ca.capath, "--skipped-tenants", "TENANT2", "TENANT3",
+            "TENANT4", "--cache-dir", self.tmpdir.name, "--profile", path
+        ])
+        with mock.patch("builtins.print"):
+            with self.assertRaises(SystemExit) as context:
+                poem_cert.main(args)
+        self.assertEqual(context.exception.code, 0)
+        self.assertFalse(utils.phases_enabled())
+        with open(path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[2], "check: cert")
+        tenant = lines[5].split()
+        self.assertEqual(tenant[0], "TENANT1")
+        self.assertNotIn("-", tenant[1:5])
+
+    def test_session_resumption(self):
+        reused = list()
+        for _ in range(2):
+            client = utils.HTTPClient()
+            response = client.get(
+                f"https://{self.tenant('TENANT1').domain_url}",
+                cert=(self.server.client_cert, self.server.client_key),
+                stream=True
+            )
+            reused.append(
+                Certificate._get_peer_certificate(response) is not None and
+                response.raw.connection.sock.session_reused
+            )
+            response.close()
+            client.close()
+        self.assertEqual(reused, [False, True])
+
+    def test_server_certificate(self):
+        cert = self.certificate()
+        certificate = cert._get_certificate(self.tenant("TENANT3").domain_url)
+        tenant = {
+            "name": "TENANT3", "domain_url": self.tenant("TENANT3").domain_url
+        }
+        with self.assertRaises(Exception) as context:
+            cert.verify_server_cert(tenant, certificate)
+        self.assertIn(
+            "Server certificate CN does not match", str(context.exception)
+        )
+
+
+class RedirectFixtureTests(FixtureTestCase):
+    def tenants(self):
+        return [
+            FixtureTenant("TENANT1", redirect="TENANT2"),
+            FixtureTenant("TENANT2", not_after=10)
+        ]
+
+    def test_redirect(self):
+        status = Certificate(
+            hostname=self.server.hostname, cert=self.server.client_cert,
+            key=self.server.client_key, capath=self.server.ca.capath,
+            skipped_tenants=["TENANT2"], timeout=1
+        ).check()
+        self.assertEqual(status.code(), ProbeResponse.OK)
+        self.assertEqual(self.tenant("TENANT2").requests, [])
+
+
+class MetricsFixtureTests(FixtureTestCase):
+    def tenants(self):
+        return [
+            FixtureTenant(
+                "TENANT1", metrics=synthetic_metrics(500) + MANDATORY_METRICS,
+                page_size=100
+            ),
+            FixtureTenant("TENANT2", metrics=MANDATORY_METRICS[:1]),
+            FixtureTenant("TENANT3", error_rate=1, error_status=404)
+        ]
+
+    def metrics(self, skipped_tenants=("TENANT3",), **kwargs):
+        return Metrics(
+            hostname=self.server.hostname,
+            mandatory_metrics=MANDATORY_METRICS,
+            skipped_tenants=list(skipped_tenants), timeout=5, **kwargs
+        )
+
+    def test_check(self):
+        for kwargs in [
+            {}, {"stream": True}, {"early_exit": True},
+            {"engine": "asyncio"}
+        ]:
+            with self.subTest(**kwargs):
+                status = self.metrics(**kwargs).check()
+                self.assertEqual(status.code(), ProbeResponse.CRITICAL)
+                self.assertEqual(
+                    status.msg(),
+                    "CRITICAL - TENANT2: Metric org.nagios.ProcessCrond is "
+                    "missing"
+                )
+
+    def test_error(self):
+        with self.assertRaises(utils.POEMException) as context:
+            self.metrics(skipped_tenants=[]).check()
+        self.assertEqual(
+            str(context.exception),
+            "POEM: Metrics fetch error: 404 Not Found: Injected error"
+        )
+
+    def test_perfdata(self):
+        output = self.metrics(stream=True).check().output()
+        perfdata = dict(
+            item.split("=") for item in output.split(" | ")[1].split()
+        )
+        self.assertEqual(perfdata["tenants"], "2;;;0")
+        self.assertGreater(int(perfdata["bytes"].split("B")[0]), 500 * 30)
+        self.assertIn("TENANT1_latency", perfdata)
+        self.assertIn("TENANT2_latency", perfdata)
+        self.assertGreater(float(perfdata["TENANT1_handshake"][:-1]), 0)
+
+    def test_phases(self):
+        utils.enable_phases()
+        self.addCleanup(utils.enable_phases, False)
+        for kwargs in [{}, {"stream": True}]:
+            with self.subTest(**kwargs):
+                metrics = self.metrics(**kwargs)
+                metrics.check()
+                for name, stats in metrics.tenants_pipeline.stats.items():
+                    self.assertEqual(sorted(stats.phases.keys()), [
+                        "connect", "decode", "dns", "download", "tls", "ttfb"
+                    ])
+                    self.assertGreater(stats.phases["tls"], 0)
+
+    def test_pagination(self):
+        self.metrics().check()
+        self.assertEqual(len(self.tenant("TENANT1").requests), 6)
+
+    def test_cache(self):
+        for _ in range(2):
+            self.metrics(cache_dir=self.tmpdir.name).check()
+        self.assertEqual(
+            len(self.tenant("TENANT2").requests), 2
+        )
+        self.assertTrue(os.path.exists(os.path.join(
+            self.tmpdir.name,
+            f"metrics-{self.tenant('TENANT2').domain_url}.json"
+        )))
+
+
+class HangingFixtureTests(FixtureTestCase):
+    def tenants(self):
+        return [
+            FixtureTenant("TENANT1", hang=True),
+            FixtureTenant(
+                "TENANT2", latency=1, error_rate=1, error_status=503
+            ),
+            FixtureTenant(
+                "TENANT3", metrics=MANDATORY_METRICS, drip=0.5
+            )
+        ]
+
+    def metrics(self, skipped_tenants, **kwargs):
+        return Metrics(
+            hostname=self.server.hostname,
+            mandatory_metrics=MANDATORY_METRICS,
+            skipped_tenants=skipped_tenants, **kwargs
+        )
+
+    def test_read_timeout(self):
+        start = time.monotonic()
+        with self.assertRaises(utils.POEMException) as context:
+            self.metrics(
+                ["TENANT2", "TENANT3"], timeout=1,
+                deadline=utils.Deadline(5)
+            ).check()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertIn("Metrics fetch error", str(context.exception))
+
+    def test_deadline(self):
+        for tenant in ["TENANT1", "TENANT2", "TENANT3"]:
+            with self.subTest(tenant=tenant):
+                deadline = utils.Deadline(2)
+                try:
+                    status = self.metrics(
+                        [name for name in ["TENANT1", "TENANT2", "TENANT3"]
+                         if name != tenant], timeout=5, deadline=deadline
+                    ).check()
+
+                except utils.POEMException:
+                    pass
+
+                else:
+                    self.assertEqual(status.code(), ProbeResponse.UNKNOWN)
+
+                self.assertLessEqual(
+                    time.monotonic() - deadline.expires, 0.25
+                )
+
+    def test_slow_drip(self):
+        for engine in ["serial", "asyncio"]:
+            with self.subTest(engine=engine):
+                deadline = utils.Deadline(1.5)
+                status = self.metrics(
+                    ["TENANT1", "TENANT2"], timeout=1, deadline=deadline,
+                    engine=engine
+                ).check()
+                self.assertLessEqual(
+                    time.monotonic() - deadline.expires, 0.25
+                )
+                self.assertEqual(status.code(), ProbeResponse.UNKNOWN)
+                self.assertEqual(
+                    status.msg(),
+                    "UNKNOWN - TENANT3: Metrics fetch did not finish within "
+                    "1.5 seconds"
+                )
+
+
+class ProbeCandidatesFixtureTests(FixtureTestCase):
+    def tenants(self):
+        return [
+            FixtureTenant("TENANT1", token="t0k3n1", probes=[
+                synthetic_probe("test-probe1", "submitted"),
+                synthetic_probe("test-probe2", "testing", days_ago=5),
+                synthetic_probe("test-probe3", "deployed", days_ago=20)
+            ], page_size=2),
+            FixtureTenant("TENANT2", token="t0k3n2", latency=2)
+        ]
+
+    def analysis(self, tokens, **kwargs):
+        return AnalyseProbeCandidates(
+            hostname=self.server.hostname, tokens=tokens, timeout=1,
+            warning_processing=1, warning_testing=3, **kwargs
+        )
+
+    def test_status(self):
+        for kwargs in [{}, {"filter_candidates": True}]:
+            with self.subTest(**kwargs):
+                status = self.analysis([["TENANT1:t0k3n1"]], **kwargs) \
+                    .get_status()
+                self.assertEqual(status["status"], 2)
+                self.assertIn(
+                    "New submitted probe: 'test-probe1'", status["message"]
+                )
+                self.assertIn("test-probe2", status["message"])
+                self.assertNotIn("test-probe3", status["message"])
+
+    def test_invalid_token(self):
+        status = self.analysis([["TENANT1:wrong"]]).get_status()
+        self.assertEqual(status["status"], 2)
+        self.assertIn("401", status["message"])
+
+    def test_latency(self):
+        start = time.monotonic()
+        status = self.analysis(
+            [["TENANT1:t0k3n1"], ["TENANT2:t0k3n2"]], workers=2,
+            deadline=utils.Deadline(1)
+        ).get_status()
+        self.assertLess(time.monotonic() - start, 1.8)
+        self.assertEqual(status["status"], 2)
+        self.assertIn("TENANT2", status["message"])
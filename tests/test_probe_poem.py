@@ -1,11 +1,24 @@
 import copy
+import datetime
+import json
+import os
+import tempfile
+import time
 import unittest
 from unittest.mock import patch, call, MagicMock
 
 import requests
+from OpenSSL import SSL
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
 from argo_probe_poem.poem_cert import Certificate, \
-    WarningCertificateException, CertificateException, SSLException
-from argo_probe_poem.poem_metricapi import Metrics, MetricsException
+    WarningCertificateException, CertificateException, SSLException, \
+    SubjectAltNames, CertificateCache
+from argo_probe_poem.poem_metricapi import Metrics, MetricsException, \
+    TimeoutMetricsException
+from argo_probe_poem import utils
 from argo_probe_poem.utils import POEMException
 from freezegun import freeze_time
 
@@ -376,13 +389,17 @@ mock_metrics = [
 
 
 class MockResponse:
-    def __init__(self, status_code, data=None):
+    def __init__(self, status_code, data=None, headers=None):
         self.data = data
         self.status_code = status_code
+        if headers:
+            self.headers = headers
+        else:
+            self.headers = dict()
 
         self.ok = False
         self.reason = "BAD REQUEST"
-        if str(self.status_code).startswith("2"):
+        if self.status_code < 400:
             self.ok = True
             self.reason = "OK"
 
@@ -396,6 +413,14 @@ class MockResponse:
         else:
             raise requests.exceptions.RequestException("Requests exception")
 
+    def iter_content(self, chunk_size=1):
+        content = json.dumps(self.data).encode("utf-8")
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
 
 def pass_web_api(*args, **kwargs):
     return MockResponse(
@@ -415,6 +440,191 @@ def mock_expire_cert(*args, **kwargs):
     ]
 
 
+def generate_certificate(hostname, directory):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(
+        name
+    ).public_key(key.public_key()).serial_number(1).not_valid_before(
+        now
+    ).not_valid_after(now + datetime.timedelta(days=1)).sign(
+        key, hashes.SHA256()
+    )
+
+    cert_file = os.path.join(directory, "cert.pem")
+    key_file = os.path.join(directory, "key.pem")
+    with open(cert_file, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
+    with open(key_file, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ))
+
+    return cert_file, key_file
+
+
+class SubjectAltNamesTests(unittest.TestCase):
+    def setUp(self):
+        self.alt_names = SubjectAltNames.from_string(
+            "DNS:*.devel.argo.grnet.gr, DNS:argo.grnet.gr, "
+            "DNS:Poem.Example.ORG, DNS:f*.partial.example.org, DNS:*.com, "
+            "DNS:*.*.double.example.org, IP Address:192.0.2.1, "
+            "IP Address:2001:DB8:0:0:0:0:0:1"
+        )
+
+    def test_exact_name(self):
+        self.assertTrue(self.alt_names.match("argo.grnet.gr"))
+        self.assertTrue(self.alt_names.match("poem.example.org"))
+        self.assertTrue(self.alt_names.match("POEM.example.org."))
+        self.assertFalse(self.alt_names.match("grnet.gr"))
+        self.assertFalse(self.alt_names.match("argo.grnet.gr.example.com"))
+
+    def test_wildcard(self):
+        self.assertTrue(self.alt_names.match("poem.devel.argo.grnet.gr"))
+        self.assertFalse(self.alt_names.match("devel.argo.grnet.gr"))
+        self.assertFalse(self.alt_names.match(".devel.argo.grnet.gr"))
+        self.assertFalse(
+            self.alt_names.match("tenant1.poem.devel.argo.grnet.gr")
+        )
+        self.assertFalse(
+            self.alt_names.match("poem.devel.argo.grnet.gr.example.com")
+        )
+
+    def test_partial_wildcard(self):
+        self.assertTrue(self.alt_names.match("foo.partial.example.org"))
+        self.assertTrue(self.alt_names.match("f.partial.example.org"))
+        self.assertFalse(self.alt_names.match("bar.partial.example.org"))
+
+    def test_invalid_wildcards(self):
+        self.assertFalse(self.alt_names.match("example.com"))
+        self.assertFalse(self.alt_names.match("a.b.double.example.org"))
+        self.assertEqual(
+            set(self.alt_names.wildcards.keys()),
+            {"devel.argo.grnet.gr", "partial.example.org"}
+        )
+
+    def test_ip_address(self):
+        self.assertTrue(self.alt_names.match("192.0.2.1"))
+        self.assertTrue(self.alt_names.match("2001:db8::1"))
+        self.assertFalse(self.alt_names.match("192.0.2.2"))
+
+    def test_empty(self):
+        alt_names = SubjectAltNames.from_string("")
+        self.assertFalse(alt_names.match("poem.devel.argo.grnet.gr"))
+
+
+
+def mock_certificate(fingerprint, alt_names, not_after=b"20221212235959Z"):
+    certificate = MagicMock()
+    certificate.digest.return_value = fingerprint
+    certificate.get_notAfter.return_value = not_after
+    certificate.get_extension_count.return_value = 1
+    extension = certificate.get_extension.return_value
+    extension.get_short_name.return_value = b"subjectAltName"
+    extension.__str__.return_value = alt_names
+
+    return certificate
+
+
+class CertificateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "certificates.json")
+        self.certificates = [
+            mock_certificate(
+                f"AA:BB:0{i}".encode(),
+                f"DNS:tenant{i}.poem.devel.argo.grnet.gr"
+            ) for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lru(self):
+        cache = CertificateCache(maxsize=2)
+        info = cache.get(self.certificates[0])
+        self.assertTrue(info.is_cn_ok("tenant0.poem.devel.argo.grnet.gr"))
+        self.assertEqual(
+            info.not_after, datetime.datetime(2022, 12, 12, 23, 59, 59)
+        )
+        self.assertIs(cache.get(self.certificates[0]), info)
+        self.assertEqual(
+            self.certificates[0].get_extension_count.call_count, 1
+        )
+        self.certificates[0].digest.assert_called_with("sha256")
+
+        cache.get(self.certificates[1])
+        cache.get(self.certificates[0])
+        cache.get(self.certificates[2])
+        cache.get(self.certificates[0])
+        cache.get(self.certificates[1])
+        self.assertEqual(
+            self.certificates[0].get_extension_count.call_count, 1
+        )
+        self.assertEqual(
+            self.certificates[1].get_extension_count.call_count, 2
+        )
+
+    def test_persistent(self):
+        cache = CertificateCache(self.path)
+        info = cache.get(self.certificates[0])
+        self.assertTrue(info.is_cn_ok("tenant0.poem.devel.argo.grnet.gr"))
+        self.assertFalse(info.is_cn_ok("tenant1.poem.devel.argo.grnet.gr"))
+        cache.save()
+        with open(self.path) as f:
+            stored = json.load(f)
+        self.assertEqual(stored["AA:BB:00"]["verdicts"], {
+            "tenant0.poem.devel.argo.grnet.gr": True,
+            "tenant1.poem.devel.argo.grnet.gr": False
+        })
+        self.assertEqual(
+            stored["AA:BB:00"]["not_after"], [2022, 12, 12, 23, 59, 59]
+        )
+
+        certificate = mock_certificate(
+            b"AA:BB:00", "DNS:tenant0.poem.devel.argo.grnet.gr"
+        )
+        cache = CertificateCache(self.path)
+        info = cache.get(certificate)
+        self.assertFalse(certificate.get_extension_count.called)
+        self.assertFalse(certificate.get_notAfter.called)
+        self.assertEqual(
+            info.not_after, datetime.datetime(2022, 12, 12, 23, 59, 59)
+        )
+        self.assertTrue(info.is_cn_ok("tenant0.poem.devel.argo.grnet.gr"))
+        self.assertTrue(info.alt_names.match("tenant0.poem.devel.argo.grnet.gr"))
+
+    def test_persistent_expired(self):
+        cache = CertificateCache(self.path)
+        cache.get(self.certificates[0])
+        cache.save()
+        with open(self.path) as f:
+            stored = json.load(f)
+        stored["AA:BB:00"]["timestamp"] -= 31 * 86400
+        with open(self.path, "w") as f:
+            json.dump(stored, f)
+
+        cache = CertificateCache(self.path)
+        cache.get(self.certificates[1])
+        cache.save()
+        with open(self.path) as f:
+            self.assertEqual(list(json.load(f).keys()), ["AA:BB:01"])
+
+    def test_persistent_corrupted(self):
+        with open(self.path, "w") as f:
+            f.write("{")
+        cache = CertificateCache(self.path)
+        info = cache.get(self.certificates[0])
+        self.assertTrue(info.is_cn_ok("tenant0.poem.devel.argo.grnet.gr"))
+        self.assertEqual(
+            self.certificates[0].get_extension_count.call_count, 1
+        )
+
+
 class PoemCertTests(unittest.TestCase):
     def setUp(self):
         self.cert = Certificate(
@@ -433,6 +643,15 @@ class PoemCertTests(unittest.TestCase):
             skipped_tenants=["TENANT1"],
             timeout=60
         )
+        self.cert_workers = Certificate(
+            hostname="poem.devel.argo.grnet.gr",
+            cert="/etc/grid-security/hostcert.pem",
+            key="/etc/grid-security/hostkey.pem",
+            capath="/etc/grid-security/certificates/",
+            skipped_tenants=[],
+            timeout=60,
+            workers=4
+        )
 
         self.mock_get_cert = MagicMock()
         mock_get_cert_instance = self.mock_get_cert.return_value
@@ -451,25 +670,27 @@ class PoemCertTests(unittest.TestCase):
             "DNS:devel.argo.grnet.gr"
         )
 
-    @patch("argo_probe_poem.poem_cert.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants(self, mock_get):
         mock_get.return_value = MockResponse(data=mock_tenants, status_code=200)
         tenants = self.cert._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=60
         )
         self.assertEqual(tenants, mock_tenants)
 
-    @patch("argo_probe_poem.poem_cert.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_skipped_tenants(self, mock_get):
         mock_get.return_value = MockResponse(data=mock_tenants, status_code=200)
         tenants = self.cert_skipped_tenants._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=60
         )
         self.assertEqual(tenants, [mock_tenants[1]])
 
-    @patch("argo_probe_poem.poem_cert.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_exception(self, mock_get):
         mock_get.return_value = MockResponse(
             data={"detail": "There has been a problem"}, status_code=400
@@ -477,7 +698,8 @@ class PoemCertTests(unittest.TestCase):
         with self.assertRaises(POEMException) as context:
             self.cert._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=60
         )
         self.assertEqual(
             context.exception.__str__(),
@@ -485,13 +707,14 @@ class PoemCertTests(unittest.TestCase):
             "problem"
         )
 
-    @patch("argo_probe_poem.poem_cert.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_exception_without_msg(self, mock_get):
         mock_get.return_value = MockResponse(status_code=500)
         with self.assertRaises(POEMException) as context:
             self.cert._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=60
         )
         self.assertEqual(
             context.exception.__str__(),
@@ -567,6 +790,41 @@ class PoemCertTests(unittest.TestCase):
             "TENANT1: Server certificate CN does not match test.example.com"
         )
 
+    @freeze_time("2022-12-10")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_certificate")
+    @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
+    def test_certificate_warning_and_critical(
+            self, mock_get_tenants, mock_client_cert, mock_servercert
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_client_cert.side_effect = mock_function
+        mock_servercert.side_effect = [
+            self.mock_get_cert.return_value,
+            SSLException("Server certificate verification failed: Not good")
+        ]
+        with self.assertRaises(CertificateException) as context:
+            self.cert.verify()
+        self.assertNotIsInstance(
+            context.exception, WarningCertificateException
+        )
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT2: Server certificate verification failed: Not good"
+        )
+
+        mock_servercert.side_effect = [
+            self.mock_get_cert.return_value,
+            SSLException("Server certificate verification failed: Not good")
+        ]
+        status = self.cert.check()
+        self.assertEqual(status.code(), 2)
+        self.assertEqual(
+            status.msg(),
+            "CRITICAL - TENANT2: Server certificate verification failed: "
+            "Not good"
+        )
+
     @patch("argo_probe_poem.poem_cert.Certificate._get_certificate")
     @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
     @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
@@ -588,6 +846,180 @@ class PoemCertTests(unittest.TestCase):
         )
 
 
+    @patch("argo_probe_poem.poem_cert.Certificate._get_certificate")
+    @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
+    def test_raise_ssl_exception_with_workers(
+            self, mock_get_tenants, mock_client_cert, mock_servercert
+    ):
+        def slow_first_tenant(hostname):
+            if hostname.startswith("tenant1"):
+                time.sleep(0.1)
+                raise SSLException("Connection timeout after 60 seconds")
+
+            raise SSLException(
+                "Server certificate verification failed: Not good"
+            )
+
+        mock_get_tenants.return_value = mock_tenants
+        mock_client_cert.side_effect = mock_function
+        mock_servercert.side_effect = slow_first_tenant
+        with self.assertRaises(CertificateException) as context:
+            self.cert_workers.verify()
+        self.assertEqual(mock_servercert.call_count, 2)
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Connection timeout after 60 seconds / "
+            "TENANT2: Server certificate verification failed: Not good"
+        )
+
+    @freeze_time("2022-12-10")
+    @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
+    def test_certificate_expire_warning_with_workers(
+            self, mock_get_tenants, mock_client_cert
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_client_cert.side_effect = mock_function
+        with patch(
+                "argo_probe_poem.poem_cert.Certificate._get_certificate",
+                self.mock_get_cert
+        ):
+            with self.assertRaises(WarningCertificateException) as context:
+                self.cert_workers.verify()
+        self.assertEqual(self.mock_get_cert.call_count, 2)
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Server certificate will expire in 2 days / "
+            "TENANT2: Server certificate will expire in 2 days"
+        )
+
+    @freeze_time("2022-12-10")
+    @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
+    def test_check_returns_probe_response(
+            self, mock_get_tenants, mock_client_cert
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_client_cert.side_effect = mock_function
+        with patch(
+                "argo_probe_poem.poem_cert.Certificate._get_certificate",
+                self.mock_get_cert
+        ):
+            status = self.cert_workers.check()
+        self.assertEqual(status.code(), 1)
+        self.assertEqual(
+            status.msg(),
+            "WARNING - TENANT1: Server certificate will expire in 2 days / "
+            "TENANT2: Server certificate will expire in 2 days"
+        )
+
+    @patch("argo_probe_poem.poem_cert.SSL.Context")
+    def test_get_context_once(self, mock_context):
+        context = self.cert_workers._get_context()
+        self.assertIs(self.cert_workers._get_context(), context)
+        mock_context.assert_called_once_with(SSL.TLSv1_2_METHOD)
+        context.load_verify_locations.assert_called_once_with(
+            None, "/etc/grid-security/certificates/"
+        )
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_verify_client_cert_returns_peer_certificate(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cert_file, _ = generate_certificate(
+                "tenant1.poem.devel.argo.grnet.gr", tmpdir
+            )
+            with open(cert_file, "rb") as f:
+                der = x509.load_pem_x509_certificate(f.read()).public_bytes(
+                    serialization.Encoding.DER
+                )
+        response = MagicMock()
+        response.raw.connection.sock.getpeercert.return_value = der
+        mock_get.return_value = response
+        certificate = self.cert.verify_client_cert(mock_tenants[0])
+        mock_get.assert_called_once_with(
+            "https://tenant1.poem.devel.argo.grnet.gr",
+            cert=(
+                "/etc/grid-security/hostcert.pem",
+                "/etc/grid-security/hostkey.pem"
+            ),
+            verify=True,
+            stream=True,
+            allow_redirects=False,
+            timeout=60
+        )
+        response.raw.connection.sock.getpeercert.assert_called_once_with(
+            binary_form=True
+        )
+        response.close.assert_called_once()
+        self.assertEqual(
+            certificate.to_cryptography().subject.get_attributes_for_oid(
+                NameOID.COMMON_NAME
+            )[0].value, "tenant1.poem.devel.argo.grnet.gr"
+        )
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_verify_client_cert_without_socket(self, mock_get):
+        response = MagicMock()
+        response.raw.connection.sock = None
+        mock_get.return_value = response
+        self.assertIsNone(self.cert.verify_client_cert(mock_tenants[0]))
+        response.close.assert_called_once()
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_verify_client_cert_with_exception(self, mock_get):
+        mock_get.side_effect = requests.exceptions.SSLError("bad handshake")
+        with self.assertRaises(CertificateException) as context:
+            self.cert.verify_client_cert(mock_tenants[0])
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Client certificate verification failed: bad handshake"
+        )
+
+    @patch("argo_probe_poem.utils.create_connection")
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_verify_with_expired_deadline(self, mock_get, mock_connect):
+        deadline = utils.Deadline(60)
+        deadline.expires = time.monotonic() - 1
+        cert = Certificate(
+            hostname="poem.devel.argo.grnet.gr",
+            cert="/etc/grid-security/hostcert.pem",
+            key="/etc/grid-security/hostkey.pem",
+            capath="/etc/grid-security/certificates/",
+            skipped_tenants=[],
+            timeout=60,
+            deadline=deadline
+        )
+        with self.assertRaises(CertificateException) as context:
+            cert.verify_client_cert(mock_tenants[0])
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Client certificate verification failed: Deadline of 60 "
+            "seconds exceeded"
+        )
+        with self.assertRaises(CertificateException) as context:
+            cert.verify_server_cert(mock_tenants[0])
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Connection timeout: Deadline of 60 seconds exceeded"
+        )
+        self.assertFalse(mock_get.called)
+        self.assertFalse(mock_connect.called)
+
+    @freeze_time("1969-12-28")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_certificate")
+    @patch("argo_probe_poem.poem_cert.Certificate.verify_client_cert")
+    @patch("argo_probe_poem.poem_cert.Certificate._get_tenants")
+    def test_all_passed_with_client_connection_certificate(
+            self, mock_get_tenants, mock_client_cert, mock_servercert
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_client_cert.return_value = self.mock_get_cert.return_value
+        self.cert.verify()
+        self.assertEqual(mock_client_cert.call_count, 2)
+        self.assertFalse(mock_servercert.called)
+
+
 class PoemMetricsTests(unittest.TestCase):
     def setUp(self):
         self.metrics = Metrics(
@@ -620,25 +1052,40 @@ class PoemMetricsTests(unittest.TestCase):
             timeout=180
         )
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+        self.metrics_asyncio = Metrics(
+            hostname="poem.devel.argo.grnet.gr",
+            mandatory_metrics=[
+                "argo.poem-tools.check",
+                "generic.disk.usage-local",
+                "generic.procs.crond"
+            ],
+            skipped_tenants=[],
+            timeout=180,
+            engine="asyncio",
+            deadline=utils.Deadline(0.5)
+        )
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants(self, mock_get):
         mock_get.return_value = MockResponse(data=mock_tenants, status_code=200)
         tenants = self.metrics._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=180
         )
         self.assertEqual(tenants, mock_tenants)
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_skipped_tenants(self, mock_get):
         mock_get.return_value = MockResponse(data=mock_tenants, status_code=200)
         tenants = self.metrics_skipped_tenants._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=180
         )
         self.assertEqual(tenants, [mock_tenants[1]])
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_exception(self, mock_get):
         mock_get.return_value = MockResponse(
             data={"detail": "There has been a problem"}, status_code=400
@@ -646,7 +1093,8 @@ class PoemMetricsTests(unittest.TestCase):
         with self.assertRaises(POEMException) as context:
             self.metrics._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=180
         )
         self.assertEqual(
             context.exception.__str__(),
@@ -654,20 +1102,21 @@ class PoemMetricsTests(unittest.TestCase):
             "problem"
         )
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_tenants_with_exception_without_msg(self, mock_get):
         mock_get.return_value = MockResponse(status_code=500)
         with self.assertRaises(POEMException) as context:
             self.metrics._get_tenants()
         mock_get.assert_called_once_with(
-            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants"
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=180
         )
         self.assertEqual(
             context.exception.__str__(),
             "POEM: Tenant fetch error: Requests exception"
         )
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_metrics(self, mock_get):
         mock_get.return_value = MockResponse(data=mock_metrics, status_code=200)
         metrics = self.metrics._get_metrics(tenant=mock_tenants[0])
@@ -677,7 +1126,7 @@ class PoemMetricsTests(unittest.TestCase):
         )
         self.assertEqual(metrics, mock_metrics)
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_metrics_with_exception(self, mock_get):
         mock_get.return_value = MockResponse(
             data={"detail": "There has been a problem"}, status_code=400
@@ -694,7 +1143,7 @@ class PoemMetricsTests(unittest.TestCase):
             "problem"
         )
 
-    @patch("argo_probe_poem.poem_metricapi.requests.get")
+    @patch("argo_probe_poem.utils.requests.Session.get")
     def test_get_metrics_with_exception_without_msg(self, mock_get):
         mock_get.return_value = MockResponse(status_code=500)
         with self.assertRaises(POEMException) as context:
@@ -741,3 +1190,316 @@ class PoemMetricsTests(unittest.TestCase):
             "TENANT1: Metric generic.procs.crond is missing / "
             "TENANT2: Metric generic.procs.crond is missing"
         )
+
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_metrics")
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_tenants")
+    def test_check_mandatory_metrics_asyncio_missing(
+            self, mock_get_tenants, mock_get_metrics
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_get_metrics.return_value = mock_metrics
+        with self.assertRaises(MetricsException) as context:
+            self.metrics_asyncio.check_mandatory()
+        self.assertEqual(mock_get_metrics.call_count, 2)
+        mock_get_metrics.assert_has_calls([
+            call(mock_tenants[0]), call(mock_tenants[1]),
+        ], any_order=True)
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Metric generic.procs.crond is missing / "
+            "TENANT2: Metric generic.procs.crond is missing"
+        )
+
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_metrics")
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_tenants")
+    def test_check_mandatory_metrics_asyncio_deadline(
+            self, mock_get_tenants, mock_get_metrics
+    ):
+        def slow_first_tenant(tenant):
+            if tenant["name"] == "TENANT1":
+                time.sleep(1)
+
+            return mock_metrics + [{"name": "generic.procs.crond"}]
+
+        mock_get_tenants.return_value = mock_tenants
+        mock_get_metrics.side_effect = slow_first_tenant
+        with self.assertRaises(TimeoutMetricsException) as context:
+            self.metrics_asyncio.check_mandatory()
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Metrics fetch did not finish within 0.5 seconds"
+        )
+
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_metrics")
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_tenants")
+    def test_check_asyncio_deadline(self, mock_get_tenants, mock_get_metrics):
+        def slow_first_tenant(tenant):
+            if tenant["name"] == "TENANT1":
+                time.sleep(1)
+
+            return mock_metrics + [{"name": "generic.procs.crond"}]
+
+        mock_get_tenants.return_value = mock_tenants
+        mock_get_metrics.side_effect = slow_first_tenant
+        status = self.metrics_asyncio.check()
+        self.assertEqual(status.code(), 3)
+        self.assertEqual(
+            status.msg(),
+            "UNKNOWN - TENANT1: Metrics fetch did not finish within 0.5 "
+            "seconds"
+        )
+
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_metrics")
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_tenants")
+    def test_check_mandatory_metrics_asyncio_exception(
+            self, mock_get_tenants, mock_get_metrics
+    ):
+        mock_get_tenants.return_value = mock_tenants
+        mock_get_metrics.side_effect = POEMException(
+            "Metrics fetch error: 500 SERVER ERROR"
+        )
+        with self.assertRaises(POEMException) as context:
+            self.metrics_asyncio.check_mandatory()
+        self.assertEqual(
+            context.exception.__str__(),
+            "POEM: Metrics fetch error: 500 SERVER ERROR"
+        )
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_conditional(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            metrics = Metrics(
+                hostname="poem.devel.argo.grnet.gr",
+                mandatory_metrics=["argo.poem-tools.check"],
+                skipped_tenants=[],
+                timeout=180,
+                cache_dir=tmpdir
+            )
+            names = set([item["name"] for item in mock_metrics])
+            mock_get.return_value = MockResponse(
+                data=mock_metrics, status_code=200, headers={
+                    "ETag": '"abc"',
+                    "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"
+                }
+            )
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]), names
+            )
+            mock_get.assert_called_once_with(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+                "public_metric", timeout=180
+            )
+            with open(os.path.join(
+                    tmpdir, "metrics-tenant1.poem.devel.argo.grnet.gr.json"
+            )) as f:
+                cached = json.load(f)
+            self.assertEqual(cached["names"], sorted(names))
+            self.assertEqual(cached["etag"], '"abc"')
+
+            mock_get.reset_mock()
+            mock_get.return_value = MockResponse(status_code=304)
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]), names
+            )
+            mock_get.assert_called_once_with(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+                "public_metric", headers={
+                    "If-None-Match": '"abc"',
+                    "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"
+                }, timeout=180
+            )
+
+            mock_get.reset_mock()
+            mock_get.return_value = MockResponse(
+                data=mock_metrics[:1], status_code=200,
+                headers={"ETag": '"def"'}
+            )
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]),
+                {"argo.ams.publish-consume"}
+            )
+            with open(os.path.join(
+                    tmpdir, "metrics-tenant1.poem.devel.argo.grnet.gr.json"
+            )) as f:
+                cached = json.load(f)
+            self.assertEqual(cached["names"], ["argo.ams.publish-consume"])
+            self.assertEqual(cached["etag"], '"def"')
+            self.assertEqual(cached["last_modified"], None)
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_corrupted_cache(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            metrics = Metrics(
+                hostname="poem.devel.argo.grnet.gr",
+                mandatory_metrics=["argo.poem-tools.check"],
+                skipped_tenants=[],
+                timeout=180,
+                cache_dir=tmpdir
+            )
+            with open(os.path.join(
+                    tmpdir, "metrics-tenant1.poem.devel.argo.grnet.gr.json"
+            ), "w") as f:
+                json.dump({
+                    "etag": '"abc"',
+                    "last_modified": None,
+                    "digest": "0000",
+                    "names": ["argo.poem-tools.check"]
+                }, f)
+            mock_get.return_value = MockResponse(
+                data=mock_metrics, status_code=200
+            )
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]),
+                set([item["name"] for item in mock_metrics])
+            )
+            mock_get.assert_called_once_with(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+                "public_metric", timeout=180
+            )
+
+    @unittest.skipIf(utils.ijson is None, "ijson is not installed")
+    @patch("argo_probe_poem.utils.STREAM_CHUNK_SIZE", 64)
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_streaming(self, mock_get):
+        metrics = Metrics(
+            hostname="poem.devel.argo.grnet.gr",
+            mandatory_metrics=["argo.poem-tools.check"],
+            skipped_tenants=[],
+            timeout=180,
+            stream=True
+        )
+        mock_get.return_value = MockResponse(data=mock_metrics, status_code=200)
+        with patch.object(
+                MockResponse, "json", side_effect=AssertionError
+        ) as mock_json:
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]),
+                set([item["name"] for item in mock_metrics])
+            )
+            self.assertFalse(mock_json.called)
+        mock_get.assert_called_once_with(
+            "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+            "public_metric", stream=True, timeout=180
+        )
+
+    @patch("argo_probe_poem.utils.ijson", None)
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_streaming_without_ijson(self, mock_get):
+        metrics = Metrics(
+            hostname="poem.devel.argo.grnet.gr",
+            mandatory_metrics=["argo.poem-tools.check"],
+            skipped_tenants=[],
+            timeout=180,
+            stream=True
+        )
+        mock_get.return_value = MockResponse(data=mock_metrics, status_code=200)
+        self.assertEqual(
+            metrics._get_metric_names(tenant=mock_tenants[0]),
+            set([item["name"] for item in mock_metrics])
+        )
+        mock_get.assert_called_once_with(
+            "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+            "public_metric", timeout=180
+        )
+
+    @unittest.skipIf(utils.ijson is None, "ijson is not installed")
+    @patch("argo_probe_poem.utils.STREAM_CHUNK_SIZE", 64)
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_early_exit(self, mock_get):
+        metrics = Metrics(
+            hostname="poem.devel.argo.grnet.gr",
+            mandatory_metrics=[
+                "argo.ams.publish-consume", "argo.poem-tools.check"
+            ],
+            skipped_tenants=[],
+            timeout=180,
+            stream=True,
+            early_exit=True
+        )
+        response = MockResponse(data=mock_metrics, status_code=200)
+        chunks = list()
+
+        def iter_content(chunk_size=1):
+            for chunk in MockResponse.iter_content(response, chunk_size):
+                chunks.append(chunk)
+                yield chunk
+
+        response.iter_content = iter_content
+        response.close = MagicMock()
+        mock_get.return_value = response
+        self.assertEqual(
+            metrics._get_metric_names(tenant=mock_tenants[0]),
+            {"argo.ams.publish-consume", "argo.poem-tools.check"}
+        )
+        self.assertLess(
+            len(b"".join(chunks)), len(json.dumps(mock_metrics)) / 2
+        )
+        response.close.assert_called()
+
+    @patch("argo_probe_poem.poem_metricapi.Metrics._get_tenants")
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_check_mandatory_early_exit_missing(
+            self, mock_get, mock_get_tenants
+    ):
+        metrics = Metrics(
+            hostname="poem.devel.argo.grnet.gr",
+            mandatory_metrics=["argo.ams.publish-consume", "generic.procs.crond"],
+            skipped_tenants=[],
+            timeout=180,
+            early_exit=True
+        )
+        mock_get_tenants.return_value = mock_tenants[:1]
+        mock_get.return_value = MockResponse(data=mock_metrics, status_code=200)
+        with self.assertRaises(MetricsException) as context:
+            metrics.check_mandatory()
+        self.assertEqual(
+            context.exception.__str__(),
+            "TENANT1: Metric generic.procs.crond is missing"
+        )
+
+    @patch("argo_probe_poem.utils.requests.Session.get")
+    def test_get_metric_names_early_exit_cache(self, mock_get):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            metrics = Metrics(
+                hostname="poem.devel.argo.grnet.gr",
+                mandatory_metrics=["argo.ams.publish-consume"],
+                skipped_tenants=[],
+                timeout=180,
+                cache_dir=tmpdir,
+                early_exit=True
+            )
+            mock_get.return_value = MockResponse(
+                data=mock_metrics, status_code=200, headers={"ETag": '"abc"'}
+            )
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]),
+                {"argo.ams.publish-consume"}
+            )
+
+            mock_get.reset_mock()
+            mock_get.return_value = MockResponse(status_code=304)
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]),
+                {"argo.ams.publish-consume"}
+            )
+            mock_get.assert_called_once_with(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+                "public_metric", headers={"If-None-Match": '"abc"'},
+                timeout=180
+            )
+
+            metrics.mandatory_metrics = {"generic.disk.usage-local"}
+            mock_get.reset_mock()
+            mock_get.return_value = MockResponse(
+                data=mock_metrics, status_code=200, headers={"ETag": '"abc"'}
+            )
+            self.assertEqual(
+                metrics._get_metric_names(tenant=mock_tenants[0]), {
+                    "argo.ams.publish-consume", "argo.poem-tools.check",
+                    "generic.disk.usage-local"
+                }
+            )
+            mock_get.assert_called_once_with(
+                "https://tenant1.poem.devel.argo.grnet.gr/api/v2/internal/"
+                "public_metric", timeout=180
+            )
@@ -0,0 +1,47 @@
+import unittest
+
+from argo_probe_poem.probe_response import ProbeResponse
+
+
+class PerfDataTests(unittest.TestCase):
+    def test_without_perfdata(self):
+        response = ProbeResponse()
+        response.ok("All good")
+        self.assertEqual(response.perfdata(), "")
+        self.assertEqual(response.output(), "OK - All good")
+
+    def test_perfdata(self):
+        response = ProbeResponse()
+        response.warning("TENANT1: Server certificate will expire in 10 days")
+        response.add_perfdata("time", 1.23456, "s", minimum=0)
+        response.add_perfdata("tenants", 3, minimum=0)
+        response.add_perfdata("TENANT1_expiry_days", 10, warn="15:")
+        response.add_perfdata("SuperPOEM Tenant_latency", 0.1, "s")
+        response.add_perfdata("it's=", 1, "c", 1, 2, 0, 10)
+        self.assertEqual(
+            response.perfdata(),
+            "time=1.235s;;;0 tenants=3;;;0 TENANT1_expiry_days=10;15: "
+            "'SuperPOEM Tenant_latency'=0.100s 'it''s_'=1c;1;2;0;10"
+        )
+        self.assertEqual(
+            response.output(),
+            "WARNING - TENANT1: Server certificate will expire in 10 days | "
+            "time=1.235s;;;0 tenants=3;;;0 TENANT1_expiry_days=10;15: "
+            "'SuperPOEM Tenant_latency'=0.100s 'it''s_'=1c;1;2;0;10"
+        )
+        self.assertEqual(
+            response.msg(),
+            "WARNING - TENANT1: Server certificate will expire in 10 days"
+        )
+
+    def test_multiline_output(self):
+        response = ProbeResponse(
+            "CRITICAL - Actions required for tenants: TENANT1, TENANT2\n"
+            "TENANT1: New submitted probe: 'test-probe1'"
+        )
+        response.add_perfdata("tenants", 2)
+        self.assertEqual(
+            response.output(),
+            "CRITICAL - Actions required for tenants: TENANT1, TENANT2 | "
+            "tenants=2\nTENANT1: New submitted probe: 'test-probe1'"
+        )
@@ -0,0 +1,109 @@
+import os
+import pstats
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest import mock
+
+from argo_probe_poem import cli, utils
+from argo_probe_poem.profiling import Profiler
+
+
+def stats_with(phases, time=None):
+    stats = utils.Stats()
+    for name, seconds in phases.items():
+        stats.add_phase(name, seconds)
+
+    if time is not None:
+        stats.set("time", time)
+
+    return stats
+
+
+class ProfilerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(utils.enable_phases, False)
+        self.path = os.path.join(self.tmpdir.name, "profile.txt")
+        self.pstats_path = os.path.join(self.tmpdir.name, "profile.pstats")
+
+    def test_from_args(self):
+        args = cli.cert_parser().parse_args([
+            "-H", "poem.devel.argo.grnet.gr", "--profile", self.path,
+            "--profile-tracemalloc", "5"
+        ])
+        profiler = Profiler.from_args(args)
+        self.assertTrue(profiler.enabled)
+        self.assertEqual(profiler.path, self.path)
+        self.assertIsNone(profiler.pstats_path)
+        self.assertEqual(profiler.tracemalloc_top, 5)
+        self.assertFalse(Profiler.from_args(
+            cli.cert_parser().parse_args(["-H", "poem.devel.argo.grnet.gr"])
+        ).enabled)
+
+    def test_disabled(self):
+        profiler = Profiler()
+        profiler.start()
+        self.assertFalse(utils.phases_enabled())
+        probe = mock.Mock(tenants_pipeline=None)
+        with profiler.collect("cert", probe) as stats:
+            utils.add_phase("dns", 1)
+        profiler.stop()
+        self.assertEqual(stats.phases, {})
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_collect(self):
+        profiler = Profiler(path=self.path)
+        profiler.start()
+        self.assertTrue(utils.phases_enabled())
+        tenants = OrderedDict([
+            ("TENANT1", stats_with({"dns": 0.5, "ttfb": 0.25}, time=1)),
+            ("TENANT2", stats_with({"dns": 0.25, "decode": 2}, time=3))
+        ])
+        probe = mock.Mock(tenants_pipeline=mock.Mock(stats=tenants))
+        with profiler.collect("metricapi", probe):
+            utils.add_phase("format", 0.125)
+        profiler.stop()
+        self.assertFalse(utils.phases_enabled())
+
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines[0].startswith("elapsed: "))
+        self.assertEqual(lines[2], "check: metricapi")
+        self.assertEqual(lines[3].split(), [
+            "tenant", "dns", "connect", "tls", "ttfb", "download", "decode",
+            "format", "total"
+        ])
+        self.assertEqual(
+            lines[4].split()[:8],
+            ["(probe)", "-", "-", "-", "-", "-", "-", "0.1250"]
+        )
+        self.assertEqual(lines[5].split(), [
+            "TENANT1", "0.5000", "-", "-", "0.2500", "-", "-", "-", "1.0000"
+        ])
+        self.assertEqual(lines[6].split(), [
+            "TENANT2", "0.2500", "-", "-", "-", "-", "2.0000", "-", "3.0000"
+        ])
+        self.assertEqual(lines[7].split(), [
+            "(tenants)", "0.7500", "-", "-", "0.2500", "-", "2.0000", "-",
+            "4.0000"
+        ])
+
+    def test_pstats_and_tracemalloc(self):
+        profiler = Profiler(
+            path=self.path, pstats_path=self.pstats_path, tracemalloc_top=3
+        )
+        profiler.start()
+        data = [list(range(100)) for _ in range(100)]
+        profiler.add("cert", utils.Stats())
+        profiler.stop()
+        self.assertEqual(len(data), 100)
+
+        with open(self.path) as f:
+            report = f.read()
+        self.assertIn("check: cert", report)
+        self.assertIn("tracemalloc: peak ", report)
+        self.assertIn("top 3 allocations", report)
+        self.assertIn(__file__, report)
+        self.assertGreater(pstats.Stats(self.pstats_path).total_calls, 0)
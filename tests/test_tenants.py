@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+from argo_probe_poem.tenants import Tenants, TenantFetchException
+from argo_probe_poem.utils import HTTPClient
+
+mock_tenants = [
+    {
+        "name": "TENANT1",
+        "schema_name": "tenant1",
+        "domain_url": "tenant1.poem.devel.argo.grnet.gr",
+        "created_on": "2022-09-24",
+        "nr_metrics": 111,
+        "nr_probes": 11
+    },
+    {
+        "name": "TENANT2",
+        "schema_name": "tenant2",
+        "domain_url": "tenant2.poem.devel.argo.grnet.gr",
+        "created_on": "2022-09-24",
+        "nr_metrics": 222,
+        "nr_probes": 22
+    },
+    {
+        "name": "SuperPOEM Tenant",
+        "schema_name": "public",
+        "domain_url": "poem.devel.argo.grnet.gr",
+        "created_on": "2022-09-24",
+        "nr_metrics": 0,
+        "nr_probes": 0
+    }
+]
+
+
+class MockResponse:
+    def __init__(self, status_code, data=None):
+        self.data = data
+        self.status_code = status_code
+        self.ok = status_code == 200
+        self.reason = "OK" if self.ok else "SERVER ERROR"
+
+    def json(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class TenantsTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.tmpdir.name, "cache")
+        self.client = HTTPClient(timeout=30)
+        self.tenants = Tenants(
+            hostname="poem.devel.argo.grnet.gr",
+            client=self.client,
+            cache_dir=self.cache_dir,
+            ttl=300,
+            max_stale=3600
+        )
+        self.cache_file = os.path.join(
+            self.cache_dir, "tenants-poem.devel.argo.grnet.gr.json"
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.tmpdir.cleanup()
+
+    def _write_cache(self, age):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.cache_file, "w") as f:
+            json.dump(
+                {"timestamp": time.time() - age, "tenants": mock_tenants[:1]}, f
+            )
+
+    @patch("requests.Session.get")
+    def test_get_without_cache(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=200, data=mock_tenants)
+        tenants = Tenants(
+            hostname="poem.devel.argo.grnet.gr", client=self.client
+        )
+        self.assertEqual(tenants.get(), mock_tenants[:2])
+        self.assertEqual(tenants.get(["TENANT1"]), [mock_tenants[1]])
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    @patch("requests.Session.get")
+    def test_get_writes_cache(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=200, data=mock_tenants)
+        self.assertEqual(self.tenants.get(), mock_tenants[:2])
+        mock_get.assert_called_once_with(
+            "https://poem.devel.argo.grnet.gr/api/v2/internal/public_tenants",
+            timeout=30
+        )
+        with open(self.cache_file) as f:
+            self.assertEqual(json.load(f)["tenants"], mock_tenants)
+        self.assertEqual(
+            [
+                name for name in os.listdir(self.cache_dir)
+                if name.endswith(".tmp")
+            ], []
+        )
+
+    @patch("requests.Session.get")
+    def test_get_fresh_cache(self, mock_get):
+        self._write_cache(age=10)
+        self.assertEqual(self.tenants.get(), mock_tenants[:1])
+        self.assertFalse(mock_get.called)
+
+    @patch("requests.Session.get")
+    def test_get_expired_cache(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=200, data=mock_tenants)
+        self._write_cache(age=600)
+        self.assertEqual(self.tenants.get(), mock_tenants[:2])
+        mock_get.assert_called_once()
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_stale_cache_on_error(self, mock_get, mock_sleep):
+        mock_get.side_effect = requests.exceptions.ConnectionError(
+            "Connection refused"
+        )
+        self._write_cache(age=600)
+        self.assertEqual(self.tenants.get(), mock_tenants[:1])
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch("requests.Session.get")
+    def test_get_too_stale_cache_on_error(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=500)
+        self._write_cache(age=7200)
+        with self.assertRaises(TenantFetchException) as context:
+            self.tenants.get()
+        self.assertEqual(
+            context.exception.__str__(),
+            "POEM: Tenant fetch error: 500 SERVER ERROR"
+        )
+
+    @patch("requests.Session.get")
+    def test_get_corrupted_cache(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=200, data=mock_tenants)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.cache_file, "w") as f:
+            f.write('{"timestamp": ')
+        self.assertEqual(self.tenants.get(), mock_tenants[:2])
+        mock_get.assert_called_once()
+
+    @patch("requests.Session.get")
+    def test_get_unwritable_cache_dir(self, mock_get):
+        mock_get.return_value = MockResponse(status_code=200, data=mock_tenants)
+        open(self.cache_dir, "w").close()
+        self.assertEqual(self.tenants.get(), mock_tenants[:2])
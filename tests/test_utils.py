@@ -0,0 +1,888 @@
+import datetime
+import errno
+import json
+import os
+import socket
+import ssl
+import time
+import unittest
+from unittest.mock import Mock, call, patch
+
+import requests
+from requests.packages.urllib3.exceptions import ConnectTimeoutError, \
+    NewConnectionError
+from requests.packages.urllib3.util.ssl_ import create_urllib3_context
+
+from argo_probe_poem import utils
+from argo_probe_poem.utils import HTTPClient
+
+
+class HTTPClientTests(unittest.TestCase):
+    def setUp(self):
+        self.client = HTTPClient(
+            pool_size=5, retries=3, backoff_factor=0.1, timeout=30
+        )
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_adapter_configuration(self):
+        adapter = self.client.session.get_adapter("https://poem.example.com")
+        self.assertIs(
+            adapter, self.client.session.get_adapter("http://poem.example.com")
+        )
+        self.assertIsInstance(adapter, utils.POEMHTTPAdapter)
+        self.assertEqual(adapter._pool_connections, 5)
+        self.assertEqual(adapter._pool_maxsize, 5)
+        self.assertEqual(adapter.max_retries.total, 0)
+        self.assertFalse(adapter.max_retries.read)
+        self.assertEqual(self.client.retries, 3)
+        self.assertEqual(self.client.backoff_factor, 0.1)
+
+    @patch("requests.Session.get")
+    def test_get_with_default_timeout(self, mock_get):
+        self.client.get("https://poem.example.com/api/v2/probes/")
+        mock_get.assert_called_once_with(
+            "https://poem.example.com/api/v2/probes/", timeout=30
+        )
+
+    @patch("requests.Session.get")
+    def test_get_with_explicit_timeout(self, mock_get):
+        self.client.get(
+            "https://poem.example.com/api/v2/probes/",
+            headers={"x-api-key": "t0k3n"}, timeout=5
+        )
+        mock_get.assert_called_once_with(
+            "https://poem.example.com/api/v2/probes/",
+            headers={"x-api-key": "t0k3n"}, timeout=5
+        )
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_retries(self, mock_get, mock_sleep):
+        responses = [Mock(status_code=status) for status in (503, 502, 200)]
+        mock_get.side_effect = [
+            requests.exceptions.ConnectionError("refused")
+        ] + responses
+        self.assertIs(
+            self.client.get("https://poem.example.com/api/v2/probes/"),
+            responses[2]
+        )
+        self.assertEqual(mock_get.call_count, 4)
+        self.assertEqual(
+            mock_sleep.call_args_list, [call(0.1), call(0.2), call(0.4)]
+        )
+        responses[0].close.assert_called_once_with()
+        responses[1].close.assert_called_once_with()
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_retries_exhausted(self, mock_get, mock_sleep):
+        response = Mock(status_code=503)
+        mock_get.return_value = response
+        self.assertIs(
+            self.client.get("https://poem.example.com/api/v2/probes/"),
+            response
+        )
+        self.assertEqual(mock_get.call_count, 4)
+
+        mock_get.reset_mock()
+        mock_get.side_effect = requests.exceptions.ConnectionError("refused")
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get("https://poem.example.com/api/v2/probes/")
+        self.assertEqual(mock_get.call_count, 4)
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_does_not_retry_read_timeout(self, mock_get, mock_sleep):
+        mock_get.side_effect = requests.exceptions.ReadTimeout("timed out")
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.client.get("https://poem.example.com/api/v2/probes/")
+        mock_get.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_does_not_retry_ssl_error(self, mock_get, mock_sleep):
+        mock_get.side_effect = requests.exceptions.SSLError(
+            "certificate verify failed"
+        )
+        with self.assertRaises(requests.exceptions.SSLError):
+            self.client.get("https://poem.example.com/api/v2/probes/")
+        mock_get.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch("requests.Session.get")
+    def test_get_without_timeout(self, mock_get):
+        client = HTTPClient()
+        client.get("https://poem.example.com/api/v2/probes/")
+        mock_get.assert_called_once_with(
+            "https://poem.example.com/api/v2/probes/"
+        )
+        client.close()
+
+
+class DeadlineTests(unittest.TestCase):
+    @patch("time.monotonic")
+    def test_budget(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        deadline = utils.Deadline(30)
+        self.assertEqual(deadline.remaining(), 30)
+        self.assertEqual(deadline.budget(), 30)
+        self.assertEqual(deadline.budget(10), 10)
+        self.assertFalse(deadline.expired())
+
+        mock_monotonic.return_value = 125
+        self.assertEqual(deadline.remaining(), 5)
+        self.assertEqual(deadline.budget(10), 5)
+        self.assertFalse(deadline.expired())
+
+        mock_monotonic.return_value = 131
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired())
+
+    @patch("time.monotonic")
+    @patch("requests.Session.get")
+    def test_get_with_deadline(self, mock_get, mock_monotonic):
+        mock_monotonic.return_value = 100
+        client = HTTPClient(timeout=30, deadline=utils.Deadline(60))
+        client.get("https://poem.example.com/api/v2/probes/")
+        mock_get.assert_called_once_with(
+            "https://poem.example.com/api/v2/probes/", timeout=30
+        )
+
+        mock_monotonic.return_value = 150
+        client.get("https://poem.example.com/api/v2/probes/", timeout=20)
+        mock_get.assert_called_with(
+            "https://poem.example.com/api/v2/probes/", timeout=10
+        )
+
+        mock_monotonic.return_value = 160
+        with self.assertRaises(requests.exceptions.Timeout) as context:
+            client.get("https://poem.example.com/api/v2/probes/")
+        self.assertEqual(
+            str(context.exception), "Deadline of 60 seconds exceeded"
+        )
+        self.assertEqual(mock_get.call_count, 2)
+        client.close()
+
+    @patch("time.monotonic")
+    @patch("requests.Session.get")
+    def test_get_with_connection_budgets(self, mock_get, mock_monotonic):
+        mock_monotonic.return_value = 100
+        budgets = list()
+
+        def get(url, **kwargs):
+            budgets.append(utils.connection_budgets())
+            return Mock(status_code=200)
+
+        mock_get.side_effect = get
+        client = HTTPClient(timeout=30, deadline=utils.Deadline(60))
+        client.get(
+            "https://poem.example.com/", dns_timeout=5, connect_timeout=10
+        )
+        mock_monotonic.return_value = 152
+        client.get(
+            "https://poem.example.com/", dns_timeout=5, connect_timeout=10
+        )
+        client.get("https://poem.example.com/")
+        self.assertEqual(budgets, [(5, 10), (5, 8), (None, None)])
+        self.assertEqual(mock_get.call_args_list, [
+            call("https://poem.example.com/", timeout=30),
+            call("https://poem.example.com/", timeout=8),
+            call("https://poem.example.com/", timeout=8)
+        ])
+        self.assertEqual(utils.connection_budgets(), (None, None))
+        client.close()
+
+    @patch("time.sleep")
+    @patch("time.monotonic")
+    @patch("requests.Session.get")
+    def test_get_retries_within_deadline(
+            self, mock_get, mock_monotonic, mock_sleep
+    ):
+        mock_monotonic.return_value = 100
+        client = HTTPClient(backoff_factor=20, deadline=utils.Deadline(60))
+
+        def advance(seconds):
+            mock_monotonic.return_value += seconds
+
+        def get(url, **kwargs):
+            advance(25)
+            return Mock(status_code=503)
+
+        mock_get.side_effect = get
+        mock_sleep.side_effect = advance
+        response = client.get("https://poem.example.com/api/v2/probes/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_get.call_args_list, [
+            call("https://poem.example.com/api/v2/probes/", timeout=60),
+            call("https://poem.example.com/api/v2/probes/", timeout=15)
+        ])
+        mock_sleep.assert_called_once_with(20)
+        client.close()
+
+
+class SessionSSLContextTests(unittest.TestCase):
+    def test_load_once(self):
+        context = utils.SessionSSLContext.create()
+        with patch.object(ssl.SSLContext, "load_verify_locations") as \
+                mock_verify, \
+                patch.object(ssl.SSLContext, "load_cert_chain") as mock_cert:
+            for _ in range(2):
+                context.load_verify_locations("/etc/ca.pem")
+                context.load_cert_chain("/etc/cert.pem", "/etc/key.pem")
+            context.load_verify_locations(None, "/etc/grid-security")
+        self.assertEqual(mock_verify.call_args_list, [
+            call("/etc/ca.pem", None, None),
+            call(None, "/etc/grid-security", None)
+        ])
+        mock_cert.assert_called_once_with(
+            "/etc/cert.pem", "/etc/key.pem", None
+        )
+
+    def test_session_ssl_context(self):
+        context = utils.session_ssl_context()
+        self.assertIsInstance(context, utils.SessionSSLContext)
+        self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+        reference = create_urllib3_context()
+        self.assertEqual(context.options, reference.options)
+        self.assertEqual(context.get_ciphers(), reference.get_ciphers())
+        self.assertIn(
+            ("verify", utils.DEFAULT_CA_BUNDLE_PATH, None, None),
+            context._loaded
+        )
+        self.assertIs(
+            utils.session_ssl_context(utils.DEFAULT_CA_BUNDLE_PATH), context
+        )
+        self.assertIsNot(
+            utils.session_ssl_context(
+                cert_file="/etc/cert.pem", key_file="/etc/key.pem"
+            ), context
+        )
+
+    def test_sessions(self):
+        context = utils.SessionSSLContext.create()
+        self.assertIsNone(context.session("poem.example.com"))
+        session = object()
+        context.save_session(
+            Mock(session=session, server_hostname="poem.example.com")
+        )
+        context.save_session(Mock(session=None, server_hostname="other"))
+        self.assertIs(context.session("poem.example.com"), session)
+        self.assertIsNone(context.session("other"))
+
+
+class StatsTests(unittest.TestCase):
+    def test_collect_stats(self):
+        utils.add_stat("latency", 1)
+        self.assertIsNone(utils.current_stats())
+        stats = utils.Stats()
+        with utils.collect_stats(stats):
+            utils.add_stat("latency", 0.5)
+            utils.add_stat("latency", 0.25)
+            utils.set_stat("expiry_days", 10)
+            utils.set_stat("expiry_days", 9)
+            inner = utils.Stats()
+            with utils.collect_stats(inner):
+                utils.add_stat("bytes", 100)
+            utils.add_stat("bytes", 10)
+        self.assertIsNone(utils.current_stats())
+        self.assertEqual(
+            stats.values, {"latency": 0.75, "expiry_days": 9, "bytes": 10}
+        )
+        self.assertEqual(inner.values, {"bytes": 100})
+        self.assertEqual(stats.get("handshake"), None)
+
+    @patch("time.monotonic")
+    @patch("requests.Session.get")
+    def test_request_stats(self, mock_get, mock_monotonic):
+        mock_monotonic.side_effect = [100, 100.25, 200, 201]
+        response = MockResponse(
+            mock_items, "https://poem.example.com/api/v2/metrics"
+        )
+        response.raw = Mock()
+        response.raw.tell.return_value = 1234
+        mock_get.return_value = response
+        client = HTTPClient()
+        stats = utils.Stats()
+        with utils.collect_stats(stats):
+            self.assertEqual(
+                len(list(client.iter_items(
+                    "https://poem.example.com/api/v2/metrics"
+                ))), 3
+            )
+            client.get("https://poem.example.com/api/v2/metrics")
+        self.assertEqual(stats.values, {"latency": 1.25, "bytes": 1234})
+        client.close()
+
+
+class PhasesTests(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(utils.enable_phases, False)
+
+    def test_disabled(self):
+        stats = utils.Stats()
+        with utils.collect_stats(stats):
+            utils.add_phase("dns", 0.5)
+            with utils.phase("format"):
+                pass
+        self.assertFalse(utils.phases_enabled())
+        self.assertEqual(stats.phases, {})
+
+    def test_phase(self):
+        utils.enable_phases()
+        utils.add_phase("dns", 1)
+        stats = utils.Stats()
+        with utils.collect_stats(stats):
+            utils.add_phase("dns", 0.5)
+            utils.add_phase("dns", 0.25)
+            with utils.phase("format"):
+                pass
+        self.assertEqual(list(stats.phases.keys()), ["dns", "format"])
+        self.assertEqual(stats.phases["dns"], 0.75)
+        self.assertGreaterEqual(stats.phases["format"], 0)
+        self.assertEqual(stats.values, {})
+
+    @patch("requests.Session.get")
+    def test_request_phases(self, mock_get):
+        utils.enable_phases()
+        client = HTTPClient()
+        for stream in [False, True]:
+            with self.subTest(stream=stream):
+                response = MockResponse(
+                    mock_items, "https://poem.example.com/api/v2/metrics"
+                )
+                response.elapsed = datetime.timedelta(seconds=0)
+                mock_get.return_value = response
+                stats = utils.Stats()
+                with utils.collect_stats(stats):
+                    self.assertEqual(len(list(client.iter_items(
+                        "https://poem.example.com/api/v2/metrics",
+                        stream=stream
+                    ))), 3)
+                self.assertEqual(
+                    sorted(stats.phases.keys()), ["decode", "download", "ttfb"]
+                )
+                self.assertEqual(stats.phases["ttfb"], 0)
+        client.close()
+
+
+    def test_connection_phases(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+        port = server.getsockname()[1]
+        getaddrinfo = socket.getaddrinfo
+        addresses = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.2", port)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port))
+        ]
+
+        def resolve(host, *args, **kwargs):
+            if host == "poem.example.com":
+                return addresses
+
+            return getaddrinfo(host, *args, **kwargs)
+
+        utils.enable_phases()
+        with patch("socket.getaddrinfo", side_effect=resolve):
+            connection = utils.HTTPConnection(
+                "poem.example.com", port, timeout=1
+            )
+            stats = utils.Stats()
+            with utils.collect_stats(stats):
+                connection.connect()
+            self.assertEqual(
+                connection.sock.getpeername(), ("127.0.0.1", port)
+            )
+            self.assertEqual(connection._dns_host, "poem.example.com")
+            self.assertEqual(sorted(stats.phases.keys()), ["connect", "dns"])
+            connection.close()
+
+            addresses.pop()
+            connection = utils.HTTPConnection(
+                "poem.example.com", port, timeout=1
+            )
+            with self.assertRaises(NewConnectionError):
+                connection.connect()
+            self.assertEqual(connection._dns_host, "poem.example.com")
+
+
+    def test_connection_error_messages(self):
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        port = server.getsockname()[1]
+        server.close()
+        client = HTTPClient(retries=0)
+        for scheme in ["http", "https"]:
+            with self.subTest(scheme=scheme):
+                with self.assertRaises(
+                        requests.exceptions.ConnectionError
+                ) as context:
+                    client.get(f"{scheme}://127.0.0.1:{port}/")
+                msg = str(context.exception)
+                self.assertTrue(msg.startswith(
+                    f"{scheme.upper()}ConnectionPool(host='127.0.0.1', "
+                ))
+                self.assertIn(f"{scheme.upper()}Connection", msg)
+                self.assertNotIn("_HTTP", msg)
+        client.close()
+
+    def test_connection_dns_budget(self):
+        getaddrinfo = socket.getaddrinfo
+
+        def resolve(host, *args, **kwargs):
+            if host == "poem.example.com":
+                time.sleep(1)
+
+            return getaddrinfo(host, *args, **kwargs)
+
+        with patch("socket.getaddrinfo", side_effect=resolve):
+            connection = utils.HTTPConnection(
+                "poem.example.com", 443, timeout=1
+            )
+            start = time.monotonic()
+            with utils.limit_connection(dns_timeout=0.1):
+                with self.assertRaises(ConnectTimeoutError) as context:
+                    connection.connect()
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertIn("dns timeout=0.1", str(context.exception))
+
+    def test_connection_connect_budget(self):
+        timeouts = list()
+
+        def create_connection(address, timeout=None, *args, **kwargs):
+            timeouts.append(timeout)
+            time.sleep(0.15)
+            raise socket.timeout("timed out")
+
+        addresses = [
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.1", 443)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.2", 443)),
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.0.2.3", 443))
+        ]
+        with patch("socket.getaddrinfo", return_value=addresses), \
+                patch(
+                    "urllib3.util.connection.create_connection",
+                    side_effect=create_connection
+                ):
+            connection = utils.HTTPConnection(
+                "poem.example.com", 443, timeout=10
+            )
+            with utils.limit_connection(connect_timeout=0.25):
+                with self.assertRaises(ConnectTimeoutError):
+                    connection.connect()
+        self.assertEqual(len(timeouts), 2)
+        self.assertLessEqual(timeouts[0], 0.25)
+        self.assertLess(timeouts[1], 0.1)
+        self.assertEqual(connection.timeout, 10)
+        self.assertEqual(connection._dns_host, "poem.example.com")
+
+
+class MockResponse:
+    def __init__(self, data, url, status_code=200):
+        self.data = data
+        self.url = url
+        self.status_code = status_code
+        self.closed = False
+
+    def json(self):
+        return self.data
+
+    def iter_content(self, chunk_size=1):
+        content = json.dumps(self.data).encode("utf-8")
+        for i in range(0, len(content), 7):
+            yield content[i:i + 7]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} Server Error"
+            )
+
+    def close(self):
+        self.closed = True
+
+
+mock_items = [
+    {"name": "argo.AMS-Check", "tags": ["internal"], "config": {"a": 1.5}},
+    {"name": "argo.AMSPublisher-Check", "tags": [], "config": {}},
+    {"name": "argo.POEM-API-MON", "tags": ["poem"], "config": {"b": None}}
+]
+
+
+class IterItemsTests(unittest.TestCase):
+    def setUp(self):
+        self.client = HTTPClient(timeout=30)
+        self.pages = {
+            "https://poem.example.com/api/v2/metrics": MockResponse(
+                {
+                    "count": 3,
+                    "next": "https://poem.example.com/api/v2/metrics?page=2",
+                    "previous": None,
+                    "results": mock_items[:2]
+                }, "https://poem.example.com/api/v2/metrics"
+            ),
+            "https://poem.example.com/api/v2/metrics?page=2": MockResponse(
+                {
+                    "count": 3,
+                    "next": "?page=3",
+                    "previous": "https://poem.example.com/api/v2/metrics",
+                    "results": mock_items[2:]
+                }, "https://poem.example.com/api/v2/metrics?page=2"
+            ),
+            "https://poem.example.com/api/v2/metrics?page=3": MockResponse(
+                {
+                    "count": 3,
+                    "next": None,
+                    "previous": "?page=2",
+                    "results": []
+                }, "https://poem.example.com/api/v2/metrics?page=3"
+            )
+        }
+
+    def tearDown(self):
+        self.client.close()
+
+    def get_page(self, url, **kwargs):
+        return self.pages[url]
+
+    @patch("requests.Session.get")
+    def test_list(self, mock_get):
+        mock_get.return_value = MockResponse(
+            mock_items, "https://poem.example.com/api/v2/metrics"
+        )
+        for stream in [False, True]:
+            self.assertEqual(
+                list(self.client.iter_items(
+                    "https://poem.example.com/api/v2/metrics", stream=stream
+                )), mock_items
+            )
+            self.assertEqual(
+                list(self.client.iter_items(
+                    "https://poem.example.com/api/v2/metrics", field="name",
+                    stream=stream
+                )), [item["name"] for item in mock_items]
+            )
+        self.assertTrue(mock_get.return_value.closed)
+
+    @patch("requests.Session.get")
+    def test_pagination(self, mock_get):
+        mock_get.side_effect = self.get_page
+        for stream in [False, True]:
+            self.assertEqual(
+                list(self.client.iter_items(
+                    "https://poem.example.com/api/v2/metrics",
+                    headers={"x-api-key": "t0k3n"},
+                    params={"status": ["testing"]}, stream=stream
+                )), mock_items
+            )
+            self.assertTrue(all(page.closed for page in self.pages.values()))
+
+        mock_get.assert_has_calls([
+            call(
+                "https://poem.example.com/api/v2/metrics",
+                params={"status": ["testing"]},
+                headers={"x-api-key": "t0k3n"}, stream=True, timeout=30
+            ),
+            call(
+                "https://poem.example.com/api/v2/metrics?page=2",
+                headers={"x-api-key": "t0k3n"}, stream=True, timeout=30
+            ),
+            call(
+                "https://poem.example.com/api/v2/metrics?page=3",
+                headers={"x-api-key": "t0k3n"}, stream=True, timeout=30
+            )
+        ])
+
+    @patch("requests.Session.get")
+    def test_pagination_field(self, mock_get):
+        mock_get.side_effect = self.get_page
+        self.assertEqual(
+            list(self.client.iter_items(
+                "https://poem.example.com/api/v2/metrics", field="name",
+                stream=True
+            )), [item["name"] for item in mock_items]
+        )
+
+    @patch("argo_probe_poem.utils.ijson", None)
+    @patch("requests.Session.get")
+    def test_pagination_without_ijson(self, mock_get):
+        mock_get.side_effect = self.get_page
+        self.assertEqual(
+            list(self.client.iter_items(
+                "https://poem.example.com/api/v2/metrics", stream=True
+            )), mock_items
+        )
+
+    @patch("requests.Session.get")
+    def test_lazy(self, mock_get):
+        mock_get.side_effect = self.get_page
+        items = self.client.iter_items(
+            "https://poem.example.com/api/v2/metrics", stream=True
+        )
+        self.assertEqual(next(items), mock_items[0])
+        self.assertEqual(mock_get.call_count, 1)
+        items.close()
+        self.assertTrue(
+            self.pages["https://poem.example.com/api/v2/metrics"].closed
+        )
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch("requests.Session.get")
+    def test_error_on_next_page(self, mock_get):
+        self.pages["https://poem.example.com/api/v2/metrics?page=2"] = \
+            MockResponse(
+                None, "https://poem.example.com/api/v2/metrics?page=2",
+                status_code=500
+            )
+        mock_get.side_effect = self.get_page
+        items = list()
+        with self.assertRaises(requests.exceptions.HTTPError):
+            for item in self.client.iter_items(
+                    "https://poem.example.com/api/v2/metrics"
+            ):
+                items.append(item)
+        self.assertEqual(items, mock_items[:2])
+        self.assertTrue(
+            self.pages["https://poem.example.com/api/v2/metrics"].closed
+        )
+        self.assertTrue(
+            self.pages["https://poem.example.com/api/v2/metrics?page=2"].closed
+        )
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_response_without_client(self):
+        response = MockResponse(
+            self.pages["https://poem.example.com/api/v2/metrics"].data,
+            "https://poem.example.com/api/v2/metrics"
+        )
+        self.assertEqual(list(utils.iter_items(response)), mock_items[:2])
+        self.assertTrue(response.closed)
+
+
+def address(family, host, port):
+    return family, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (host, port)
+
+
+class SplitHostPortTests(unittest.TestCase):
+    def test_split_host_port(self):
+        self.assertEqual(
+            utils.split_host_port("poem.devel.argo.grnet.gr"),
+            ("poem.devel.argo.grnet.gr", 443)
+        )
+        self.assertEqual(
+            utils.split_host_port("poem.devel.argo.grnet.gr:8443"),
+            ("poem.devel.argo.grnet.gr", 8443)
+        )
+        self.assertEqual(
+            utils.split_host_port("127.0.0.2:8443"), ("127.0.0.2", 8443)
+        )
+        self.assertEqual(utils.split_host_port("::1"), ("::1", 443))
+        self.assertEqual(utils.split_host_port("[::1]:8443"), ("::1", 8443))
+
+
+class BlackHoleSocket:
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.closed = False
+
+    def setblocking(self, flag):
+        pass
+
+    def connect_ex(self, address):
+        return errno.EINPROGRESS
+
+    def fileno(self):
+        return self.read_fd
+
+    def close(self):
+        if not self.closed:
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+            self.closed = True
+
+
+class CreateConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(5)
+        self.port = self.server.getsockname()[1]
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(("127.0.0.1", 0))
+        self.closed_port = closed.getsockname()[1]
+        closed.close()
+        self.black_holes = []
+        self.real_socket = socket.socket
+
+    def tearDown(self):
+        self.server.close()
+        for sock in self.black_holes:
+            sock.close()
+
+    def fake_socket(self, family, type_, proto):
+        if family == socket.AF_INET6:
+            sock = BlackHoleSocket()
+            self.black_holes.append(sock)
+            return sock
+
+        return self.real_socket(family, type_, proto)
+
+    def test_interleave_addresses(self):
+        addresses = [
+            address(socket.AF_INET, "192.0.2.1", 443),
+            address(socket.AF_INET, "192.0.2.2", 443),
+            address(socket.AF_INET6, "2001:db8::1", 443),
+            address(socket.AF_INET6, "2001:db8::2", 443),
+            address(socket.AF_INET, "192.0.2.3", 443)
+        ]
+        self.assertEqual(
+            [a[4][0] for a in utils.interleave_addresses(addresses)],
+            ["2001:db8::1", "192.0.2.1", "2001:db8::2", "192.0.2.2",
+             "192.0.2.3"]
+        )
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET, "127.0.0.1", self.port)
+        ]
+        sock = utils.create_connection(
+            "poem.example.com", 443, dns_timeout=1, connect_timeout=1
+        )
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+        mock_resolve.assert_called_once_with("poem.example.com", 443, 1)
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_phases(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET, "127.0.0.1", self.port)
+        ]
+        utils.enable_phases()
+        self.addCleanup(utils.enable_phases, False)
+        stats = utils.Stats()
+        with utils.collect_stats(stats):
+            sock = utils.create_connection(
+                "poem.example.com", 443, dns_timeout=1, connect_timeout=1
+            )
+        sock.close()
+        self.assertEqual(list(stats.phases.keys()), ["dns", "connect"])
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_unsupported_family(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET6, "::1", self.port),
+            address(socket.AF_INET, "127.0.0.1", self.port)
+        ]
+
+        def fake_socket(family, type_, proto):
+            if family == socket.AF_INET6:
+                raise OSError(
+                    errno.EAFNOSUPPORT, os.strerror(errno.EAFNOSUPPORT)
+                )
+
+            return self.real_socket(family, type_, proto)
+
+        with patch("socket.socket", side_effect=fake_socket):
+            sock = utils.create_connection(
+                "poem.example.com", 443, connect_timeout=1
+            )
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+
+        mock_resolve.return_value = mock_resolve.return_value[:1]
+        with patch("socket.socket", side_effect=fake_socket):
+            with self.assertRaises(OSError) as context:
+                utils.create_connection(
+                    "poem.example.com", 443, connect_timeout=1
+                )
+        self.assertEqual(context.exception.errno, errno.EAFNOSUPPORT)
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_refused_address(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET, "127.0.0.1", self.closed_port),
+            address(socket.AF_INET, "127.0.0.1", self.port)
+        ]
+        start = time.monotonic()
+        sock = utils.create_connection(
+            "poem.example.com", 443, connect_timeout=5, delay=5
+        )
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        sock.close()
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_all_refused(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET, "127.0.0.1", self.closed_port)
+        ]
+        with self.assertRaises(ConnectionRefusedError):
+            utils.create_connection("poem.example.com", 443, connect_timeout=1)
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_black_holed_address(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET6, "2001:db8::1", self.port),
+            address(socket.AF_INET, "127.0.0.1", self.port)
+        ]
+        with patch("socket.socket", side_effect=self.fake_socket):
+            start = time.monotonic()
+            sock = utils.create_connection(
+                "poem.example.com", 443, connect_timeout=5, delay=0.05
+            )
+            elapsed = time.monotonic() - start
+
+        self.assertGreaterEqual(elapsed, 0.05)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(sock.getpeername(), ("127.0.0.1", self.port))
+        self.assertTrue(self.black_holes[0].closed)
+        sock.close()
+
+    @patch("argo_probe_poem.utils.resolve")
+    def test_connect_timeout(self, mock_resolve):
+        mock_resolve.return_value = [
+            address(socket.AF_INET6, "2001:db8::1", 443),
+            address(socket.AF_INET6, "2001:db8::2", 443)
+        ]
+        with patch("socket.socket", side_effect=self.fake_socket):
+            start = time.monotonic()
+            with self.assertRaises(socket.timeout) as context:
+                utils.create_connection(
+                    "poem.example.com", 443, connect_timeout=0.2, delay=0.05
+                )
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(
+            str(context.exception),
+            "Connection to poem.example.com timed out after 0.2 seconds"
+        )
+        self.assertEqual(len(self.black_holes), 2)
+        self.assertTrue(all(sock.closed for sock in self.black_holes))
+
+    @patch("socket.getaddrinfo")
+    def test_dns_timeout(self, mock_getaddrinfo):
+        mock_getaddrinfo.side_effect = lambda *args, **kwargs: time.sleep(1)
+        start = time.monotonic()
+        with self.assertRaises(socket.timeout) as context:
+            utils.create_connection(
+                "poem.example.com", 443, dns_timeout=0.1, connect_timeout=1
+            )
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(
+            str(context.exception),
+            "DNS lookup of poem.example.com timed out after 0.1 seconds"
+        )
+
+    @patch("socket.getaddrinfo")
+    def test_dns_error(self, mock_getaddrinfo):
+        mock_getaddrinfo.side_effect = socket.gaierror(
+            -2, "Name or service not known"
+        )
+        with self.assertRaises(socket.gaierror):
+            utils.create_connection("poem.example.com", 443, dns_timeout=1)